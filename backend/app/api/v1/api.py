@@ -2,7 +2,7 @@
 Router principal de la API v1
 """
 from fastapi import APIRouter
-from app.api.v1.endpoints import auth, users, memorials, analytics, condolences, timeline, gallery
+from app.api.v1.endpoints import auth, users, memorials, analytics, condolences, timeline, gallery, live
 
 
 api_router = APIRouter()
@@ -15,3 +15,4 @@ api_router.include_router(analytics.router, prefix="/analytics", tags=["analytic
 api_router.include_router(condolences.router, prefix="/condolences", tags=["condolences"])
 api_router.include_router(timeline.router, prefix="/timeline", tags=["timeline"])
 api_router.include_router(gallery.router, prefix="/gallery", tags=["gallery"])
+api_router.include_router(live.router, prefix="/live", tags=["live"])
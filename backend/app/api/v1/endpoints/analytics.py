@@ -1,14 +1,14 @@
 """
 Endpoints de Analytics - Visitas y Reacciones
 """
-from typing import Optional
+from typing import Optional, Tuple
 from datetime import date, datetime, timedelta
 from fastapi import APIRouter, Depends, Request, Header, Query
 from sqlalchemy.orm import Session
 from app.db import get_db
 from app.models import User
-from app.schemas import DashboardAnalytics, MemorialReactions, ReactionCreate
-from app.services import AnalyticsService
+from app.schemas import DashboardAnalytics, DashboardPage, MemorialReactions, ReactionCreate
+from app.services import AnalyticsService, VisitExportService
 from app.api.deps import get_current_user
 from app.repositories import MemorialRepository, VisitRepository
 from app.core.rate_limit import limiter, RateLimits
@@ -17,6 +17,19 @@ from app.core.rate_limit import limiter, RateLimits
 router = APIRouter()
 
 
+def _period_range(period: Optional[str], start_date: Optional[date],
+                  end_date: Optional[date]) -> Tuple[Optional[date], Optional[date]]:
+    """Convertir un período predefinido (today, week, month, year) en fechas"""
+    today = date.today()
+    periods = {
+        "today": (today, today),
+        "week": (today - timedelta(days=7), today),
+        "month": (today - timedelta(days=30), today),
+        "year": (today - timedelta(days=365), today),
+    }
+    return periods.get(period, (start_date, end_date))
+
+
 @router.get("/dashboard", response_model=DashboardAnalytics)
 @limiter.limit(RateLimits.ANALYTICS)
 async def get_dashboard_analytics(
@@ -60,6 +73,45 @@ async def get_dashboard_analytics(
     )
 
 
+@router.get("/dashboard/memorials", response_model=DashboardPage)
+@limiter.limit(RateLimits.ANALYTICS)
+async def get_dashboard_page(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    sort: str = Query("visits", pattern="^(visits|activity)$",
+                      description="Orden: visits (más visitados) o activity (actividad más reciente)"),
+    fields: str = Query("totals", pattern="^(totals|daily)$",
+                        description="Campos: totals (solo totales) o daily (incluye serie diaria)"),
+    limit: int = Query(20, ge=1, le=100, description="Memoriales por página"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página anterior (next_cursor)"),
+    start_date: Optional[date] = Query(None, description="Fecha inicio (YYYY-MM-DD)"),
+    end_date: Optional[date] = Query(None, description="Fecha fin (YYYY-MM-DD)"),
+    period: Optional[str] = Query(None, description="Período: today, week, month, year, all")
+):
+    """
+    Obtener el dashboard por páginas para cargarlo de forma progresiva
+    
+    Args:
+        sort: Criterio de orden
+        fields: Totales o totales con serie diaria
+        limit: Tamaño de página
+        cursor: Cursor devuelto en next_cursor (mismo sort y filtros)
+        start_date: Filtrar desde esta fecha
+        end_date: Filtrar hasta esta fecha
+        period: Período predefinido (today, week, month, year, all)
+        
+    Returns:
+        Página de analytics y cursor de la siguiente
+    """
+    start_date, end_date = _period_range(period, start_date, end_date)
+    
+    return AnalyticsService.get_dashboard_page(
+        db, current_user.id, sort=sort, fields=fields, limit=limit, cursor=cursor,
+        start_date=start_date, end_date=end_date
+    )
+
+
 @router.get("/filtered/{slug}")
 async def get_filtered_analytics(
     slug: str,
@@ -95,7 +147,7 @@ async def get_filtered_analytics(
     )
 
 
-@router.post("/visit/{slug}")
+@router.post("/visit/{slug}", status_code=202)
 @limiter.limit(RateLimits.PUBLIC_READ)
 async def register_visit(
     slug: str,
@@ -108,6 +160,10 @@ async def register_visit(
     Registrar una visita a un memorial (endpoint público)
     Rate limit: 30 visitas por minuto por IP
     
+    La visita se acepta (202) y se inserta por lotes en segundo plano.
+    Bots y visitas repetidas del mismo visitante responden igual pero
+    no se registran (counted = false).
+    
     Args:
         slug: Slug del memorial
         request: Request para obtener IP
@@ -118,13 +174,14 @@ async def register_visit(
     # Obtener memorial por slug
     memorial = MemorialRepository.get_by_slug(db, slug)
     if not memorial:
-        return {"error": "Memorial no encontrado"}
+        from fastapi import HTTPException
+        raise HTTPException(status_code=404, detail="Memorial no encontrado")
     
     # Obtener IP del cliente
     client_ip = request.client.host if request.client else None
     
-    # Registrar visita con geolocalización asíncrona
-    await AnalyticsService.register_visit_async(
+    # Encolar visita (filtrado de bots, inserción por lotes y geolocalización en segundo plano)
+    filtered = await AnalyticsService.queue_visit(
         db, 
         memorial.id, 
         ip_address=client_ip,
@@ -132,20 +189,114 @@ async def register_visit(
         referrer=referer
     )
     
-    return {"message": "Visita registrada", "memorial_id": memorial.id}
+    return {"message": "Visita registrada", "memorial_id": memorial.id, "counted": filtered is None}
+
+
+@router.get("/export")
+@limiter.limit(RateLimits.ANALYTICS)
+async def export_account_visits(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    format: str = Query("csv", pattern="^(csv|ndjson)$", description="Formato: csv o ndjson"),
+    columns: Optional[str] = Query(None, description="Columnas separadas por comas (por defecto todas)"),
+    start_date: Optional[date] = Query(None, description="Fecha inicio (YYYY-MM-DD)"),
+    end_date: Optional[date] = Query(None, description="Fecha fin (YYYY-MM-DD)")
+):
+    """
+    Exportar las visitas de todos los memoriales del usuario
+    
+    Args:
+        format: csv o ndjson
+        columns: Columnas a incluir
+        start_date: Filtrar desde esta fecha
+        end_date: Filtrar hasta esta fecha
+        
+    Returns:
+        Archivo en streaming
+    """
+    return VisitExportService.export(
+        db, current_user, fmt=format, columns=columns,
+        start_date=start_date, end_date=end_date
+    )
+
+
+@router.get("/export/{slug}")
+@limiter.limit(RateLimits.ANALYTICS)
+async def export_memorial_visits(
+    slug: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    format: str = Query("csv", pattern="^(csv|ndjson)$", description="Formato: csv o ndjson"),
+    columns: Optional[str] = Query(None, description="Columnas separadas por comas (por defecto todas)"),
+    start_date: Optional[date] = Query(None, description="Fecha inicio (YYYY-MM-DD)"),
+    end_date: Optional[date] = Query(None, description="Fecha fin (YYYY-MM-DD)")
+):
+    """
+    Exportar las visitas de un memorial
+    
+    Args:
+        slug: Slug del memorial
+        format: csv o ndjson
+        columns: Columnas a incluir
+        start_date: Filtrar desde esta fecha
+        end_date: Filtrar hasta esta fecha
+        
+    Returns:
+        Archivo en streaming
+    """
+    return VisitExportService.export(
+        db, current_user, slug=slug, fmt=format, columns=columns,
+        start_date=start_date, end_date=end_date
+    )
+
+
+@router.get("/locations")
+async def get_account_location_stats(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    start_date: Optional[date] = Query(None, description="Fecha inicio (YYYY-MM-DD)"),
+    end_date: Optional[date] = Query(None, description="Fecha fin (YYYY-MM-DD)"),
+    period: Optional[str] = Query(None, description="Período: today, week, month, year, all")
+):
+    """
+    Obtener países y ciudades con más visitas de todos los memoriales del usuario
+    
+    Args:
+        start_date: Filtrar desde esta fecha
+        end_date: Filtrar hasta esta fecha
+        period: Período predefinido (today, week, month, year, all)
+        
+    Returns:
+        Top de países y de ciudades
+    """
+    start_date, end_date = _period_range(period, start_date, end_date)
+    memorial_ids = [m.id for m in MemorialRepository.get_by_user(db, current_user.id)]
+    
+    return {
+        "countries": VisitRepository.get_country_stats(db, memorial_ids, start_date, end_date),
+        "locations": VisitRepository.get_city_stats(db, memorial_ids, start_date, end_date),
+    }
 
 
 @router.get("/locations/{slug}")
 async def get_location_stats(
     slug: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    start_date: Optional[date] = Query(None, description="Fecha inicio (YYYY-MM-DD)"),
+    end_date: Optional[date] = Query(None, description="Fecha fin (YYYY-MM-DD)"),
+    period: Optional[str] = Query(None, description="Período: today, week, month, year, all")
 ):
     """
     Obtener estadísticas de ubicación de visitantes
     
     Args:
         slug: Slug del memorial
+        start_date: Filtrar desde esta fecha
+        end_date: Filtrar hasta esta fecha
+        period: Período predefinido (today, week, month, year, all)
         
     Returns:
         Estadísticas de ubicación
@@ -163,7 +314,8 @@ async def get_location_stats(
             detail="No tienes permiso para ver estas estadísticas"
         )
     
-    locations = VisitRepository.get_location_stats(db, memorial.id)
+    start_date, end_date = _period_range(period, start_date, end_date)
+    locations = VisitRepository.get_location_stats(db, memorial.id, start_date, end_date)
     return {"memorial_id": memorial.id, "locations": locations}
 
 
@@ -221,20 +373,10 @@ async def toggle_reaction(
     if reaction_data.reaction_type not in valid_types:
         return {"error": "Tipo de reacción no válido"}
     
-    result = AnalyticsService.toggle_reaction(
+    # El toggle devuelve los conteos actualizados y las reacciones del visitante
+    return AnalyticsService.toggle_reaction(
         db, 
         memorial.id, 
         reaction_data.reaction_type, 
         reaction_data.visitor_id
     )
-    
-    # Obtener conteos actualizados
-    reactions = AnalyticsService.get_memorial_reactions(
-        db, memorial.id, reaction_data.visitor_id
-    )
-    
-    return {
-        **result,
-        "counts": reactions.counts,
-        "user_reactions": reactions.user_reactions
-    }
@@ -25,8 +25,9 @@ router = APIRouter()
 async def get_condolences(
     request: Request,
     slug: str,
-    limit: int = Query(default=50, le=100),
+    limit: int = Query(default=50, ge=1, le=100),
     offset: int = Query(default=0, ge=0),
+    cursor: Optional[str] = Query(default=None, description="next_cursor de la página anterior"),
     db: Session = Depends(get_db)
 ):
     """
@@ -36,13 +37,14 @@ async def get_condolences(
     Args:
         slug: Slug del memorial
         limit: Límite de resultados
-        offset: Desplazamiento
+        offset: Desplazamiento (obsoleto: usar cursor)
+        cursor: Cursor de la página siguiente
         
     Returns:
-        Lista de condolencias aprobadas
+        Lista de condolencias aprobadas y cursor de la página siguiente
     """
     return CondolenceService.get_condolences(
-        db, slug, approved_only=True, limit=limit, offset=offset
+        db, slug, approved_only=True, limit=limit, offset=offset, cursor=cursor
     )
 
 
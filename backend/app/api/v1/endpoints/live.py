@@ -0,0 +1,39 @@
+"""
+Endpoints de eventos en vivo - Reacciones y condolencias por Server-Sent Events
+"""
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.orm import Session
+from app.db import get_db
+from app.services import LiveService
+from app.core.rate_limit import limiter, RateLimits
+
+
+router = APIRouter()
+
+
+@router.get("/{slug}")
+@limiter.limit(RateLimits.PUBLIC_READ)
+async def live_events(
+    request: Request,
+    slug: str,
+    db: Session = Depends(get_db)
+):
+    """
+    Flujo de eventos de un memorial (público, text/event-stream)
+    Rate limit: 30 conexiones por minuto
+    
+    Eventos:
+        snapshot: conteos de reacciones al conectar
+        reaction: tipo, delta (+1/-1) y conteos tras cada toggle
+        condolence: condolencia recién aprobada
+    
+    Sustituye al sondeo de /analytics/reactions/{slug} y /condolences/{slug}
+    desde las páginas públicas (EventSource reconecta solo).
+    
+    Args:
+        slug: Slug del memorial
+    
+    Returns:
+        Respuesta en streaming con los eventos del memorial
+    """
+    return LiveService.open_stream(db, slug)
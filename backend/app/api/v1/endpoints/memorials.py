@@ -1,13 +1,15 @@
 """
 Endpoints de memoriales
 """
-from typing import List
-from fastapi import APIRouter, Depends, File, UploadFile
+from typing import List, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, File, Header, Query, UploadFile
 from sqlalchemy.orm import Session
 from app.db import get_db
 from app.models import User
-from app.schemas import MemorialCreate, MemorialUpdate, MemorialResponse, PublicMemorial
-from app.services import MemorialService, QRService
+from app.schemas import (
+    MemorialCreate, MemorialUpdate, MemorialResponse, PublicMemorial, QRExportRequest
+)
+from app.services import MemorialService, QRService, QRExportService
 from app.api.deps import get_current_user
 
 
@@ -17,21 +19,25 @@ router = APIRouter()
 @router.post("/", response_model=MemorialResponse, status_code=201)
 async def create_memorial(
     memorial: MemorialCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Crear nuevo memorial
     
+    Los códigos QR estándar se pre-generan en segundo plano.
+    
     Args:
         memorial: Datos del memorial
+        background_tasks: Tareas en segundo plano
         db: Sesión de base de datos
         current_user: Usuario autenticado
         
     Returns:
         Memorial creado
     """
-    return MemorialService.create_memorial(db, memorial, current_user.id)
+    return MemorialService.create_memorial(db, memorial, current_user.id, background_tasks)
 
 
 @router.get("/", response_model=List[MemorialResponse])
@@ -74,6 +80,8 @@ async def get_public_memorial(
 async def get_qr_code(
     slug: str,
     with_photo: bool = False,
+    fmt: str = Query("png", alias="format", pattern="^(png|webp|svg)$"),
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -83,6 +91,8 @@ async def get_qr_code(
     Args:
         slug: Slug del memorial
         with_photo: Si incluir la foto del fallecido en el QR
+        fmt: Formato de salida (png, webp o svg vectorial)
+        if_none_match: ETag que ya tiene el cliente (responde 304 si coincide)
         current_user: Usuario autenticado
         
     Returns:
@@ -94,12 +104,17 @@ async def get_qr_code(
     memorial = MemorialRepository.get_by_slug(db, slug)
     image_filename = memorial.image_filename if memorial else None
     
-    return QRService.generate_qr(slug, with_photo=with_photo, image_filename=image_filename)
+    return await QRService.generate_qr(
+        slug, with_photo=with_photo, image_filename=image_filename,
+        if_none_match=if_none_match, fmt=fmt
+    )
 
 
 @router.get("/{slug}/qr-simple")
 async def get_qr_code_simple(
     slug: str,
+    fmt: str = Query("png", alias="format", pattern="^(png|webp|svg)$"),
+    if_none_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -107,17 +122,40 @@ async def get_qr_code_simple(
     
     Args:
         slug: Slug del memorial
+        fmt: Formato de salida (png, webp o svg vectorial)
+        if_none_match: ETag que ya tiene el cliente (responde 304 si coincide)
         current_user: Usuario autenticado
         
     Returns:
         Imagen QR simple
     """
-    return QRService.generate_qr_simple(slug)
+    return await QRService.generate_qr_simple(slug, if_none_match=if_none_match, fmt=fmt)
+
+
+@router.post("/qr/export")
+async def export_qr_codes(
+    export_request: QRExportRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Exportar los QR de varios memoriales en un solo archivo
+    
+    Args:
+        export_request: Slugs a exportar (o todos), formato (zip/pdf) y códigos por hoja
+        db: Sesión de base de datos
+        current_user: Usuario autenticado
+        
+    Returns:
+        ZIP de PNGs o PDF imprimible en streaming
+    """
+    return QRExportService.export(db, current_user, export_request)
 
 
 @router.post("/{memorial_id}/upload-photo", response_model=MemorialResponse)
 async def upload_photo(
     memorial_id: int,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -125,8 +163,11 @@ async def upload_photo(
     """
     Subir foto a un memorial
     
+    Los códigos QR con la nueva foto se pre-generan en segundo plano.
+    
     Args:
         memorial_id: ID del memorial
+        background_tasks: Tareas en segundo plano
         file: Archivo de imagen
         db: Sesión de base de datos
         current_user: Usuario autenticado
@@ -134,7 +175,7 @@ async def upload_photo(
     Returns:
         Memorial actualizado
     """
-    return await MemorialService.upload_photo(db, memorial_id, file, current_user)
+    return await MemorialService.upload_photo(db, memorial_id, file, current_user, background_tasks)
 
 
 @router.get("/{memorial_id}", response_model=MemorialResponse)
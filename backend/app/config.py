@@ -32,6 +32,62 @@ class Settings:
     UPLOAD_DIR: str = "uploaded_images"
     MAX_UPLOAD_SIZE: int = 5 * 1024 * 1024  # 5MB
     
+    # QR
+    QR_CACHE_MAX_ENTRIES: int = int(os.getenv("QR_CACHE_MAX_ENTRIES", "256"))
+    QR_PREGENERATE: bool = os.getenv("QR_PREGENERATE", "true").lower() == "true"
+    QR_ARTIFACT_FORMATS: str = os.getenv("QR_ARTIFACT_FORMATS", "png,svg")
+    
+    # Render (pool de procesos para QR / Pillow). 0 = automático
+    RENDER_WORKERS: int = int(os.getenv("RENDER_WORKERS", "0"))
+    RENDER_MAX_PENDING: int = int(os.getenv("RENDER_MAX_PENDING", "0"))
+    RENDER_TIMEOUT: float = float(os.getenv("RENDER_TIMEOUT", "10"))
+    
+    # Geolocalización de visitas (enriquecimiento en segundo plano)
+    GEO_LOCAL_DB: str = os.getenv("GEO_LOCAL_DB", "")  # .bin compilado o .csv de rangos IP
+    GEO_TIMEOUT: float = float(os.getenv("GEO_TIMEOUT", "5"))
+    GEO_BREAKER_FAILURES: int = int(os.getenv("GEO_BREAKER_FAILURES", "3"))
+    GEO_BREAKER_RESET: float = float(os.getenv("GEO_BREAKER_RESET", "60"))
+    GEO_CACHE_MAX_ENTRIES: int = int(os.getenv("GEO_CACHE_MAX_ENTRIES", "10000"))
+    GEO_CACHE_TTL: float = float(os.getenv("GEO_CACHE_TTL", "86400"))
+    GEO_WORKERS: int = int(os.getenv("GEO_WORKERS", "2"))
+    GEO_QUEUE_SIZE: int = int(os.getenv("GEO_QUEUE_SIZE", "1000"))
+    
+    # Ingesta de visitas por lotes
+    VISIT_BATCH_SIZE: int = int(os.getenv("VISIT_BATCH_SIZE", "200"))
+    VISIT_FLUSH_INTERVAL_MS: int = int(os.getenv("VISIT_FLUSH_INTERVAL_MS", "250"))
+    VISIT_BUFFER_MAX: int = int(os.getenv("VISIT_BUFFER_MAX", "10000"))
+    VISIT_FLUSH_RETRIES: int = int(os.getenv("VISIT_FLUSH_RETRIES", "5"))
+    
+    # Filtro de visitas: descartar bots y repeticiones del mismo visitante en la ventana (segundos, 0 = no)
+    VISIT_FILTER_BOTS: bool = os.getenv("VISIT_FILTER_BOTS", "true").lower() == "true"
+    VISIT_DEDUP_WINDOW: float = float(os.getenv("VISIT_DEDUP_WINDOW", "300"))
+    VISIT_DEDUP_MAX_ENTRIES: int = int(os.getenv("VISIT_DEDUP_MAX_ENTRIES", "100000"))
+    
+    # Agregados diarios de visitas: segundos entre compactaciones (0 = desactivado) y días recalculados
+    ROLLUP_COMPACT_INTERVAL: float = float(os.getenv("ROLLUP_COMPACT_INTERVAL", "300"))
+    ROLLUP_COMPACT_DAYS: int = int(os.getenv("ROLLUP_COMPACT_DAYS", "2"))
+    
+    # Contadores hoy/7d/30d: vacío = en el proceso, redis://... = compartidos entre workers
+    VISIT_COUNTERS_URL: str = os.getenv("VISIT_COUNTERS_URL", "")
+    VISIT_COUNTERS_TTL: float = float(os.getenv("VISIT_COUNTERS_TTL", "300"))
+    VISIT_COUNTERS_MAX_MEMORIALS: int = int(os.getenv("VISIT_COUNTERS_MAX_MEMORIALS", "10000"))
+    
+    # Contadores de reacciones: escritura agrupada (ms), reconciliación (s, 0 = no) y caché de lectura (s)
+    REACTION_FLUSH_INTERVAL_MS: int = int(os.getenv("REACTION_FLUSH_INTERVAL_MS", "1000"))
+    REACTION_RECONCILE_INTERVAL: float = float(os.getenv("REACTION_RECONCILE_INTERVAL", "600"))
+    REACTION_CACHE_TTL: float = float(os.getenv("REACTION_CACHE_TTL", "5"))
+    REACTION_CACHE_MAX_MEMORIALS: int = int(os.getenv("REACTION_CACHE_MAX_MEMORIALS", "10000"))
+    # Máscaras de reacciones por (memorial, visitante) en memoria: segundos de vida y entradas máximas
+    REACTION_MASK_CACHE_TTL: float = float(os.getenv("REACTION_MASK_CACHE_TTL", "60"))
+    REACTION_MASK_CACHE_SIZE: int = int(os.getenv("REACTION_MASK_CACHE_SIZE", "50000"))
+    
+    # Eventos en vivo (SSE): vacío = difusión en el proceso, redis://... = entre workers
+    PUBSUB_URL: str = os.getenv("PUBSUB_URL", "")
+    LIVE_QUEUE_SIZE: int = int(os.getenv("LIVE_QUEUE_SIZE", "100"))
+    LIVE_MAX_SUBSCRIBERS: int = int(os.getenv("LIVE_MAX_SUBSCRIBERS", "10000"))
+    LIVE_HEARTBEAT: float = float(os.getenv("LIVE_HEARTBEAT", "15"))
+    LIVE_STREAM_TTL: float = float(os.getenv("LIVE_STREAM_TTL", "300"))
+    
     # URLs
     BACKEND_URL: str = os.getenv("BACKEND_URL", "http://localhost:8000")
     FRONTEND_URL: str = os.getenv("FRONTEND_URL", "http://localhost:5173")
@@ -0,0 +1,78 @@
+"""
+Event loop en segundo plano - Permite ejecutar corrutinas desde código síncrono
+Un único hilo con su loop vive toda la aplicación y se reutiliza en cada llamada
+"""
+import asyncio
+import threading
+from typing import Any, Coroutine, Optional
+
+
+class BackgroundLoop:
+    """
+    Hilo daemon con un event loop persistente
+    
+    Evita crear un hilo y un loop nuevos por cada llamada síncrona; los
+    recursos ligados al loop (p. ej. clientes HTTP) se reutilizan.
+    """
+    
+    def __init__(self, name: str = "background-loop"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+    
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """Arrancar el hilo de forma perezosa (solo cuando se necesita)"""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+                
+                def run() -> None:
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+                
+                self._thread = threading.Thread(target=run, name=self.name, daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+    
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """
+        Ejecutar una corrutina en el loop de fondo y esperar su resultado
+        
+        No debe llamarse desde el propio loop de fondo (se bloquearía).
+        
+        Raises:
+            TimeoutError: Si no termina en el tiempo indicado
+        """
+        loop = self._get_loop()
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+    
+    def stop(self, cleanup: Optional[Coroutine] = None) -> None:
+        """Detener el loop (al apagar la aplicación), con una limpieza opcional"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            if cleanup is not None:
+                cleanup.close()
+            return
+        if cleanup is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(cleanup, loop).result(5)
+            except Exception as e:
+                print(f"Error al limpiar el loop de fondo: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+
+background_loop = BackgroundLoop()
@@ -0,0 +1,76 @@
+"""
+Cachés en memoria reutilizables
+"""
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Caché LRU acotada y thread-safe
+    
+    Al superar max_entries se descarta la entrada usada hace más tiempo.
+    Con ttl (segundos), las entradas además caducan tras ese tiempo.
+    """
+    
+    def __init__(self, max_entries: int = 256, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # clave -> (valor, instante de caducidad o None)
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Obtener un valor y marcarlo como usado recientemente"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key: Hashable, value: Any) -> None:
+        """Guardar un valor, descartando el más antiguo si no hay espacio"""
+        if self.max_entries <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+    
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Eliminar una entrada"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return default if entry is None else entry[0]
+    
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Eliminar todas las entradas cuya clave cumpla el predicado"""
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+    
+    def clear(self) -> None:
+        """Vaciar la caché"""
+        with self._lock:
+            self._data.clear()
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
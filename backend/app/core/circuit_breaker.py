@@ -0,0 +1,83 @@
+"""
+Circuit breaker - Deja de llamar a un servicio externo mientras está fallando
+"""
+import time
+import threading
+from typing import Dict, Optional, Union
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker con estados cerrado, abierto y semiabierto
+    
+    Tras failure_threshold fallos consecutivos (o un trip explícito, p. ej.
+    un 429) el circuito se abre y las llamadas se rechazan sin intentarlas.
+    Pasado reset_timeout se permite una única llamada de prueba: si sale
+    bien se cierra, si falla vuelve a abrirse.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 60.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._open_for = reset_timeout
+        self._probing = False
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+    
+    def allow(self) -> bool:
+        """Indicar si se puede intentar una llamada ahora"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self._open_for:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probing = False
+            # Semiabierto: solo una llamada de prueba a la vez
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+    
+    def record_success(self) -> None:
+        """Registrar una llamada correcta (cierra el circuito)"""
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+    
+    def record_failure(self) -> None:
+        """Registrar un fallo; abre el circuito al llegar al umbral"""
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._open(self.reset_timeout)
+    
+    def trip(self, duration: Optional[float] = None) -> None:
+        """Abrir el circuito de inmediato (p. ej. ante un 429)"""
+        with self._lock:
+            self._failures += 1
+            self._open(duration if duration is not None else self.reset_timeout)
+    
+    def _open(self, duration: float) -> None:
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._open_for = duration
+        self._probing = False
+    
+    def stats(self) -> Dict[str, Union[str, int]]:
+        """Estado actual del circuito"""
+        with self._lock:
+            return {"state": self._state, "consecutive_failures": self._failures}
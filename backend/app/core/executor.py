@@ -0,0 +1,124 @@
+"""
+Ejecutor de renderizado - Saca el trabajo CPU intensivo (QR, Pillow) del event loop
+"""
+import os
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+from fastapi import HTTPException, status
+from app.config import settings
+
+
+class RenderExecutor:
+    """
+    Pool de procesos para renders con backpressure, métricas y timeout
+    
+    Las funciones enviadas deben ser importables desde el proceso hijo
+    (funciones de módulo o métodos estáticos), igual que sus argumentos.
+    """
+    
+    def __init__(self, max_workers: int = 0, max_pending: int = 0, timeout: float = 10.0):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 8
+        self.timeout = timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "timed_out": 0,
+        }
+    
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Crear el pool de forma perezosa (solo cuando se necesita)"""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+    
+    def _reset_pool(self) -> None:
+        """Descartar un pool roto para que el siguiente envío cree uno nuevo"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+    
+    async def run(self, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        """
+        Ejecutar una función en el pool sin bloquear el event loop
+        
+        Raises:
+            HTTPException: 503 si la cola está llena, 504 si se agota el tiempo
+        """
+        with self._lock:
+            if self._in_flight >= self.max_pending:
+                self._stats["rejected"] += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Servidor ocupado generando imágenes, intenta de nuevo",
+                    headers={"Retry-After": "5"}
+                )
+            self._in_flight += 1
+            self._stats["submitted"] += 1
+        
+        try:
+            future = self._get_pool().submit(fn, *args, **kwargs)
+            try:
+                result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+            except asyncio.TimeoutError:
+                future.cancel()
+                self._count("timed_out")
+                raise HTTPException(
+                    status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                    detail="La generación de la imagen tardó demasiado"
+                )
+            except BrokenProcessPool:
+                self._reset_pool()
+                self._count("failed")
+                raise
+            except Exception:
+                self._count("failed")
+                raise
+            self._count("completed")
+            return result
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+    
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+    
+    def stats(self) -> Dict[str, int]:
+        """Métricas del ejecutor (profundidad de cola y contadores)"""
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "in_flight": self._in_flight,
+                "queue_depth": max(0, self._in_flight - self.max_workers),
+                **self._stats,
+            }
+    
+    def shutdown(self) -> None:
+        """Detener el pool (al apagar la aplicación)"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+
+render_executor = RenderExecutor(
+    max_workers=settings.RENDER_WORKERS,
+    max_pending=settings.RENDER_MAX_PENDING,
+    timeout=settings.RENDER_TIMEOUT
+)
@@ -0,0 +1,38 @@
+"""
+Cursores opacos para paginación por keyset
+"""
+import json
+import base64
+import binascii
+from typing import Any, Dict
+
+
+def encode_cursor(payload: Dict[str, Any]) -> str:
+    """
+    Codificar la posición de la última fila entregada
+    
+    Args:
+        payload: Valores de ordenación de la última fila (serializables a JSON)
+    
+    Returns:
+        Cursor base64 url-safe sin relleno
+    """
+    raw = json.dumps(payload, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """
+    Decodificar un cursor generado por encode_cursor
+    
+    Raises:
+        ValueError: Si el cursor está mal formado
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Cursor no válido")
+    if not isinstance(payload, dict):
+        raise ValueError("Cursor no válido")
+    return payload
@@ -0,0 +1,254 @@
+"""
+Publicación/suscripción por canal - Difusión de eventos a conexiones abiertas
+Broker en el proceso con backend intercambiable para repartir entre workers
+"""
+import json
+import asyncio
+from typing import Any, Callable, Dict, Optional, Set
+from app.config import settings
+
+
+def sse_frame(event: str, data: Any) -> str:
+    """
+    Formatear un evento Server-Sent Events
+    
+    Args:
+        event: Nombre del evento
+        data: Datos serializables a JSON
+    
+    Returns:
+        Trama lista para escribir en la respuesta
+    """
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'), default=str)}\n\n"
+
+
+class Subscription:
+    """
+    Cola acotada de mensajes de un suscriptor
+    
+    Si el cliente lee más despacio de lo que se publica, se descarta el
+    mensaje más antiguo: un suscriptor lento no frena a los demás.
+    """
+    
+    def __init__(self, channel: str, max_queue: int = 100):
+        self.channel = channel
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_queue))
+        self.dropped = 0
+        self.closed = False
+    
+    def put(self, message: Optional[str]) -> bool:
+        """Encolar un mensaje (None despierta al lector al cerrar)"""
+        dropped = False
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            dropped = True
+        self.queue.put_nowait(message)
+        return dropped
+    
+    async def get(self, timeout: float) -> Optional[str]:
+        """
+        Esperar el siguiente mensaje
+        
+        Returns:
+            Mensaje, o None si vence el timeout o se cierra la suscripción
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+    
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self.put(None)
+
+
+class LocalPubSubBackend:
+    """Entrega en el propio proceso (un solo worker)"""
+    
+    remote = False
+    
+    def publish(self, channel: str, message: str, deliver: Callable[[str, str], None]) -> None:
+        deliver(channel, message)
+
+
+class RedisPubSubBackend:
+    """
+    Difusión entre workers con Redis PUBLISH/PSUBSCRIBE (requiere el paquete redis)
+    
+    Cada mensaje se publica una vez en Redis; cada worker lo recibe por su
+    suscripción al patrón y lo entrega a sus conexiones locales.
+    """
+    
+    remote = True
+    
+    def __init__(self, url: str, prefix: str = "live"):
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError:
+            raise RuntimeError("PUBSUB_URL requiere el paquete 'redis' (pip install redis)")
+        self._client = redis.Redis.from_url(url)
+        self._async_client = redis.asyncio.Redis.from_url(url)
+        self.prefix = prefix
+    
+    def publish(self, channel: str, message: str, deliver: Callable[[str, str], None]) -> None:
+        self._client.publish(f"{self.prefix}:{channel}", message)
+    
+    async def listen(self, deliver: Callable[[str, str], None]) -> None:
+        """Recibir los mensajes de todos los workers y entregarlos localmente"""
+        pubsub = self._async_client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.psubscribe(f"{self.prefix}:*")
+        try:
+            async for item in pubsub.listen():
+                if item["type"] != "pmessage":
+                    continue
+                channel = item["channel"].decode()[len(self.prefix) + 1:]
+                deliver(channel, item["data"].decode())
+        finally:
+            await pubsub.reset()
+
+
+def create_pubsub_backend(url: str = ""):
+    """
+    Crear el backend de difusión según la configuración
+    
+    Args:
+        url: Vacío para entregar solo en el proceso, redis://... para repartir entre workers
+    """
+    if not url:
+        return LocalPubSubBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisPubSubBackend(url)
+    raise ValueError(f"Backend de pub/sub no soportado: {url}")
+
+
+class PubSubBroker:
+    """
+    Canales con suscriptores en memoria
+    
+    Un mensaje publicado se serializa una sola vez y se reparte a todas las
+    colas del canal. publish se puede llamar desde cualquier hilo: la
+    entrega siempre ocurre en el loop de la aplicación.
+    """
+    
+    def __init__(self, backend=None, max_queue: int = 100, max_subscribers: int = 10000):
+        self.backend = backend or LocalPubSubBackend()
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self._channels: Dict[str, Set[Subscription]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._subscribers = 0
+        self._stats = {"published": 0, "delivered": 0, "dropped": 0, "rejected": 0, "errors": 0}
+    
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+    
+    @property
+    def full(self) -> bool:
+        return self._subscribers >= self.max_subscribers
+    
+    def start(self) -> None:
+        """Fijar el loop de entrega y, con backend remoto, escuchar a los demás workers"""
+        self._loop = asyncio.get_running_loop()
+        if self.backend.remote and self._task is None:
+            self._task = asyncio.create_task(self._listen())
+    
+    async def stop(self) -> None:
+        """Cerrar todas las suscripciones y dejar de escuchar"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for subscriptions in list(self._channels.values()):
+            for subscription in list(subscriptions):
+                subscription.close()
+        self._loop = None
+    
+    async def _listen(self) -> None:
+        while True:
+            try:
+                await self.backend.listen(self._deliver)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats["errors"] += 1
+                print(f"Error en la suscripción de pub/sub: {e}")
+                await asyncio.sleep(1)
+    
+    def subscribe(self, channel: str) -> Subscription:
+        """
+        Abrir una suscripción a un canal (desde el loop de la aplicación)
+        
+        Returns:
+            Suscripción con su cola de mensajes
+        """
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(channel, self.max_queue)
+        self._channels.setdefault(channel, set()).add(subscription)
+        self._subscribers += 1
+        return subscription
+    
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._channels.get(subscription.channel)
+        if subscriptions is None or subscription not in subscriptions:
+            return
+        subscriptions.discard(subscription)
+        self._subscribers -= 1
+        if not subscriptions:
+            del self._channels[subscription.channel]
+    
+    def reject(self) -> None:
+        """Contabilizar una conexión rechazada por el límite de suscriptores"""
+        self._stats["rejected"] += 1
+    
+    def publish(self, channel: str, message: str) -> None:
+        """
+        Publicar un mensaje en un canal
+        
+        Un fallo del backend no debe impedir la escritura que lo origina,
+        así que se registra y se ignora.
+        """
+        self._stats["published"] += 1
+        try:
+            self.backend.publish(channel, message, self._deliver_threadsafe)
+        except Exception as e:
+            self._stats["errors"] += 1
+            print(f"Error al publicar en el canal {channel}: {e}")
+    
+    def _deliver_threadsafe(self, channel: str, message: str) -> None:
+        loop = self._loop
+        if loop is None or channel not in self._channels:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._deliver(channel, message)
+            return
+        try:
+            loop.call_soon_threadsafe(self._deliver, channel, message)
+        except RuntimeError:
+            # Loop ya cerrado (apagado en curso)
+            pass
+    
+    def _deliver(self, channel: str, message: str) -> None:
+        for subscription in list(self._channels.get(channel, ())):
+            if subscription.put(message):
+                self._stats["dropped"] += 1
+            self._stats["delivered"] += 1
+    
+    def stats(self) -> Dict[str, int]:
+        """Métricas del broker"""
+        return {"channels": len(self._channels), "subscribers": self._subscribers, **self._stats}
+
+
+live_broker = PubSubBroker(
+    backend=create_pubsub_backend(settings.PUBSUB_URL),
+    max_queue=settings.LIVE_QUEUE_SIZE,
+    max_subscribers=settings.LIVE_MAX_SUBSCRIBERS
+)
@@ -0,0 +1,127 @@
+"""
+Caché de renders de códigos QR
+Nivel en memoria (LRU) respaldado por un nivel en disco bajo UPLOAD_DIR
+"""
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+from dataclasses import dataclass
+from typing import Optional
+from app.config import settings
+from app.core.cache import LRUCache
+
+
+# Solo slugs generados por la aplicación pueden usarse como nombre de directorio
+_SAFE_SLUG = re.compile(r"^[a-z0-9][a-z0-9-]*$")
+
+
+@dataclass(frozen=True)
+class CachedRender:
+    """Render almacenado en caché"""
+    content: bytes
+    etag: str
+
+
+class QRRenderCache:
+    """
+    Caché de renders QR direccionada por contenido
+    
+    La clave se deriva de todos los parámetros que afectan al render
+    (slug, foto, estilo de marco, URL de destino y formato), de modo que
+    un cambio en cualquiera de ellos produce una entrada nueva.
+    """
+    
+    def __init__(self, directory: str, max_entries: int = 256):
+        self.directory = directory
+        self._memory = LRUCache(max_entries)
+    
+    @staticmethod
+    def make_key(slug: str, with_photo: bool, image_filename: Optional[str],
+                 frame_style: str, target_url: str, fmt: str = "png") -> str:
+        """Construir la clave de caché para un render"""
+        parts = [
+            slug,
+            "1" if with_photo else "0",
+            image_filename or "",
+            frame_style,
+            target_url,
+            fmt,
+        ]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def make_etag(content: bytes) -> str:
+        """ETag fuerte a partir del contenido"""
+        return f'"{hashlib.sha256(content).hexdigest()}"'
+    
+    def get(self, slug: str, key: str, fmt: str = "png") -> Optional[CachedRender]:
+        """Buscar un render en memoria y, si no está, en disco"""
+        cached = self._memory.get((slug, key))
+        if cached is not None:
+            return cached
+        
+        path = self.path(slug, key, fmt)
+        if path is None or not os.path.exists(path):
+            return None
+        
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+        except OSError:
+            return None
+        
+        cached = CachedRender(content=content, etag=self.make_etag(content))
+        self._memory.set((slug, key), cached)
+        return cached
+    
+    def set(self, slug: str, key: str, content: bytes, fmt: str = "png") -> CachedRender:
+        """Guardar un render en ambos niveles"""
+        cached = CachedRender(content=content, etag=self.make_etag(content))
+        self._memory.set((slug, key), cached)
+        
+        path = self.path(slug, key, fmt)
+        if path is not None:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Escritura atómica para no servir archivos a medio escribir
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Error al guardar QR en caché de disco: {e}")
+        
+        return cached
+    
+    def invalidate(self, slug: str) -> None:
+        """Eliminar todos los renders de un memorial"""
+        self._memory.discard_where(lambda k: k[0] == slug)
+        
+        slug_dir = self.slug_dir(slug)
+        if slug_dir is not None and os.path.isdir(slug_dir):
+            shutil.rmtree(slug_dir, ignore_errors=True)
+    
+    def clear(self) -> None:
+        """Vaciar el nivel en memoria"""
+        self._memory.clear()
+    
+    def slug_dir(self, slug: str) -> Optional[str]:
+        """Directorio de renders de un memorial (None si el slug no es seguro)"""
+        if not _SAFE_SLUG.match(slug or ""):
+            return None
+        return os.path.join(self.directory, slug)
+    
+    def path(self, slug: str, key: str, fmt: str) -> Optional[str]:
+        """Ruta del render en el nivel en disco (None si el slug no es seguro)"""
+        slug_dir = self.slug_dir(slug)
+        if slug_dir is None:
+            return None
+        return os.path.join(slug_dir, f"{key}.{fmt}")
+
+
+qr_render_cache = QRRenderCache(
+    os.path.join(settings.UPLOAD_DIR, "qr"),
+    max_entries=settings.QR_CACHE_MAX_ENTRIES
+)
@@ -0,0 +1,29 @@
+"""
+Filtros reutilizables para consultas
+"""
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional
+
+
+def date_range(column, start_date: Optional[date] = None, end_date: Optional[date] = None) -> List:
+    """
+    Rango semiabierto de días sobre una columna de fecha y hora
+    
+    Se compara la columna directamente ([inicio 00:00, fin + 1 día 00:00))
+    en lugar de convertirla a fecha, de modo que la consulta puede usar
+    los índices sobre la columna.
+    
+    Args:
+        column: Columna timestamp (p. ej. Visit.visited_at)
+        start_date: Primer día incluido (opcional)
+        end_date: Último día incluido (opcional)
+    
+    Returns:
+        Condiciones para pasar a Query.filter(*condiciones)
+    """
+    clauses = []
+    if start_date:
+        clauses.append(column >= datetime.combine(start_date, time.min))
+    if end_date:
+        clauses.append(column < datetime.combine(end_date + timedelta(days=1), time.min))
+    return clauses
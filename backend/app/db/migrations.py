@@ -0,0 +1,234 @@
+"""
+Migraciones de esquema que create_all no cubre
+Índices compuestos, cambios sobre tablas existentes y rellenos iniciales; todas son idempotentes
+"""
+from typing import Callable, List, Tuple, Union
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.types import TypeEngine, DateTime, LargeBinary
+
+
+def add_column(table: str, column: str, type_: TypeEngine) -> Callable[[Connection], None]:
+    """
+    Migración que añade una columna nullable si la tabla aún no la tiene
+    
+    SQLite no soporta ADD COLUMN IF NOT EXISTS, así que se comprueba antes.
+    """
+    def migrate(connection: Connection) -> None:
+        existing = {c["name"] for c in inspect(connection).get_columns(table)}
+        if column not in existing:
+            ddl = type_.compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return migrate
+
+
+def backfill_visitor_reactions(connection: Connection) -> None:
+    """
+    Máscaras iniciales de visitor_reactions a partir de reactions (solo si está vacía)
+    
+    La clave binaria del visitante se calcula en Python, así que las
+    reacciones se leen en streaming y se insertan por bloques.
+    """
+    from app.repositories.reaction import ReactionRepository
+    
+    if connection.execute(text("SELECT 1 FROM visitor_reactions LIMIT 1")).first():
+        return
+    # Antes de reactions_visitor_key la tabla guarda el visitor_id en texto
+    legacy = "visitor_id" in {c["name"] for c in inspect(connection).get_columns("reactions")}
+    visitor = "visitor_id" if legacy else "visitor_key"
+    rows = connection.execution_options(stream_results=True, yield_per=10000).execute(text(
+        f"SELECT memorial_id, {visitor}, reaction_type FROM reactions "
+        f"WHERE memorial_id IS NOT NULL AND {visitor} IS NOT NULL"
+    ))
+    masks = {}
+    for memorial_id, visitor, reaction_type in rows:
+        bit = ReactionRepository.REACTION_BITS.get(reaction_type)
+        if bit:
+            key = (memorial_id, ReactionRepository.visitor_key(visitor) if legacy else bytes(visitor))
+            masks[key] = masks.get(key, 0) | bit
+    
+    insert = text("INSERT INTO visitor_reactions (memorial_id, visitor_key, mask) VALUES (:memorial_id, :visitor_key, :mask)")
+    items = [{"memorial_id": m, "visitor_key": k, "mask": mask} for (m, k), mask in masks.items()]
+    for offset in range(0, len(items), 10000):
+        connection.execute(insert, items[offset:offset + 10000])
+
+
+def backfill_visit_rollups(connection: Connection) -> None:
+    """
+    Agregados diarios de visitas a partir del historial (solo si está vacía)
+    
+    Los sketches de visitantes únicos se calculan en Python, así que se
+    reutiliza la compactación completa del repositorio sobre la conexión de
+    la migración. El compactador ya no depende de una primera pasada para
+    tener el historial.
+    """
+    from sqlalchemy.orm import Session
+    from app.repositories.visit import VisitRepository
+    
+    if connection.execute(text("SELECT 1 FROM visit_daily_rollups LIMIT 1")).first():
+        return
+    with Session(bind=connection) as db:
+        VisitRepository.compact_rollups(db)
+
+
+def migrate_reactions_visitor_key(connection: Connection) -> None:
+    """
+    Sustituir reactions.visitor_id (texto) por visitor_key (16 bytes)
+    
+    Calcula la clave de cada reacción por bloques, elimina las reacciones
+    que pasan a ser duplicadas (el mismo UUID escrito de dos formas) y
+    cambia la restricción única a (memorial_id, reaction_type, visitor_key).
+    PostgreSQL altera la tabla en el sitio; SQLite no puede cambiar
+    restricciones, así que allí se reconstruye la tabla.
+    """
+    from app.models import Reaction
+    from app.repositories.reaction import ReactionRepository
+    
+    if "visitor_id" not in {c["name"] for c in inspect(connection).get_columns("reactions")}:
+        return
+    add_column("reactions", "visitor_key", LargeBinary(16))(connection)
+    
+    update = text("UPDATE reactions SET visitor_key = :key WHERE id = :id")
+    last_id = 0
+    while True:
+        batch = connection.execute(text(
+            "SELECT id, visitor_id FROM reactions WHERE id > :last_id "
+            "AND visitor_key IS NULL AND visitor_id IS NOT NULL ORDER BY id LIMIT 10000"
+        ), {"last_id": last_id}).all()
+        if not batch:
+            break
+        connection.execute(update, [
+            {"id": reaction_id, "key": ReactionRepository.visitor_key(visitor_id)}
+            for reaction_id, visitor_id in batch
+        ])
+        last_id = batch[-1][0]
+    
+    # Se conserva la primera; reconcile corrige después los contadores
+    connection.execute(text(
+        "DELETE FROM reactions WHERE id IN ("
+        "SELECT r.id FROM reactions r JOIN reactions o "
+        "ON o.memorial_id = r.memorial_id AND o.reaction_type = r.reaction_type "
+        "AND o.visitor_key = r.visitor_key AND o.id < r.id)"
+    ))
+    
+    if connection.dialect.name != "sqlite":
+        connection.execute(text("ALTER TABLE reactions DROP CONSTRAINT IF EXISTS unique_reaction_per_visitor"))
+        connection.execute(text(
+            "ALTER TABLE reactions ADD CONSTRAINT unique_reaction_per_visitor "
+            "UNIQUE (memorial_id, reaction_type, visitor_key)"
+        ))
+        connection.execute(text("ALTER TABLE reactions DROP COLUMN visitor_id"))
+        return
+    
+    # Los nombres de índice son globales en SQLite: se liberan antes de crear la tabla nueva
+    indexes = inspect(connection).get_indexes("reactions")
+    connection.execute(text("ALTER TABLE reactions RENAME TO reactions_old"))
+    for index in indexes:
+        connection.execute(text(f"DROP INDEX IF EXISTS {index['name']}"))
+    Reaction.__table__.create(connection)
+    connection.execute(text(
+        "INSERT INTO reactions (id, memorial_id, reaction_type, visitor_key, created_at) "
+        "SELECT id, memorial_id, reaction_type, visitor_key, created_at FROM reactions_old"
+    ))
+    connection.execute(text("DROP TABLE reactions_old"))
+    # Índices creados por migraciones (los del modelo ya existen)
+    for index in indexes:
+        if "visitor_id" not in index["column_names"]:
+            unique = "UNIQUE " if index["unique"] else ""
+            connection.execute(text(
+                f"CREATE {unique}INDEX IF NOT EXISTS {index['name']} "
+                f"ON reactions ({', '.join(index['column_names'])})"
+            ))
+
+
+def create_approved_condolences_index(connection: Connection) -> None:
+    """
+    Índice parcial del listado público de condolencias (solo las aprobadas)
+    
+    El predicado debe coincidir con el que genera el ORM en cada motor para
+    que el planificador lo use: "= 1" en SQLite, booleano en PostgreSQL.
+    """
+    predicate = "is_approved = 1" if connection.dialect.name == "sqlite" else "is_approved"
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_condolences_approved_keyset "
+        "ON condolences (memorial_id, is_featured DESC, created_at DESC, id DESC) "
+        f"WHERE {predicate}"
+    ))
+
+
+# (nombre, sentencias SQL o funciones) en orden de aplicación
+MIGRATIONS: List[Tuple[str, List[Union[str, Callable[[Connection], None]]]]] = [
+    ("visits_memorial_visited_at", [
+        "CREATE INDEX IF NOT EXISTS ix_visits_memorial_visited_at "
+        "ON visits (memorial_id, visited_at)",
+    ]),
+    ("reactions_memorial_created_type", [
+        "CREATE INDEX IF NOT EXISTS ix_reactions_memorial_created_type "
+        "ON reactions (memorial_id, created_at, reaction_type)",
+    ]),
+    ("visit_daily_rollups_visitor_sketch", [
+        add_column("visit_daily_rollups", "visitor_sketch", LargeBinary()),
+    ]),
+    # Contadores iniciales para bases de datos con reacciones previas (solo si está vacía)
+    ("reaction_counters_backfill", [
+        "INSERT INTO reaction_counters (memorial_id, reaction_type, count) "
+        "SELECT memorial_id, reaction_type, COUNT(*) FROM reactions "
+        "WHERE memorial_id IS NOT NULL AND reaction_type IS NOT NULL "
+        "AND NOT EXISTS (SELECT 1 FROM reaction_counters) "
+        "GROUP BY memorial_id, reaction_type",
+    ]),
+    ("visitor_reactions_backfill", [
+        backfill_visitor_reactions,
+    ]),
+    # Las búsquedas por visitante usan la clave primaria de visitor_reactions
+    ("drop_reactions_visitor_id_index", [
+        "DROP INDEX IF EXISTS ix_reactions_visitor_id",
+    ]),
+    ("condolences_approved_keyset", [
+        create_approved_condolences_index,
+    ]),
+    # Contadores iniciales de condolencias (solo si la tabla está vacía)
+    ("condolence_counters_backfill", [
+        "INSERT INTO condolence_counters (memorial_id, approved, pending) "
+        "SELECT memorial_id, "
+        "SUM(CASE WHEN is_approved THEN 1 ELSE 0 END), "
+        "SUM(CASE WHEN is_approved THEN 0 ELSE 1 END) "
+        "FROM condolences WHERE memorial_id IS NOT NULL "
+        "AND NOT EXISTS (SELECT 1 FROM condolence_counters) "
+        "GROUP BY memorial_id",
+    ]),
+    ("visit_daily_rollups_backfill", [
+        backfill_visit_rollups,
+    ]),
+    # Clave de visitante binaria: restricción única más estrecha (tras visitor_reactions_backfill)
+    ("reactions_visitor_key", [
+        migrate_reactions_visitor_key,
+    ]),
+    ("visitor_reactions_updated_at", [
+        add_column("visitor_reactions", "updated_at", DateTime()),
+    ]),
+    # Agregado de ubicaciones de visitas previas (solo si la tabla está vacía)
+    ("visit_location_rollups_backfill", [
+        "INSERT INTO visit_location_rollups (memorial_id, day, country, city, count) "
+        "SELECT memorial_id, DATE(visited_at), country, COALESCE(city, ''), COUNT(*) FROM visits "
+        "WHERE memorial_id IS NOT NULL AND country IS NOT NULL "
+        "AND NOT EXISTS (SELECT 1 FROM visit_location_rollups) "
+        "GROUP BY memorial_id, DATE(visited_at), country, COALESCE(city, '')",
+    ]),
+]
+
+
+def run_migrations(engine: Engine) -> None:
+    """
+    Aplicar las migraciones tras crear las tablas (se puede repetir sin efecto)
+    
+    Args:
+        engine: Motor de base de datos
+    """
+    with engine.begin() as connection:
+        for _, statements in MIGRATIONS:
+            for statement in statements:
+                if callable(statement):
+                    statement(connection)
+                else:
+                    connection.execute(text(statement))
@@ -0,0 +1,24 @@
+"""
+INSERT ... ON CONFLICT portable entre PostgreSQL y SQLite
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+def dialect_insert(db: Session, table):
+    """
+    Construir un INSERT del dialecto de la sesión
+    
+    Ambos dialectos soportan on_conflict_do_update / on_conflict_do_nothing
+    con la misma firma, así que los repositorios no dependen del motor.
+    
+    Args:
+        db: Sesión de base de datos
+        table: Modelo o tabla destino
+    
+    Returns:
+        Sentencia INSERT con soporte de ON CONFLICT
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
@@ -3,34 +3,69 @@ Aplicación principal de Memorial QR API
 Arquitectura limpia con separación de responsabilidades
 """
 import os
-from fastapi import FastAPI, Depends, File, UploadFile, Request
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, BackgroundTasks, Depends, File, Header, UploadFile, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import text
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
 from app.config import settings
 from app.db import Base, engine, get_db
+from app.db.migrations import run_migrations
 from app.api.v1 import api_router
 from app.models import User, Memorial, Visit, Reaction
 from app.schemas import MemorialCreate, MemorialResponse, MemorialUpdate, PublicMemorial
 from app.api.deps import get_current_user
 from app.services import MemorialService, QRService
 from app.core.rate_limit import limiter, rate_limit_exceeded_handler
-
-
-# Crear tablas en la base de datos
+from app.core.executor import render_executor
+from app.core.background_loop import background_loop
+from app.core.pubsub import live_broker
+from app.services.geo import GeoService
+from app.services.geo_enrichment import geo_enrichment_worker
+from app.services.visit_ingest import visit_ingest_buffer
+from app.services.visit_rollup import visit_rollup_compactor
+from app.services.visit_counters import visit_counters
+from app.services.visit_filter import visit_filter
+from app.services.reaction_counters import reaction_counter_cache
+
+
+# Crear tablas en la base de datos y aplicar migraciones (índices compuestos, etc.)
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Arranque y apagado ordenado de los recursos de la aplicación"""
+    geo_enrichment_worker.start()
+    visit_ingest_buffer.start()
+    visit_rollup_compactor.start()
+    reaction_counter_cache.start()
+    live_broker.start()
+    yield
+    # Cerrar las conexiones en vivo para que el apagado no espere a los clientes
+    await live_broker.stop()
+    await reaction_counter_cache.stop()
+    await visit_rollup_compactor.stop()
+    await visit_ingest_buffer.stop()
+    await geo_enrichment_worker.stop()
+    await GeoService.close()
+    background_loop.stop(cleanup=GeoService.close())
+    render_executor.shutdown()
+
 
 # Inicializar aplicación
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.APP_VERSION,
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Configurar Rate Limiting
@@ -77,6 +112,15 @@ async def health_check():
         return {
             "status": "healthy",
             "database": "connected",
+            "render_executor": render_executor.stats(),
+            "visit_filter": visit_filter.stats(),
+            "visit_ingest": visit_ingest_buffer.stats(),
+            "visit_rollups": visit_rollup_compactor.stats(),
+            "visit_counters": visit_counters.stats(),
+            "reaction_counters": reaction_counter_cache.stats(),
+            "live": live_broker.stats(),
+            "geo_enrichment": geo_enrichment_worker.stats(),
+            "geo_providers": GeoService.stats(),
             "message": "Todo correcto 🚀"
         }
     except Exception as e:
@@ -105,11 +149,12 @@ app.include_router(analytics.router, prefix="/analytics", tags=["analytics (lega
 @app.post("/memorials/", response_model=MemorialResponse, status_code=201, tags=["memorials (legacy)"])
 async def create_memorial_legacy(
     memorial: MemorialCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Crear memorial (endpoint legacy)"""
-    return MemorialService.create_memorial(db, memorial, current_user.id)
+    return MemorialService.create_memorial(db, memorial, current_user.id, background_tasks)
 
 
 @app.get("/memorials/", response_model=List[MemorialResponse], tags=["memorials (legacy)"])
@@ -128,20 +173,25 @@ async def get_public_memorial_legacy(slug: str, db: Session = Depends(get_db)):
 
 
 @app.get("/memorials/{slug}/qr", tags=["memorials (legacy)"])
-async def get_qr_legacy(slug: str, current_user: User = Depends(get_current_user)):
+async def get_qr_legacy(
+    slug: str,
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
     """Generar QR (endpoint legacy)"""
-    return QRService.generate_qr(slug)
+    return await QRService.generate_qr(slug, if_none_match=if_none_match)
 
 
 @app.post("/memorials/{memorial_id}/upload-photo", response_model=MemorialResponse, tags=["memorials (legacy)"])
 async def upload_photo_legacy(
     memorial_id: int,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Subir foto (endpoint legacy)"""
-    return await MemorialService.upload_photo(db, memorial_id, file, current_user)
+    return await MemorialService.upload_photo(db, memorial_id, file, current_user, background_tasks)
 
 
 @app.put("/memorials/{memorial_id}", response_model=MemorialResponse, tags=["memorials (legacy)"])
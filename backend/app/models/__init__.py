@@ -1,10 +1,10 @@
 """Models package"""
 from app.models.user import User
 from app.models.memorial import Memorial
-from app.models.visit import Visit
-from app.models.reaction import Reaction
-from app.models.condolence import Condolence
+from app.models.visit import Visit, VisitDailyRollup, VisitLocationRollup
+from app.models.reaction import Reaction, ReactionCounter, VisitorReaction
+from app.models.condolence import Condolence, CondolenceCounter
 from app.models.timeline import TimelineEvent
 from app.models.media import MediaItem
 
-__all__ = ["User", "Memorial", "Visit", "Reaction", "Condolence", "TimelineEvent", "MediaItem"]
+__all__ = ["User", "Memorial", "Visit", "VisitDailyRollup", "VisitLocationRollup", "Reaction", "ReactionCounter", "VisitorReaction", "Condolence", "CondolenceCounter", "TimelineEvent", "MediaItem"]
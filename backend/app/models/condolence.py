@@ -1,6 +1,7 @@
 """
 Modelo de Condolencias - Libro de visitas digital
 """
+from datetime import datetime, timezone
 from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -30,8 +31,22 @@ class Condolence(Base):
     # Metadatos
     visitor_id = Column(String, nullable=True)  # UUID del visitante
     ip_address = Column(String, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Fijada en Python para que el cursor de paginación la reproduzca exactamente (SQLite guarda texto)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), server_default=func.now())
     approved_at = Column(DateTime(timezone=True), nullable=True)
     
     # Relaciones
     memorial = relationship("Memorial", back_populates="condolences")
+
+
+class CondolenceCounter(Base):
+    """Condolencias aprobadas y pendientes por memorial, actualizadas al escribir"""
+    
+    __tablename__ = "condolence_counters"
+
+    memorial_id = Column(Integer, ForeignKey("memorials.id", ondelete="CASCADE"), primary_key=True)
+    approved = Column(Integer, nullable=False, default=0)
+    pending = Column(Integer, nullable=False, default=0)
+    
+    # Relaciones
+    memorial = relationship("Memorial", back_populates="condolence_counter")
@@ -26,7 +26,12 @@ class Memorial(Base):
     owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     owner = relationship("User", back_populates="memorials")
     visits = relationship("Visit", back_populates="memorial", cascade="all, delete-orphan")
+    visit_rollups = relationship("VisitDailyRollup", back_populates="memorial", cascade="all, delete-orphan")
+    location_rollups = relationship("VisitLocationRollup", back_populates="memorial", cascade="all, delete-orphan")
     reactions = relationship("Reaction", back_populates="memorial", cascade="all, delete-orphan")
+    reaction_counters = relationship("ReactionCounter", back_populates="memorial", cascade="all, delete-orphan")
+    visitor_reactions = relationship("VisitorReaction", back_populates="memorial", cascade="all, delete-orphan")
     condolences = relationship("Condolence", back_populates="memorial", cascade="all, delete-orphan")
+    condolence_counter = relationship("CondolenceCounter", back_populates="memorial", uselist=False, cascade="all, delete-orphan")
     timeline_events = relationship("TimelineEvent", back_populates="memorial", cascade="all, delete-orphan")
     media_items = relationship("MediaItem", back_populates="memorial", cascade="all, delete-orphan")
@@ -1,7 +1,10 @@
 """
 Modelo de Reacciones - Interacciones de usuarios con memoriales
 """
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, UniqueConstraint
+from sqlalchemy import (
+    Column, Integer, SmallInteger, String, LargeBinary, ForeignKey, DateTime,
+    UniqueConstraint, PrimaryKeyConstraint
+)
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.db import Base
@@ -15,7 +18,7 @@ class Reaction(Base):
     id = Column(Integer, primary_key=True, index=True)
     memorial_id = Column(Integer, ForeignKey("memorials.id", ondelete="CASCADE"), index=True)
     reaction_type = Column(String, index=True)  # 'candle', 'flower', 'heart', 'pray', 'dove'
-    visitor_id = Column(String, index=True)  # UUID generado en el cliente para identificar visitantes únicos
+    visitor_key = Column(LargeBinary(16))  # Visitante en 16 bytes (ReactionRepository.visitor_key)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relaciones
@@ -23,5 +26,40 @@ class Reaction(Base):
     
     # Constraint único para evitar múltiples reacciones del mismo tipo por visitante
     __table_args__ = (
-        UniqueConstraint('memorial_id', 'reaction_type', 'visitor_id', name='unique_reaction_per_visitor'),
+        UniqueConstraint('memorial_id', 'reaction_type', 'visitor_key', name='unique_reaction_per_visitor'),
+    )
+
+
+class ReactionCounter(Base):
+    """Conteo de reacciones por memorial y tipo, actualizado en cada toggle"""
+    
+    __tablename__ = "reaction_counters"
+
+    memorial_id = Column(Integer, ForeignKey("memorials.id", ondelete="CASCADE"), nullable=False)
+    reaction_type = Column(String, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    
+    # Relaciones
+    memorial = relationship("Memorial", back_populates="reaction_counters")
+    
+    __table_args__ = (
+        PrimaryKeyConstraint('memorial_id', 'reaction_type', name='pk_reaction_counters'),
+    )
+
+
+class VisitorReaction(Base):
+    """Reacciones activas de un visitante en un memorial, como máscara de bits"""
+    
+    __tablename__ = "visitor_reactions"
+
+    memorial_id = Column(Integer, ForeignKey("memorials.id", ondelete="CASCADE"), nullable=False)
+    visitor_key = Column(LargeBinary(16), nullable=False)  # UUID del visitante en binario (o hash de 16 bytes)
+    mask = Column(SmallInteger, nullable=False, default=0)  # Bit i = ReactionRepository.REACTION_TYPES[i]
+    updated_at = Column(DateTime)  # Último toggle (UTC): marca compartida entre workers para reconcile
+    
+    # Relaciones
+    memorial = relationship("Memorial", back_populates="visitor_reactions")
+    
+    __table_args__ = (
+        PrimaryKeyConstraint('memorial_id', 'visitor_key', name='pk_visitor_reactions'),
     )
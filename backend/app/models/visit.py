@@ -1,7 +1,7 @@
 """
 Modelo de Visitas - Tracking de escaneos QR
 """
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Date, LargeBinary, PrimaryKeyConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.db import Base
@@ -23,3 +23,41 @@ class Visit(Base):
     
     # Relaciones
     memorial = relationship("Memorial", back_populates="visits")
+
+
+class VisitDailyRollup(Base):
+    """Visitas agregadas por memorial y día (UTC), mantenidas al registrar visitas"""
+    
+    __tablename__ = "visit_daily_rollups"
+
+    memorial_id = Column(Integer, ForeignKey("memorials.id", ondelete="CASCADE"), nullable=False)
+    day = Column(Date, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    unique_visitors = Column(Integer, nullable=False, default=0)  # Estimación del sketch del día
+    visitor_sketch = Column(LargeBinary, nullable=True)  # HyperLogLog de visitantes (IP + user agent)
+    
+    # Relaciones
+    memorial = relationship("Memorial", back_populates="visit_rollups")
+    
+    __table_args__ = (
+        PrimaryKeyConstraint('memorial_id', 'day', name='pk_visit_daily_rollups'),
+    )
+
+
+class VisitLocationRollup(Base):
+    """Visitas geolocalizadas por memorial, día (UTC), país y ciudad"""
+    
+    __tablename__ = "visit_location_rollups"
+
+    memorial_id = Column(Integer, ForeignKey("memorials.id", ondelete="CASCADE"), nullable=False)
+    day = Column(Date, nullable=False)
+    country = Column(String, nullable=False)
+    city = Column(String, nullable=False, default="")  # "" = ciudad desconocida
+    count = Column(Integer, nullable=False, default=0)
+    
+    # Relaciones
+    memorial = relationship("Memorial", back_populates="location_rollups")
+    
+    __table_args__ = (
+        PrimaryKeyConstraint('memorial_id', 'day', 'country', 'city', name='pk_visit_location_rollups'),
+    )
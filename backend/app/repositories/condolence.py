@@ -1,10 +1,12 @@
 """
 Repositorio de Condolencias
 """
+from datetime import datetime, timezone
 from typing import List, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.models import Condolence
+from sqlalchemy import delete, func, select, tuple_, update
+from app.db.upsert import dialect_insert
+from app.models import Condolence, CondolenceCounter
 from app.schemas import CondolenceCreate, CondolenceUpdate
 
 
@@ -31,10 +33,38 @@ class CondolenceRepository:
             is_featured=False
         )
         db.add(db_condolence)
+        db.flush()
+        CondolenceRepository._bump_counter(db, memorial_id, pending=1)
         db.commit()
         db.refresh(db_condolence)
         return db_condolence
     
+    @staticmethod
+    def _bump_counter(db: Session, memorial_id: int, approved: int = 0, pending: int = 0) -> None:
+        """Sumar a los contadores de un memorial (sin confirmar)"""
+        counters = CondolenceCounter.__table__
+        db.execute(
+            dialect_insert(db, counters).values(
+                memorial_id=memorial_id, approved=approved, pending=pending
+            ).on_conflict_do_update(
+                index_elements=[counters.c.memorial_id],
+                set_={
+                    "approved": counters.c.approved + approved,
+                    "pending": counters.c.pending + pending,
+                }
+            )
+        )
+    
+    @staticmethod
+    def get_counts(db: Session, memorial_id: int) -> Tuple[int, int]:
+        """Condolencias (aprobadas, pendientes) de un memorial desde condolence_counters"""
+        row = db.execute(
+            select(CondolenceCounter.approved, CondolenceCounter.pending).where(
+                CondolenceCounter.memorial_id == memorial_id
+            )
+        ).first()
+        return (row.approved, row.pending) if row is not None else (0, 0)
+    
     @staticmethod
     def get_by_id(db: Session, condolence_id: int) -> Optional[Condolence]:
         """Obtener condolencia por ID"""
@@ -48,28 +78,64 @@ class CondolenceRepository:
         limit: int = 50,
         offset: int = 0
     ) -> Tuple[List[Condolence], int]:
-        """Obtener condolencias de un memorial"""
+        """Obtener condolencias de un memorial (total desde condolence_counters)"""
         query = db.query(Condolence).filter(Condolence.memorial_id == memorial_id)
         
         if approved_only:
             query = query.filter(Condolence.is_approved == True)
         
-        total = query.count()
+        approved, pending = CondolenceRepository.get_counts(db, memorial_id)
+        total = approved if approved_only else approved + pending
         
         condolences = query.order_by(
             Condolence.is_featured.desc(),
-            Condolence.created_at.desc()
+            Condolence.created_at.desc(),
+            Condolence.id.desc()
         ).offset(offset).limit(limit).all()
         
         return condolences, total
     
+    @staticmethod
+    def get_approved_page(
+        db: Session,
+        memorial_id: int,
+        limit: int = 50,
+        after: Optional[Tuple[bool, datetime, int]] = None
+    ) -> List[Condolence]:
+        """
+        Página de condolencias aprobadas por keyset
+        
+        Recorre ix_condolences_approved_keyset (parcial sobre las aprobadas)
+        desde la posición de la última fila entregada, así que el coste no
+        crece con la profundidad de la página.
+        
+        Args:
+            db: Sesión de base de datos
+            memorial_id: ID del memorial
+            limit: Tamaño de la página
+            after: (is_featured, created_at, id) de la última fila ya entregada
+        
+        Returns:
+            Condolencias destacadas primero y después de la más reciente a la más antigua
+        """
+        query = db.query(Condolence).filter(
+            Condolence.memorial_id == memorial_id,
+            Condolence.is_approved == True
+        )
+        if after is not None:
+            query = query.filter(
+                tuple_(Condolence.is_featured, Condolence.created_at, Condolence.id) < tuple_(*after)
+            )
+        return query.order_by(
+            Condolence.is_featured.desc(),
+            Condolence.created_at.desc(),
+            Condolence.id.desc()
+        ).limit(limit).all()
+    
     @staticmethod
     def get_pending_count(db: Session, memorial_id: int) -> int:
         """Obtener cantidad de condolencias pendientes"""
-        return db.query(Condolence).filter(
-            Condolence.memorial_id == memorial_id,
-            Condolence.is_approved == False
-        ).count()
+        return CondolenceRepository.get_counts(db, memorial_id)[1]
     
     @staticmethod
     def update(
@@ -77,17 +143,34 @@ class CondolenceRepository:
         condolence_id: int, 
         update_data: CondolenceUpdate
     ) -> Optional[Condolence]:
-        """Actualizar condolencia (moderación)"""
+        """
+        Actualizar condolencia (moderación)
+        
+        El cambio de aprobación es un UPDATE condicionado al estado anterior:
+        si dos moderadores aprueban a la vez, solo uno mueve los contadores.
+        """
         condolence = db.query(Condolence).filter(Condolence.id == condolence_id).first()
         if not condolence:
             return None
         
         update_dict = update_data.model_dump(exclude_unset=True)
         
-        # Si se aprueba, agregar fecha de aprobación
-        if update_dict.get('is_approved') == True and not condolence.is_approved:
-            from datetime import datetime, timezone
-            condolence.approved_at = datetime.now(timezone.utc)
+        approve = update_dict.pop('is_approved', None)
+        if approve is not None:
+            values = {"is_approved": approve}
+            # Si se aprueba, agregar fecha de aprobación
+            if approve:
+                values["approved_at"] = datetime.now(timezone.utc)
+            condolences = Condolence.__table__
+            changed = db.execute(
+                update(condolences).where(
+                    condolences.c.id == condolence_id,
+                    func.coalesce(condolences.c.is_approved, False) == (not approve)
+                ).values(**values).returning(condolences.c.id)
+            ).first()
+            if changed is not None:
+                step = 1 if approve else -1
+                CondolenceRepository._bump_counter(db, condolence.memorial_id, approved=step, pending=-step)
         
         for key, value in update_dict.items():
             setattr(condolence, key, value)
@@ -98,19 +181,25 @@ class CondolenceRepository:
     
     @staticmethod
     def delete(db: Session, condolence_id: int) -> bool:
-        """Eliminar condolencia"""
-        condolence = db.query(Condolence).filter(Condolence.id == condolence_id).first()
-        if not condolence:
+        """Eliminar condolencia (y descontarla de su contador)"""
+        condolences = Condolence.__table__
+        row = db.execute(
+            delete(condolences).where(condolences.c.id == condolence_id).returning(
+                condolences.c.memorial_id, condolences.c.is_approved
+            )
+        ).first()
+        if row is None:
             return False
         
-        db.delete(condolence)
+        if row.memorial_id is not None:
+            if row.is_approved:
+                CondolenceRepository._bump_counter(db, row.memorial_id, approved=-1)
+            else:
+                CondolenceRepository._bump_counter(db, row.memorial_id, pending=-1)
         db.commit()
         return True
     
     @staticmethod
     def get_total_by_memorial(db: Session, memorial_id: int) -> int:
         """Obtener total de condolencias aprobadas"""
-        return db.query(Condolence).filter(
-            Condolence.memorial_id == memorial_id,
-            Condolence.is_approved == True
-        ).count()
+        return CondolenceRepository.get_counts(db, memorial_id)[0]
@@ -1,10 +1,13 @@
 """
 Repositorio de memoriales - Capa de acceso a datos
 """
-from typing import List, Optional
+from datetime import date
+from typing import Any, List, Optional, Tuple
+from sqlalchemy import and_, func, or_, select
 from sqlalchemy.orm import Session
-from app.models import Memorial
+from app.models import Memorial, VisitDailyRollup
 from app.schemas import MemorialCreate
+from app.core.qr_cache import qr_render_cache
 from slugify import slugify
 import uuid
 
@@ -27,6 +30,56 @@ class MemorialRepository:
         """Obtener todos los memoriales de un usuario"""
         return db.query(Memorial).filter(Memorial.owner_id == user_id).all()
     
+    @staticmethod
+    def get_page_by_user(db: Session, user_id: int, sort: str = "visits", limit: int = 20,
+                         after: Optional[Tuple[Any, int]] = None,
+                         start_date: date = None, end_date: date = None) -> List[Tuple[int, str, str, Any]]:
+        """
+        Página de memoriales de un usuario ordenada por actividad (keyset)
+        
+        Ordena de mayor a menor por el criterio y desempata por id
+        descendente, así que cada página continúa justo después de la
+        última fila de la anterior sin usar OFFSET.
+        
+        Args:
+            db: Sesión de base de datos
+            user_id: ID del propietario
+            sort: "visits" (visitas en el rango) o "activity" (último día con visitas)
+            limit: Tamaño de la página
+            after: (valor de ordenación, id) de la última fila ya entregada
+            start_date: Inicio del filtro (opcional)
+            end_date: Fin del filtro (opcional)
+            
+        Returns:
+            Tuplas (id, nombre, slug, valor de ordenación)
+        """
+        owned = select(Memorial.id).where(Memorial.owner_id == user_id)
+        rollups = select(
+            VisitDailyRollup.memorial_id,
+            func.sum(VisitDailyRollup.count).label("visits"),
+            func.max(VisitDailyRollup.day).label("last_day")
+        ).where(VisitDailyRollup.memorial_id.in_(owned), VisitDailyRollup.count > 0)
+        if start_date:
+            rollups = rollups.where(VisitDailyRollup.day >= start_date)
+        if end_date:
+            rollups = rollups.where(VisitDailyRollup.day <= end_date)
+        rollups = rollups.group_by(VisitDailyRollup.memorial_id).subquery()
+        
+        if sort == "activity":
+            sort_value = func.coalesce(rollups.c.last_day, date.min)
+        else:
+            sort_value = func.coalesce(rollups.c.visits, 0)
+        
+        query = db.query(
+            Memorial.id, Memorial.name, Memorial.slug, sort_value.label("sort_value")
+        ).outerjoin(rollups, rollups.c.memorial_id == Memorial.id).filter(Memorial.owner_id == user_id)
+        if after is not None:
+            value, last_id = after
+            query = query.filter(or_(sort_value < value, and_(sort_value == value, Memorial.id < last_id)))
+        
+        rows = query.order_by(sort_value.desc(), Memorial.id.desc()).limit(limit).all()
+        return [(r.id, r.name, r.slug, r.sort_value) for r in rows]
+    
     @staticmethod
     def create(db: Session, memorial: MemorialCreate, user_id: int) -> Memorial:
         """Crear nuevo memorial"""
@@ -52,9 +105,14 @@ class MemorialRepository:
     @staticmethod
     def update_image(db: Session, memorial: Memorial, image_filename: str) -> Memorial:
         """Actualizar la imagen de un memorial"""
+        previous_filename = memorial.image_filename
         memorial.image_filename = image_filename
         db.commit()
         db.refresh(memorial)
+        
+        # Los QR con foto incrustada quedan obsoletos
+        if previous_filename != image_filename:
+            qr_render_cache.invalidate(memorial.slug)
         return memorial
     
     @staticmethod
@@ -70,5 +128,7 @@ class MemorialRepository:
     @staticmethod
     def delete(db: Session, memorial: Memorial) -> None:
         """Eliminar un memorial"""
+        slug = memorial.slug
         db.delete(memorial)
         db.commit()
+        qr_render_cache.invalidate(slug)
@@ -1,17 +1,43 @@
 """
 Repositorio de Reacciones - Capa de acceso a datos
 """
-from typing import List, Optional, Dict
-from datetime import date
+import uuid
+import hashlib
+from typing import List, Optional, Dict, Set, Tuple
+from datetime import date, datetime
 from sqlalchemy.orm import Session
-from sqlalchemy import func, cast, Date
+from sqlalchemy import delete, func, select, update
 from sqlalchemy.exc import IntegrityError
-from app.models import Reaction
+from app.db.filters import date_range
+from app.db.upsert import dialect_insert
+from app.models import Reaction, ReactionCounter, VisitorReaction
 
 
 class ReactionRepository:
     """Repositorio para operaciones de base de datos de reacciones"""
     
+    REACTION_TYPES = ('candle', 'flower', 'heart', 'pray', 'dove')
+    # Bit de cada tipo en visitor_reactions.mask (no reordenar: está persistido)
+    REACTION_BITS = {reaction_type: 1 << i for i, reaction_type in enumerate(REACTION_TYPES)}
+    
+    @staticmethod
+    def visitor_key(visitor_id: str) -> bytes:
+        """
+        Clave binaria de 16 bytes de un visitante
+        
+        Los visitor_id del cliente son UUID y se guardan en binario; cualquier
+        otro identificador se reduce con BLAKE2b a la misma longitud.
+        """
+        try:
+            return uuid.UUID(visitor_id).bytes
+        except (ValueError, AttributeError, TypeError):
+            return hashlib.blake2b(str(visitor_id).encode(), digest_size=16).digest()
+    
+    @staticmethod
+    def mask_types(mask: int) -> List[str]:
+        """Tipos de reacción presentes en una máscara"""
+        return [t for t, bit in ReactionRepository.REACTION_BITS.items() if mask & bit]
+    
     @staticmethod
     def create(db: Session, memorial_id: int, reaction_type: str, visitor_id: str) -> Optional[Reaction]:
         """Crear nueva reacción"""
@@ -19,9 +45,12 @@ class ReactionRepository:
             db_reaction = Reaction(
                 memorial_id=memorial_id,
                 reaction_type=reaction_type,
-                visitor_id=visitor_id
+                visitor_key=ReactionRepository.visitor_key(visitor_id)
             )
             db.add(db_reaction)
+            db.flush()
+            ReactionRepository._bump_counter(db, memorial_id, reaction_type, 1)
+            ReactionRepository._set_visitor_bit(db, memorial_id, visitor_id, reaction_type, True)
             db.commit()
             db.refresh(db_reaction)
             return db_reaction
@@ -32,41 +61,177 @@ class ReactionRepository:
     @staticmethod
     def delete(db: Session, memorial_id: int, reaction_type: str, visitor_id: str) -> bool:
         """Eliminar una reacción"""
-        reaction = db.query(Reaction).filter(
-            Reaction.memorial_id == memorial_id,
-            Reaction.reaction_type == reaction_type,
-            Reaction.visitor_id == visitor_id
+        removed = ReactionRepository._delete_returning(db, memorial_id, reaction_type, visitor_id)
+        if removed:
+            ReactionRepository._bump_counter(db, memorial_id, reaction_type, -1)
+            ReactionRepository._set_visitor_bit(db, memorial_id, visitor_id, reaction_type, False)
+        db.commit()
+        return removed
+    
+    @staticmethod
+    def _delete_returning(db: Session, memorial_id: int, reaction_type: str, visitor_id: str) -> bool:
+        """DELETE ... RETURNING: indica si esta transacción borró la reacción"""
+        reactions = Reaction.__table__
+        row = db.execute(
+            delete(reactions).where(
+                reactions.c.memorial_id == memorial_id,
+                reactions.c.reaction_type == reaction_type,
+                reactions.c.visitor_key == ReactionRepository.visitor_key(visitor_id)
+            ).returning(reactions.c.id)
         ).first()
+        return row is not None
+    
+    @staticmethod
+    def _set_visitor_bit(db: Session, memorial_id: int, visitor_id: str,
+                         reaction_type: str, present: bool) -> Optional[int]:
+        """
+        Encender o apagar el bit de un tipo en la máscara del visitante (sin confirmar)
         
-        if reaction:
-            db.delete(reaction)
-            db.commit()
-            return True
-        return False
+        También marca updated_at: reconcile omite los memoriales con toggles
+        recientes aunque su delta siga pendiente en otro worker.
+        
+        Returns:
+            Máscara resultante (None si el tipo no tiene bit asignado)
+        """
+        bit = ReactionRepository.REACTION_BITS.get(reaction_type)
+        if bit is None:
+            return None
+        table = VisitorReaction.__table__
+        key = ReactionRepository.visitor_key(visitor_id)
+        now = datetime.utcnow()
+        if present:
+            statement = dialect_insert(db, table).values(
+                memorial_id=memorial_id, visitor_key=key, mask=bit, updated_at=now
+            ).on_conflict_do_update(
+                index_elements=[table.c.memorial_id, table.c.visitor_key],
+                set_={"mask": table.c.mask.op("|")(bit), "updated_at": now}
+            )
+        else:
+            statement = update(table).where(
+                table.c.memorial_id == memorial_id,
+                table.c.visitor_key == key
+            ).values(
+                mask=table.c.mask.op("&")(sum(ReactionRepository.REACTION_BITS.values()) ^ bit),
+                updated_at=now
+            )
+        row = db.execute(statement.returning(table.c.mask)).first()
+        return row.mask if row is not None else 0
+    
+    @staticmethod
+    def _bump_counter(db: Session, memorial_id: int, reaction_type: str, delta: int) -> None:
+        """Sumar delta al contador de un tipo de reacción (sin confirmar)"""
+        ReactionRepository.apply_counter_deltas(db, {(memorial_id, reaction_type): delta})
+    
+    @staticmethod
+    def apply_counter_deltas(db: Session, deltas: Dict[Tuple[int, str], int]) -> None:
+        """
+        Sumar varios deltas a los contadores en una sola sentencia (sin confirmar)
+        
+        Args:
+            db: Sesión de base de datos
+            deltas: Delta por (memorial_id, tipo de reacción)
+        """
+        rows = [
+            {"memorial_id": memorial_id, "reaction_type": reaction_type, "count": delta}
+            for (memorial_id, reaction_type), delta in deltas.items() if delta
+        ]
+        if not rows:
+            return
+        
+        counters = ReactionCounter.__table__
+        stmt = dialect_insert(db, counters)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[counters.c.memorial_id, counters.c.reaction_type],
+            set_={"count": counters.c.count + stmt.excluded.count}
+        )
+        db.execute(stmt, rows)
+    
+    @staticmethod
+    def get_exact_counts(db: Session) -> Dict[int, Dict[str, int]]:
+        """
+        Conteos reales por memorial y tipo, agrupando la tabla de reacciones
+        
+        Incluye con ceros los memoriales que tienen contadores pero ya no
+        tienen reacciones.
+        """
+        counts: Dict[int, Dict[str, int]] = {}
+        for (memorial_id,) in db.execute(select(ReactionCounter.memorial_id).distinct()):
+            counts[memorial_id] = dict.fromkeys(ReactionRepository.REACTION_TYPES, 0)
+        
+        rows = db.execute(
+            select(Reaction.memorial_id, Reaction.reaction_type, func.count(Reaction.id))
+            .where(Reaction.memorial_id.isnot(None))
+            .group_by(Reaction.memorial_id, Reaction.reaction_type)
+        )
+        for memorial_id, reaction_type, count in rows:
+            memorial_counts = counts.setdefault(memorial_id, dict.fromkeys(ReactionRepository.REACTION_TYPES, 0))
+            if reaction_type in memorial_counts:
+                memorial_counts[reaction_type] = count
+        return counts
+    
+    @staticmethod
+    def get_recently_toggled(db: Session, since: datetime) -> Set[int]:
+        """Memoriales con algún toggle confirmado desde since (en cualquier worker)"""
+        rows = db.execute(
+            select(VisitorReaction.memorial_id).where(VisitorReaction.updated_at >= since).distinct()
+        )
+        return {memorial_id for (memorial_id,) in rows}
+    
+    @staticmethod
+    def set_counters(db: Session, counts: Dict[int, Dict[str, int]]) -> None:
+        """Sobrescribir los contadores de varios memoriales y confirmar"""
+        rows = [
+            {"memorial_id": memorial_id, "reaction_type": reaction_type, "count": count}
+            for memorial_id, memorial_counts in counts.items()
+            for reaction_type, count in memorial_counts.items()
+        ]
+        if rows:
+            counters = ReactionCounter.__table__
+            stmt = dialect_insert(db, counters)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[counters.c.memorial_id, counters.c.reaction_type],
+                set_={"count": stmt.excluded.count}
+            )
+            db.execute(stmt, rows)
+        db.commit()
+    
+    @staticmethod
+    def get_counter_counts(db: Session, memorial_ids: List[int]) -> Dict[int, Dict[str, int]]:
+        """
+        Conteo total de reacciones por tipo desde la tabla de contadores
+        
+        Lee como máximo una fila por memorial y tipo, sin agrupar reacciones.
+        """
+        counts = {memorial_id: dict.fromkeys(ReactionRepository.REACTION_TYPES, 0) for memorial_id in memorial_ids}
+        if not memorial_ids:
+            return counts
+        
+        rows = db.execute(
+            select(ReactionCounter.memorial_id, ReactionCounter.reaction_type, ReactionCounter.count)
+            .where(ReactionCounter.memorial_id.in_(memorial_ids))
+        )
+        for memorial_id, reaction_type, count in rows:
+            if reaction_type in counts[memorial_id]:
+                counts[memorial_id][reaction_type] = max(count, 0)
+        return counts
     
     @staticmethod
     def get_counts_by_memorial(db: Session, memorial_id: int,
                                start_date: date = None, end_date: date = None) -> Dict[str, int]:
         """Obtener conteo de reacciones por tipo para un memorial con filtros"""
+        if not start_date and not end_date:
+            return ReactionRepository.get_counter_counts(db, [memorial_id])[memorial_id]
+        
         query = db.query(
             Reaction.reaction_type,
             func.count(Reaction.id).label('count')
         ).filter(Reaction.memorial_id == memorial_id)
         
-        if start_date:
-            query = query.filter(cast(Reaction.created_at, Date) >= start_date)
-        if end_date:
-            query = query.filter(cast(Reaction.created_at, Date) <= end_date)
+        query = query.filter(*date_range(Reaction.created_at, start_date, end_date))
         
         results = query.group_by(Reaction.reaction_type).all()
         
-        counts = {
-            'candle': 0,
-            'flower': 0,
-            'heart': 0,
-            'pray': 0,
-            'dove': 0
-        }
+        counts = dict.fromkeys(ReactionRepository.REACTION_TYPES, 0)
         
         for r in results:
             if r.reaction_type in counts:
@@ -75,14 +240,45 @@ class ReactionRepository:
         return counts
     
     @staticmethod
-    def get_user_reactions(db: Session, memorial_id: int, visitor_id: str) -> List[str]:
-        """Obtener las reacciones de un visitante específico"""
-        reactions = db.query(Reaction.reaction_type).filter(
-            Reaction.memorial_id == memorial_id,
-            Reaction.visitor_id == visitor_id
-        ).all()
+    def get_counts_by_memorials(db: Session, memorial_ids: List[int],
+                                start_date: date = None, end_date: date = None) -> Dict[int, Dict[str, int]]:
+        """Conteo de reacciones por tipo de varios memoriales en una sola consulta"""
+        if not start_date and not end_date:
+            return ReactionRepository.get_counter_counts(db, memorial_ids)
         
-        return [r.reaction_type for r in reactions]
+        counts = {memorial_id: dict.fromkeys(ReactionRepository.REACTION_TYPES, 0) for memorial_id in memorial_ids}
+        if not memorial_ids:
+            return counts
+        
+        query = db.query(
+            Reaction.memorial_id,
+            Reaction.reaction_type,
+            func.count(Reaction.id).label('count')
+        ).filter(Reaction.memorial_id.in_(memorial_ids))
+        
+        query = query.filter(*date_range(Reaction.created_at, start_date, end_date))
+        
+        for r in query.group_by(Reaction.memorial_id, Reaction.reaction_type):
+            if r.reaction_type in counts[r.memorial_id]:
+                counts[r.memorial_id][r.reaction_type] = r.count
+        
+        return counts
+    
+    @staticmethod
+    def get_visitor_mask(db: Session, memorial_id: int, visitor_id: str) -> int:
+        """Máscara de reacciones activas de un visitante (0 si no tiene ninguna)"""
+        mask = db.execute(
+            select(VisitorReaction.mask).where(
+                VisitorReaction.memorial_id == memorial_id,
+                VisitorReaction.visitor_key == ReactionRepository.visitor_key(visitor_id)
+            )
+        ).scalar()
+        return mask or 0
+    
+    @staticmethod
+    def get_user_reactions(db: Session, memorial_id: int, visitor_id: str) -> List[str]:
+        """Obtener las reacciones de un visitante específico (por clave primaria en visitor_reactions)"""
+        return ReactionRepository.mask_types(ReactionRepository.get_visitor_mask(db, memorial_id, visitor_id))
     
     @staticmethod
     def get_total_for_memorial(db: Session, memorial_id: int) -> int:
@@ -98,32 +294,53 @@ class ReactionRepository:
         
         query = db.query(Reaction).filter(Reaction.memorial_id.in_(memorial_ids))
         
-        if start_date:
-            query = query.filter(cast(Reaction.created_at, Date) >= start_date)
-        if end_date:
-            query = query.filter(cast(Reaction.created_at, Date) <= end_date)
+        query = query.filter(*date_range(Reaction.created_at, start_date, end_date))
         
         return query.count()
     
     @staticmethod
-    def toggle_reaction(db: Session, memorial_id: int, reaction_type: str, visitor_id: str) -> dict:
-        """Toggle de reacción (agregar si no existe, eliminar si existe)"""
-        existing = db.query(Reaction).filter(
-            Reaction.memorial_id == memorial_id,
-            Reaction.reaction_type == reaction_type,
-            Reaction.visitor_id == visitor_id
-        ).first()
+    def toggle_reaction(db: Session, memorial_id: int, reaction_type: str, visitor_id: str,
+                        update_counter: bool = True) -> dict:
+        """
+        Toggle de reacción (agregar si no existe, eliminar si existe)
         
-        if existing:
-            db.delete(existing)
-            db.commit()
-            return {"action": "removed", "reaction_type": reaction_type}
+        Sin lectura previa: DELETE ... RETURNING y, si no había nada que
+        borrar, INSERT ... ON CONFLICT DO NOTHING RETURNING. El contador del
+        tipo se actualiza en la misma transacción, así que dos toques
+        simultáneos no chocan con la restricción única ni descuadran el
+        conteo. La máscara del visitante en visitor_reactions también se
+        actualiza en la misma transacción.
+        
+        Args:
+            update_counter: Actualizar reaction_counters aquí; con False el
+                llamador aplica el delta devuelto (escrituras agrupadas)
+        
+        Returns:
+            Acción realizada, tipo, delta del contador, máscara de reacciones
+            del visitante y, si se actualizó el contador, conteos del memorial
+        """
+        if ReactionRepository._delete_returning(db, memorial_id, reaction_type, visitor_id):
+            action, delta = "removed", -1
         else:
-            new_reaction = Reaction(
-                memorial_id=memorial_id,
-                reaction_type=reaction_type,
-                visitor_id=visitor_id
-            )
-            db.add(new_reaction)
-            db.commit()
-            return {"action": "added", "reaction_type": reaction_type}
+            reactions = Reaction.__table__
+            inserted = db.execute(
+                dialect_insert(db, reactions).values(
+                    memorial_id=memorial_id,
+                    reaction_type=reaction_type,
+                    visitor_key=ReactionRepository.visitor_key(visitor_id)
+                ).on_conflict_do_nothing(
+                    index_elements=[reactions.c.memorial_id, reactions.c.reaction_type, reactions.c.visitor_key]
+                ).returning(reactions.c.id)
+            ).first()
+            # Si otra petición la insertó primero, la reacción ya existe y ya está contada
+            action, delta = "added", 1 if inserted is not None else 0
+        
+        mask = ReactionRepository._set_visitor_bit(db, memorial_id, visitor_id, reaction_type, action == "added")
+        
+        result = {"action": action, "reaction_type": reaction_type, "delta": delta, "mask": mask or 0}
+        if update_counter:
+            if delta:
+                ReactionRepository._bump_counter(db, memorial_id, reaction_type, delta)
+            result["counts"] = ReactionRepository.get_counter_counts(db, [memorial_id])[memorial_id]
+        db.commit()
+        return result
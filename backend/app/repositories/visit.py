@@ -1,11 +1,15 @@
 """
 Repositorio de Visitas - Capa de acceso a datos
 """
-from typing import List, Optional
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
 from datetime import datetime, timedelta, date
 from sqlalchemy.orm import Session
-from sqlalchemy import func, cast, Date
-from app.models import Visit
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from app.core.hll import HyperLogLog
+from app.db.filters import date_range
+from app.db.upsert import dialect_insert
+from app.models import Visit, VisitDailyRollup, VisitLocationRollup
 
 
 class VisitRepository:
@@ -22,88 +26,173 @@ class VisitRepository:
             user_agent=user_agent,
             referrer=referrer,
             country=country,
-            city=city
+            city=city,
+            visited_at=datetime.utcnow()
         )
         db.add(db_visit)
+        db.flush()
+        VisitRepository._bump_rollups(db, [
+            (memorial_id, db_visit.visited_at, VisitRepository.visitor_key(ip_address, user_agent))
+        ])
+        if country:
+            VisitRepository._bump_locations(db, [(memorial_id, db_visit.visited_at, country, city)])
         db.commit()
         db.refresh(db_visit)
         return db_visit
     
+    @staticmethod
+    def bulk_create(db: Session, rows: List[dict]) -> List[int]:
+        """
+        Insertar varias visitas en una sola sentencia
+        
+        Args:
+            db: Sesión de base de datos
+            rows: Columnas de cada visita
+            
+        Returns:
+            IDs generados, en el mismo orden que rows
+        """
+        if not rows:
+            return []
+        now = datetime.utcnow()
+        rows = [{"visited_at": now, **row} for row in rows]
+        result = db.execute(
+            insert(Visit).returning(Visit.id, sort_by_parameter_order=True),
+            rows
+        )
+        ids = list(result.scalars())
+        VisitRepository._bump_rollups(db, [
+            (row["memorial_id"], row["visited_at"],
+             VisitRepository.visitor_key(row.get("ip_address"), row.get("user_agent")))
+            for row in rows
+        ])
+        db.commit()
+        return ids
+    
+    @staticmethod
+    def update_location(db: Session, visit_id: int, country: str = None, city: str = None) -> bool:
+        """
+        Guardar la ubicación resuelta de una visita aún sin ubicación
+        
+        Suma la visita al agregado de ubicaciones en la misma transacción;
+        una visita ya geolocalizada no se vuelve a contar.
+        """
+        visits = Visit.__table__
+        row = db.execute(
+            update(visits).where(visits.c.id == visit_id, visits.c.country.is_(None))
+            .values(country=country, city=city)
+            .returning(visits.c.memorial_id, visits.c.visited_at)
+        ).first()
+        if row is not None and country:
+            VisitRepository._bump_locations(db, [(row.memorial_id, row.visited_at, country, city)])
+        db.commit()
+        return row is not None
+    
     @staticmethod
     def get_by_memorial(db: Session, memorial_id: int) -> List[Visit]:
         """Obtener todas las visitas de un memorial"""
         return db.query(Visit).filter(Visit.memorial_id == memorial_id).all()
     
+    @staticmethod
+    def iter_rows(db: Session, memorial_ids: List[int], columns: Sequence[str],
+                  start_date: date = None, end_date: date = None,
+                  batch_size: int = 1000) -> Iterator[Tuple]:
+        """
+        Recorrer visitas en crudo sin cargarlas todas en memoria
+        
+        Usa un cursor del lado del servidor (stream_results) y lee por
+        lotes de batch_size filas, devolviendo tuplas en lugar de objetos
+        ORM. El consumo de memoria no depende del número de visitas.
+        
+        Args:
+            db: Sesión de base de datos
+            memorial_ids: Memoriales a recorrer
+            columns: Nombres de columnas de Visit, en el orden de salida
+            start_date: Inicio del filtro (opcional)
+            end_date: Fin del filtro (opcional)
+            batch_size: Filas por lectura
+            
+        Returns:
+            Iterador de tuplas con las columnas pedidas, ordenadas por id
+        """
+        if not memorial_ids:
+            return iter(())
+        
+        statement = select(*(getattr(Visit, column) for column in columns)).where(
+            Visit.memorial_id.in_(memorial_ids),
+            *date_range(Visit.visited_at, start_date, end_date)
+        ).order_by(Visit.id).execution_options(stream_results=True, yield_per=batch_size)
+        
+        return (tuple(row) for row in db.execute(statement))
+    
+    @staticmethod
+    def _sum_rollups(db: Session, memorial_ids: List[int],
+                     start_date: date = None, end_date: date = None) -> int:
+        """Sumar visitas agregadas de uno o varios memoriales en un rango de días"""
+        query = db.query(func.coalesce(func.sum(VisitDailyRollup.count), 0)).filter(
+            VisitDailyRollup.memorial_id.in_(memorial_ids)
+        )
+        if start_date:
+            query = query.filter(VisitDailyRollup.day >= start_date)
+        if end_date:
+            query = query.filter(VisitDailyRollup.day <= end_date)
+        return int(query.scalar())
+    
     @staticmethod
     def get_total_count(db: Session, memorial_id: int) -> int:
         """Obtener total de visitas de un memorial"""
-        return db.query(Visit).filter(Visit.memorial_id == memorial_id).count()
+        return VisitRepository._sum_rollups(db, [memorial_id])
     
     @staticmethod
     def get_today_count(db: Session, memorial_id: int) -> int:
         """Obtener visitas de hoy de un memorial"""
         today = datetime.utcnow().date()
-        return db.query(Visit).filter(
-            Visit.memorial_id == memorial_id,
-            cast(Visit.visited_at, Date) == today
-        ).count()
+        return VisitRepository._sum_rollups(db, [memorial_id], start_date=today, end_date=today)
     
     @staticmethod
     def get_week_count(db: Session, memorial_id: int) -> int:
-        """Obtener visitas de la última semana de un memorial"""
-        week_ago = datetime.utcnow() - timedelta(days=7)
-        return db.query(Visit).filter(
-            Visit.memorial_id == memorial_id,
-            Visit.visited_at >= week_ago
-        ).count()
+        """Obtener visitas de la última semana de un memorial (por días completos)"""
+        week_ago = (datetime.utcnow() - timedelta(days=7)).date()
+        return VisitRepository._sum_rollups(db, [memorial_id], start_date=week_ago)
     
     @staticmethod
     def get_month_count(db: Session, memorial_id: int) -> int:
-        """Obtener visitas del último mes de un memorial"""
-        month_ago = datetime.utcnow() - timedelta(days=30)
-        return db.query(Visit).filter(
-            Visit.memorial_id == memorial_id,
-            Visit.visited_at >= month_ago
-        ).count()
+        """Obtener visitas del último mes de un memorial (por días completos)"""
+        month_ago = (datetime.utcnow() - timedelta(days=30)).date()
+        return VisitRepository._sum_rollups(db, [memorial_id], start_date=month_ago)
     
     @staticmethod
     def get_daily_stats(db: Session, memorial_id: int, days: int = 30,
                         start_date: date = None, end_date: date = None) -> List[dict]:
         """Obtener estadísticas diarias de visitas con filtros opcionales"""
         query = db.query(
-            cast(Visit.visited_at, Date).label('date'),
-            func.count(Visit.id).label('count')
-        ).filter(Visit.memorial_id == memorial_id)
+            VisitDailyRollup.day, VisitDailyRollup.count, VisitDailyRollup.unique_visitors
+        ).filter(
+            VisitDailyRollup.memorial_id == memorial_id,
+            VisitDailyRollup.count > 0
+        )
         
         if start_date and end_date:
             query = query.filter(
-                cast(Visit.visited_at, Date) >= start_date,
-                cast(Visit.visited_at, Date) <= end_date
+                VisitDailyRollup.day >= start_date,
+                VisitDailyRollup.day <= end_date
             )
         else:
-            cutoff = datetime.utcnow() - timedelta(days=days)
-            query = query.filter(Visit.visited_at >= cutoff)
+            cutoff = (datetime.utcnow() - timedelta(days=days)).date()
+            query = query.filter(VisitDailyRollup.day >= cutoff)
         
-        results = query.group_by(
-            cast(Visit.visited_at, Date)
-        ).order_by(
-            cast(Visit.visited_at, Date)
-        ).all()
+        results = query.order_by(VisitDailyRollup.day).all()
         
-        return [{"date": str(r.date), "count": r.count} for r in results]
+        return [
+            {"date": str(r.day), "count": r.count, "unique_visitors": r.unique_visitors}
+            for r in results
+        ]
     
     @staticmethod
     def get_count_filtered(db: Session, memorial_id: int, 
                           start_date: date = None, end_date: date = None) -> int:
         """Obtener conteo de visitas con filtros de fecha"""
-        query = db.query(Visit).filter(Visit.memorial_id == memorial_id)
-        
-        if start_date:
-            query = query.filter(cast(Visit.visited_at, Date) >= start_date)
-        if end_date:
-            query = query.filter(cast(Visit.visited_at, Date) <= end_date)
-        
-        return query.count()
+        return VisitRepository._sum_rollups(db, [memorial_id], start_date, end_date)
     
     @staticmethod
     def get_total_visits_for_user(db: Session, memorial_ids: List[int],
@@ -112,53 +201,366 @@ class VisitRepository:
         if not memorial_ids:
             return 0
         
-        query = db.query(Visit).filter(Visit.memorial_id.in_(memorial_ids))
+        return VisitRepository._sum_rollups(db, memorial_ids, start_date, end_date)
+    
+    @staticmethod
+    def get_totals_by_memorial(db: Session, memorial_ids: List[int],
+                               start_date: date = None, end_date: date = None) -> Dict[int, int]:
+        """Total de visitas por memorial en una sola consulta agrupada"""
+        if not memorial_ids:
+            return {}
         
+        query = db.query(
+            VisitDailyRollup.memorial_id,
+            func.sum(VisitDailyRollup.count).label('count')
+        ).filter(VisitDailyRollup.memorial_id.in_(memorial_ids))
         if start_date:
-            query = query.filter(cast(Visit.visited_at, Date) >= start_date)
+            query = query.filter(VisitDailyRollup.day >= start_date)
         if end_date:
-            query = query.filter(cast(Visit.visited_at, Date) <= end_date)
+            query = query.filter(VisitDailyRollup.day <= end_date)
         
-        return query.count()
+        return {r.memorial_id: int(r.count) for r in query.group_by(VisitDailyRollup.memorial_id)}
     
     @staticmethod
-    def get_location_stats(db: Session, memorial_id: int) -> List[dict]:
-        """Obtener estadísticas de ubicación de visitantes"""
-        results = db.query(
-            Visit.country,
-            Visit.city,
-            func.count(Visit.id).label('count')
+    def get_daily_counts_by_memorial(db: Session, memorial_ids: List[int], start_date: date,
+                                     end_date: date = None) -> Dict[int, List[Tuple[date, int, int]]]:
+        """
+        Visitas diarias de varios memoriales en una sola consulta
+        
+        Returns:
+            Tuplas (día, visitas, visitantes únicos) ordenadas por día, agrupadas por memorial
+        """
+        if not memorial_ids:
+            return {}
+        
+        query = db.query(
+            VisitDailyRollup.memorial_id,
+            VisitDailyRollup.day,
+            VisitDailyRollup.count,
+            VisitDailyRollup.unique_visitors
         ).filter(
-            Visit.memorial_id == memorial_id,
-            Visit.country.isnot(None)
-        ).group_by(
-            Visit.country,
-            Visit.city
-        ).order_by(
-            func.count(Visit.id).desc()
-        ).limit(20).all()
+            VisitDailyRollup.memorial_id.in_(memorial_ids),
+            VisitDailyRollup.day >= start_date,
+            VisitDailyRollup.count > 0
+        )
+        if end_date:
+            query = query.filter(VisitDailyRollup.day <= end_date)
         
-        return [
-            {"country": r.country, "city": r.city, "count": r.count} 
-            for r in results
-        ]
+        daily: Dict[int, List[Tuple[date, int, int]]] = {}
+        for r in query.order_by(VisitDailyRollup.memorial_id, VisitDailyRollup.day):
+            daily.setdefault(r.memorial_id, []).append((r.day, r.count, r.unique_visitors))
+        return daily
     
     @staticmethod
-    def get_country_stats(db: Session, memorial_ids: List[int]) -> List[dict]:
-        """Obtener estadísticas por país para múltiples memoriales"""
+    def get_unique_visitors_by_memorial(db: Session, memorial_ids: List[int],
+                                        start_date: date = None, end_date: date = None) -> Dict[int, int]:
+        """
+        Visitantes únicos estimados por memorial en un rango de días
+        
+        Une los sketches HyperLogLog diarios del rango; el coste depende
+        del número de días con visitas, no del número de visitas.
+        """
         if not memorial_ids:
-            return []
+            return {}
+        
+        query = db.query(VisitDailyRollup.memorial_id, VisitDailyRollup.visitor_sketch).filter(
+            VisitDailyRollup.memorial_id.in_(memorial_ids),
+            VisitDailyRollup.visitor_sketch.isnot(None)
+        )
+        if start_date:
+            query = query.filter(VisitDailyRollup.day >= start_date)
+        if end_date:
+            query = query.filter(VisitDailyRollup.day <= end_date)
+        
+        sketches: Dict[int, List[bytes]] = {}
+        for r in query:
+            sketches.setdefault(r.memorial_id, []).append(r.visitor_sketch)
+        return {
+            memorial_id: HyperLogLog.union(day_sketches).count()
+            for memorial_id, day_sketches in sketches.items()
+        }
+    
+    @staticmethod
+    def get_unique_count(db: Session, memorial_id: int,
+                         start_date: date = None, end_date: date = None) -> int:
+        """Obtener visitantes únicos estimados de un memorial en un rango de días"""
+        return VisitRepository.get_unique_visitors_by_memorial(
+            db, [memorial_id], start_date, end_date
+        ).get(memorial_id, 0)
+    
+    @staticmethod
+    def visitor_key(ip_address: Optional[str], user_agent: Optional[str]) -> Optional[str]:
+        """Identificador aproximado de visitante (None si no hay datos)"""
+        if not ip_address and not user_agent:
+            return None
+        return f"{ip_address or ''}|{user_agent or ''}"
+    
+    @staticmethod
+    def _bump_rollups(db: Session, visits: List[Tuple[int, datetime, Optional[str]]]) -> None:
+        """
+        Sumar visitas nuevas a los agregados diarios (sin confirmar)
+        
+        Incrementa los conteos y añade los visitantes a los sketches
+        HyperLogLog del día. El upsert de conteos bloquea primero las filas,
+        así que la lectura y escritura de sketches no se pisa con otra
+        transacción concurrente.
+        
+        Args:
+            db: Sesión de base de datos
+            visits: Tuplas (memorial_id, visited_at, clave de visitante) recién insertadas
+        """
+        counts = Counter((memorial_id, visited_at.date()) for memorial_id, visited_at, _ in visits)
+        if not counts:
+            return
+        
+        rollups = VisitDailyRollup.__table__
+        stmt = dialect_insert(db, rollups)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[rollups.c.memorial_id, rollups.c.day],
+            set_={"count": rollups.c.count + stmt.excluded.count}
+        )
+        # Mismo orden de bloqueo que compact_rollups (memorial, día)
+        db.execute(stmt, [
+            {"memorial_id": memorial_id, "day": day, "count": count, "unique_visitors": 0}
+            for (memorial_id, day), count in sorted(counts.items(), key=lambda item: (item[0][0] or 0, item[0][1]))
+        ])
+        
+        visitors: Dict[Tuple[int, date], set] = {}
+        for memorial_id, visited_at, key in visits:
+            if key:
+                visitors.setdefault((memorial_id, visited_at.date()), set()).add(key)
+        if not visitors:
+            return
+        
+        existing = db.execute(
+            select(rollups.c.memorial_id, rollups.c.day, rollups.c.visitor_sketch).where(
+                rollups.c.memorial_id.in_({memorial_id for memorial_id, _ in visitors}),
+                rollups.c.day.in_({day for _, day in visitors})
+            ).with_for_update()
+        )
+        sketches = {(r.memorial_id, r.day): r.visitor_sketch for r in existing}
+        
+        params = []
+        for (memorial_id, day), keys in visitors.items():
+            current = sketches.get((memorial_id, day))
+            sketch = HyperLogLog.from_bytes(current) if current else HyperLogLog()
+            sketch.update(keys)
+            params.append({
+                "b_memorial_id": memorial_id,
+                "b_day": day,
+                "b_sketch": sketch.to_bytes(),
+                "b_unique": sketch.count(),
+            })
+        db.execute(
+            update(rollups).where(
+                rollups.c.memorial_id == bindparam("b_memorial_id"),
+                rollups.c.day == bindparam("b_day")
+            ).values(visitor_sketch=bindparam("b_sketch"), unique_visitors=bindparam("b_unique")),
+            params
+        )
+    
+    @staticmethod
+    def _bump_locations(db: Session, visits: List[Tuple[int, datetime, str, Optional[str]]]) -> None:
+        """
+        Sumar visitas geolocalizadas al agregado de ubicaciones (sin confirmar)
+        
+        Args:
+            db: Sesión de base de datos
+            visits: Tuplas (memorial_id, visited_at, país, ciudad)
+        """
+        counts = Counter(
+            (memorial_id, visited_at.date(), country, city or "")
+            for memorial_id, visited_at, country, city in visits
+        )
+        if not counts:
+            return
+        
+        locations = VisitLocationRollup.__table__
+        stmt = dialect_insert(db, locations)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[locations.c.memorial_id, locations.c.day, locations.c.country, locations.c.city],
+            set_={"count": locations.c.count + stmt.excluded.count}
+        )
+        db.execute(stmt, [
+            {"memorial_id": memorial_id, "day": day, "country": country, "city": city, "count": count}
+            for (memorial_id, day, country, city), count in counts.items()
+        ])
+    
+    @staticmethod
+    def has_rollups(db: Session) -> bool:
+        """Indicar si ya existen agregados diarios"""
+        return db.query(VisitDailyRollup.memorial_id).first() is not None
+    
+    @staticmethod
+    def compact_rollups(db: Session, since: Optional[date] = None) -> int:
+        """
+        Recalcular agregados diarios a partir de las visitas
+        
+        Corrige los conteos y reconstruye los sketches de visitantes únicos
+        y el agregado de ubicaciones de los días desde since, o de todo el
+        historial si no se indica.
+        Las visitas se recorren en streaming, memorial a memorial, para que
+        la memoria no dependa del tamaño del historial.
         
-        results = db.query(
-            Visit.country,
+        Los agregados existentes de la ventana se bloquean (FOR UPDATE) antes
+        de contar: una ingesta concurrente espera y suma su incremento tras
+        el commit, en lugar de perderlo al sobrescribir el conteo. Los
+        agregados que una ingesta crea durante la pasada no se sobrescriben
+        (ya llevan sus visitas); la siguiente pasada los revisa.
+        
+        Args:
+            db: Sesión de base de datos
+            since: Primer día a recalcular
+            
+        Returns:
+            Número de agregados (memorial, día) escritos
+        """
+        rollups = VisitDailyRollup.__table__
+        window = select(rollups.c.memorial_id, rollups.c.day)
+        if since:
+            window = window.where(rollups.c.day >= since)
+        locked = set(db.execute(
+            window.order_by(rollups.c.memorial_id, rollups.c.day).with_for_update()
+        ).tuples())
+        
+        day = func.date(Visit.visited_at)
+        query = db.query(
+            Visit.memorial_id,
+            day.label('day'),
             func.count(Visit.id).label('count')
-        ).filter(
-            Visit.memorial_id.in_(memorial_ids),
-            Visit.country.isnot(None)
-        ).group_by(
-            Visit.country
-        ).order_by(
-            func.count(Visit.id).desc()
-        ).limit(10).all()
-        
-        return [{"country": r.country, "count": r.count} for r in results]
+        )
+        query = query.filter(*date_range(Visit.visited_at, since))
+        counts: Dict[int, Dict[date, int]] = {}
+        for r in query.group_by(Visit.memorial_id, day).all():
+            r_day = r.day if isinstance(r.day, date) else date.fromisoformat(str(r.day))
+            counts.setdefault(r.memorial_id, {})[r_day] = r.count
+        if not counts:
+            db.commit()
+            return 0
+        
+        stmt = dialect_insert(db, rollups)
+        overwrite = stmt.on_conflict_do_update(
+            index_elements=[rollups.c.memorial_id, rollups.c.day],
+            set_={
+                "count": stmt.excluded.count,
+                "unique_visitors": stmt.excluded.unique_visitors,
+                "visitor_sketch": stmt.excluded.visitor_sketch,
+            }
+        )
+        insert_new = stmt.on_conflict_do_nothing(index_elements=[rollups.c.memorial_id, rollups.c.day])
+        
+        def write(memorial_id: int, sketches: Dict[date, HyperLogLog]) -> None:
+            rows = [
+                {
+                    "memorial_id": memorial_id,
+                    "day": visit_day,
+                    "count": count,
+                    "unique_visitors": sketches[visit_day].count() if visit_day in sketches else 0,
+                    "visitor_sketch": sketches[visit_day].to_bytes() if visit_day in sketches else None,
+                }
+                for visit_day, count in counts.pop(memorial_id).items()
+            ]
+            existing = [row for row in rows if (memorial_id, row["day"]) in locked]
+            new = [row for row in rows if (memorial_id, row["day"]) not in locked]
+            if existing:
+                db.execute(overwrite, existing)
+            if new:
+                db.execute(insert_new, new)
+        
+        visitors = select(
+            Visit.memorial_id, Visit.visited_at, Visit.ip_address, Visit.user_agent
+        ).where(
+            *date_range(Visit.visited_at, since)
+        ).order_by(Visit.memorial_id, Visit.visited_at).execution_options(
+            stream_results=True, yield_per=5000
+        )
+        
+        written = 0
+        current, sketches = None, {}
+        for memorial_id, visited_at, ip_address, user_agent in db.execute(visitors):
+            if memorial_id != current:
+                if current in counts:
+                    written += len(counts[current])
+                    write(current, sketches)
+                current, sketches = memorial_id, {}
+            key = VisitRepository.visitor_key(ip_address, user_agent)
+            if key:
+                sketches.setdefault(visited_at.date(), HyperLogLog()).add(key)
+        if current in counts:
+            written += len(counts[current])
+            write(current, sketches)
+        
+        # Memoriales cuyas visitas se borraron entre ambas lecturas
+        for memorial_id in list(counts):
+            written += len(counts[memorial_id])
+            write(memorial_id, {})
+        
+        # El histórico lo rellena la migración visit_location_rollups_backfill
+        VisitRepository._rebuild_locations(db, since)
+        db.commit()
+        return written
+    
+    @staticmethod
+    def _rebuild_locations(db: Session, since: Optional[date] = None) -> None:
+        """Recalcular el agregado de ubicaciones desde since (sin confirmar)"""
+        locations = VisitLocationRollup.__table__
+        cleanup = delete(locations)
+        if since:
+            cleanup = cleanup.where(locations.c.day >= since)
+        db.execute(cleanup)
+        
+        day = func.date(Visit.visited_at)
+        city = func.coalesce(Visit.city, "")
+        grouped = select(
+            Visit.memorial_id, day, Visit.country, city, func.count(Visit.id)
+        ).where(
+            Visit.country.isnot(None),
+            *date_range(Visit.visited_at, since)
+        ).group_by(Visit.memorial_id, day, Visit.country, city)
+        db.execute(insert(locations).from_select(
+            ["memorial_id", "day", "country", "city", "count"], grouped
+        ))
+    
+    @staticmethod
+    def _top_locations(db: Session, memorial_ids: List[int], by_city: bool,
+                       start_date: date = None, end_date: date = None, limit: int = 20) -> List[dict]:
+        """Ubicaciones con más visitas a partir del agregado de ubicaciones"""
+        if not memorial_ids:
+            return []
+        
+        total = func.sum(VisitLocationRollup.count).label('count')
+        group = [VisitLocationRollup.country]
+        if by_city:
+            group.append(VisitLocationRollup.city)
+        
+        query = db.query(*group, total).filter(VisitLocationRollup.memorial_id.in_(memorial_ids))
+        if start_date:
+            query = query.filter(VisitLocationRollup.day >= start_date)
+        if end_date:
+            query = query.filter(VisitLocationRollup.day <= end_date)
+        results = query.group_by(*group).order_by(total.desc(), *group).limit(limit).all()
+        
+        if by_city:
+            return [
+                {"country": r.country, "city": r.city or None, "count": int(r.count)}
+                for r in results
+            ]
+        return [{"country": r.country, "count": int(r.count)} for r in results]
+    
+    @staticmethod
+    def get_location_stats(db: Session, memorial_id: int,
+                           start_date: date = None, end_date: date = None) -> List[dict]:
+        """Obtener estadísticas de ubicación de visitantes"""
+        return VisitRepository._top_locations(db, [memorial_id], True, start_date, end_date, limit=20)
+    
+    @staticmethod
+    def get_city_stats(db: Session, memorial_ids: List[int],
+                       start_date: date = None, end_date: date = None) -> List[dict]:
+        """Obtener estadísticas por país y ciudad para múltiples memoriales"""
+        return VisitRepository._top_locations(db, memorial_ids, True, start_date, end_date, limit=20)
+    
+    @staticmethod
+    def get_country_stats(db: Session, memorial_ids: List[int],
+                          start_date: date = None, end_date: date = None) -> List[dict]:
+        """Obtener estadísticas por país para múltiples memoriales"""
+        return VisitRepository._top_locations(db, memorial_ids, False, start_date, end_date, limit=10)
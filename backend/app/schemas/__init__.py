@@ -1,10 +1,13 @@
 """Schemas package"""
 from app.schemas.user import UserBase, UserCreate, UserResponse
-from app.schemas.memorial import MemorialBase, MemorialCreate, MemorialUpdate, MemorialResponse, PublicMemorial
+from app.schemas.memorial import (
+    MemorialBase, MemorialCreate, MemorialUpdate, MemorialResponse, PublicMemorial,
+    QRExportRequest
+)
 from app.schemas.token import Token, TokenData
 from app.schemas.analytics import (
     VisitCreate, VisitResponse, VisitStats, DailyVisitStat,
-    MemorialAnalytics, DashboardAnalytics,
+    MemorialAnalytics, MemorialAnalyticsSummary, DashboardAnalytics, DashboardPage,
     ReactionCreate, ReactionResponse, ReactionCount, MemorialReactions
 )
 from app.schemas.condolence import (
@@ -23,9 +26,10 @@ from app.schemas.media import (
 __all__ = [
     "UserBase", "UserCreate", "UserResponse",
     "MemorialBase", "MemorialCreate", "MemorialUpdate", "MemorialResponse", "PublicMemorial",
+    "QRExportRequest",
     "Token", "TokenData",
     "VisitCreate", "VisitResponse", "VisitStats", "DailyVisitStat",
-    "MemorialAnalytics", "DashboardAnalytics",
+    "MemorialAnalytics", "MemorialAnalyticsSummary", "DashboardAnalytics", "DashboardPage",
     "ReactionCreate", "ReactionResponse", "ReactionCount", "MemorialReactions",
     "CondolenceBase", "CondolenceCreate", "CondolenceUpdate",
     "CondolenceResponse", "CondolencePublic", "CondolenceListResponse",
@@ -3,7 +3,7 @@ Schemas de Visitas y Reacciones
 """
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Union
 
 
 # ============ VISITAS ============
@@ -33,12 +33,14 @@ class VisitStats(BaseModel):
     today_visits: int
     week_visits: int
     month_visits: int
+    unique_visitors: int = 0  # Estimado (HyperLogLog) en el rango filtrado o los últimos 30 días
 
 
 class DailyVisitStat(BaseModel):
     """Estadística diaria"""
     date: str
     count: int
+    unique_visitors: int = 0
 
 
 class MemorialAnalytics(BaseModel):
@@ -51,6 +53,15 @@ class MemorialAnalytics(BaseModel):
     reactions_count: dict
 
 
+class MemorialAnalyticsSummary(BaseModel):
+    """Totales de un memorial, sin serie diaria"""
+    memorial_id: int
+    memorial_name: str
+    memorial_slug: str
+    stats: VisitStats
+    reactions_count: dict
+
+
 class DashboardAnalytics(BaseModel):
     """Analytics del dashboard general"""
     total_memorials: int
@@ -59,6 +70,12 @@ class DashboardAnalytics(BaseModel):
     memorials_analytics: List[MemorialAnalytics]
 
 
+class DashboardPage(BaseModel):
+    """Página del dashboard (paginación por cursor)"""
+    items: List[Union[MemorialAnalytics, MemorialAnalyticsSummary]]
+    next_cursor: Optional[str] = None
+
+
 # ============ REACCIONES ============
 
 class ReactionCreate(BaseModel):
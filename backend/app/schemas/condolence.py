@@ -55,3 +55,4 @@ class CondolenceListResponse(BaseModel):
     items: List[CondolencePublic]
     total: int
     pending_count: int = 0  # Solo para propietarios
+    next_cursor: Optional[str] = None  # Cursor de la página siguiente (listado público)
@@ -1,9 +1,9 @@
 """
 Schemas de Memorial
 """
-from pydantic import BaseModel, field_serializer
+from pydantic import BaseModel, Field, field_serializer
 from datetime import datetime
-from typing import Optional
+from typing import Optional, List, Literal
 from app.config import settings
 
 
@@ -66,3 +66,11 @@ class PublicMemorial(BaseModel):
     
     class Config:
         from_attributes = True
+
+
+class QRExportRequest(BaseModel):
+    """Schema para exportación masiva de QR"""
+    slugs: Optional[List[str]] = None  # None = todos los memoriales del usuario
+    format: Literal["zip", "pdf"] = "zip"
+    per_page: int = Field(6, ge=1, le=20)  # Solo para PDF
+    with_photo: bool = False
@@ -7,8 +7,13 @@ from app.services.condolence import CondolenceService
 from app.services.timeline import TimelineService
 from app.services.gallery import GalleryService
 from app.services.geo import GeoService
+from app.services.qr_export import QRExportService
+from app.services.qr_artifacts import QRArtifactService
+from app.services.visit_export import VisitExportService
+from app.services.live import LiveService
 
 __all__ = [
     "AuthService", "MemorialService", "QRService", "AnalyticsService",
-    "CondolenceService", "TimelineService", "GalleryService", "GeoService"
+    "CondolenceService", "TimelineService", "GalleryService", "GeoService",
+    "QRExportService", "QRArtifactService", "VisitExportService", "LiveService"
 ]
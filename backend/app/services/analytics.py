@@ -1,14 +1,19 @@
 """
 Servicio de Analytics - Lógica de negocio para visitas y reacciones
 """
-from typing import List, Optional
-from datetime import date
+from typing import List, Optional, Tuple, Union
+from datetime import date, datetime, timedelta
+from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
+from app.core.pagination import encode_cursor, decode_cursor
 from app.repositories import MemorialRepository, VisitRepository, ReactionRepository
 from app.schemas import (
-    VisitStats, DailyVisitStat, MemorialAnalytics, DashboardAnalytics,
-    ReactionCount, MemorialReactions
+    VisitStats, DailyVisitStat, MemorialAnalytics, MemorialAnalyticsSummary,
+    DashboardAnalytics, DashboardPage, ReactionCount, MemorialReactions
 )
+from app.services.visit_counters import visit_counters
+from app.services.reaction_counters import reaction_counter_cache
+from app.services.live import LiveService
 
 
 class AnalyticsService:
@@ -17,40 +22,70 @@ class AnalyticsService:
     @staticmethod
     async def register_visit_async(db: Session, memorial_id: int, ip_address: str = None,
                                     user_agent: str = None, referrer: str = None):
-        """Registrar una nueva visita con geolocalización asíncrona"""
-        from app.services.geo import GeoService
+        """
+        Registrar una nueva visita y geolocalizarla en segundo plano
         
-        # Obtener geolocalización
-        country = None
-        city = None
+        La visita se inserta sin ubicación; país y ciudad los completa
+        el worker de enriquecimiento, sin retrasar la respuesta.
+        """
+        from app.services.geo_enrichment import geo_enrichment_worker
         
+        visit = VisitRepository.create(db, memorial_id, ip_address, user_agent, referrer)
+        visit_counters.record([(memorial_id, visit.visited_at)])
         if ip_address:
-            try:
-                location = await GeoService.get_location(ip_address)
-                country = location.country
-                city = location.city
-            except Exception as e:
-                print(f"Error en geolocalización: {e}")
-        
-        return VisitRepository.create(
-            db, memorial_id, ip_address, user_agent, referrer,
-            country=country, city=city
-        )
+            geo_enrichment_worker.enqueue(visit.id, ip_address)
+        return visit
+    
+    @staticmethod
+    async def queue_visit(db: Session, memorial_id: int, ip_address: str = None,
+                          user_agent: str = None, referrer: str = None) -> Optional[str]:
+        """
+        Aceptar una visita para inserción por lotes
+        
+        Antes de encolarla se descartan bots y visitas repetidas del mismo
+        visitante. Si el buffer de ingesta no está activo (p. ej. fuera del
+        ciclo de vida de la aplicación) la visita se inserta directamente.
+        
+        Returns:
+            None si la visita se registró, o el motivo por el que se descartó
+        """
+        from app.services.visit_filter import visit_filter
+        from app.services.visit_ingest import visit_ingest_buffer
+        
+        reason = visit_filter.check(memorial_id, ip_address, user_agent)
+        if reason:
+            return reason
+        
+        if visit_ingest_buffer.running:
+            visit_ingest_buffer.submit(memorial_id, ip_address, user_agent, referrer)
+        else:
+            await AnalyticsService.register_visit_async(db, memorial_id, ip_address, user_agent, referrer)
+        return None
     
     @staticmethod
     def register_visit(db: Session, memorial_id: int, ip_address: str = None,
                        user_agent: str = None, referrer: str = None):
         """Registrar una nueva visita (versión síncrona sin geo)"""
-        return VisitRepository.create(db, memorial_id, ip_address, user_agent, referrer)
+        visit = VisitRepository.create(db, memorial_id, ip_address, user_agent, referrer)
+        visit_counters.record([(memorial_id, visit.visited_at)])
+        return visit
     
     @staticmethod
     def get_memorial_stats(db: Session, memorial_id: int) -> VisitStats:
-        """Obtener estadísticas de visitas de un memorial"""
+        """
+        Obtener estadísticas de visitas de un memorial
+        
+        Hoy, semana y mes salen de los contadores en memoria; solo el
+        total y los visitantes únicos consultan la base de datos.
+        """
+        month_ago = (datetime.utcnow() - timedelta(days=30)).date()
+        today_visits, week_visits, month_visits = visit_counters.get(db, memorial_id)
         return VisitStats(
             total_visits=VisitRepository.get_total_count(db, memorial_id),
-            today_visits=VisitRepository.get_today_count(db, memorial_id),
-            week_visits=VisitRepository.get_week_count(db, memorial_id),
-            month_visits=VisitRepository.get_month_count(db, memorial_id)
+            today_visits=today_visits,
+            week_visits=week_visits,
+            month_visits=month_visits,
+            unique_visitors=VisitRepository.get_unique_count(db, memorial_id, start_date=month_ago)
         )
     
     @staticmethod
@@ -73,86 +108,199 @@ class AnalyticsService:
     @staticmethod
     def get_dashboard_analytics(db: Session, user_id: int, 
                                 start_date: date = None, end_date: date = None) -> DashboardAnalytics:
-        """Obtener analytics del dashboard para un usuario con filtros opcionales"""
+        """
+        Obtener analytics del dashboard para un usuario con filtros opcionales
+        
+        Todas las métricas se calculan con unas pocas consultas agrupadas
+        por memorial, independientemente del número de memoriales.
+        """
         # Obtener memoriales del usuario
         memorials = MemorialRepository.get_by_user(db, user_id)
-        memorial_ids = [m.id for m in memorials]
         
-        # Obtener totales (con filtros si aplican)
-        total_visits = VisitRepository.get_total_visits_for_user(
-            db, memorial_ids, start_date=start_date, end_date=end_date
-        )
-        total_reactions = ReactionRepository.get_total_reactions_for_user(
-            db, memorial_ids, start_date=start_date, end_date=end_date
+        memorials_analytics = AnalyticsService._build_memorials_analytics(
+            db, [(m.id, m.name, m.slug) for m in memorials],
+            start_date=start_date, end_date=end_date
         )
         
-        # Obtener analytics por memorial
-        memorials_analytics = []
-        for memorial in memorials:
-            analytics = AnalyticsService.get_memorial_analytics_filtered(
-                db, memorial.id, memorial.name, memorial.slug,
-                start_date=start_date, end_date=end_date
-            )
-            memorials_analytics.append(analytics)
-        
         return DashboardAnalytics(
             total_memorials=len(memorials),
-            total_visits=total_visits,
-            total_reactions=total_reactions,
+            total_visits=sum(a.stats.total_visits for a in memorials_analytics),
+            total_reactions=sum(sum(a.reactions_count.values()) for a in memorials_analytics),
             memorials_analytics=memorials_analytics
         )
     
+    @staticmethod
+    def get_dashboard_page(db: Session, user_id: int, sort: str = "visits", fields: str = "totals",
+                           limit: int = 20, cursor: Optional[str] = None,
+                           start_date: date = None, end_date: date = None) -> DashboardPage:
+        """
+        Obtener una página del dashboard ordenada por visitas o actividad
+        
+        Args:
+            db: Sesión de base de datos
+            user_id: ID del usuario
+            sort: "visits" (más visitados) o "activity" (actividad más reciente)
+            fields: "totals" (solo totales) o "daily" (incluye serie diaria)
+            limit: Memoriales por página
+            cursor: Cursor devuelto por la página anterior
+            start_date: Inicio del filtro (opcional)
+            end_date: Fin del filtro (opcional)
+            
+        Returns:
+            Página de analytics y cursor de la siguiente (None si es la última)
+            
+        Raises:
+            HTTPException: 400 si el cursor no es válido para este orden
+        """
+        after = None
+        if cursor:
+            try:
+                payload = decode_cursor(cursor)
+                if payload.get("sort") != sort:
+                    raise ValueError("El cursor corresponde a otro orden")
+                value = payload["value"]
+                value = date.fromisoformat(value) if sort == "activity" else int(value)
+                after = (value, int(payload["id"]))
+            except (KeyError, TypeError, ValueError):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Cursor no válido"
+                )
+        
+        # Una fila extra indica si existe una página siguiente
+        rows = MemorialRepository.get_page_by_user(
+            db, user_id, sort=sort, limit=limit + 1, after=after,
+            start_date=start_date, end_date=end_date
+        )
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        items = AnalyticsService._build_memorials_analytics(
+            db, [(memorial_id, name, slug) for memorial_id, name, slug, _ in rows],
+            start_date=start_date, end_date=end_date, include_daily=(fields == "daily")
+        )
+        
+        next_cursor = None
+        if has_more:
+            memorial_id, _, _, value = rows[-1]
+            next_cursor = encode_cursor({"sort": sort, "value": value, "id": memorial_id})
+        
+        return DashboardPage(items=items, next_cursor=next_cursor)
+    
     @staticmethod
     def get_memorial_analytics_filtered(db: Session, memorial_id: int, memorial_name: str,
                                         memorial_slug: str, start_date: date = None, 
                                         end_date: date = None) -> MemorialAnalytics:
         """Obtener analytics de un memorial con filtros de fecha"""
-        # Stats con filtros
-        stats = VisitStats(
-            total_visits=VisitRepository.get_count_filtered(db, memorial_id, start_date, end_date),
-            today_visits=VisitRepository.get_today_count(db, memorial_id),
-            week_visits=VisitRepository.get_week_count(db, memorial_id),
-            month_visits=VisitRepository.get_month_count(db, memorial_id)
-        )
+        return AnalyticsService._build_memorials_analytics(
+            db, [(memorial_id, memorial_name, memorial_slug)],
+            start_date=start_date, end_date=end_date
+        )[0]
+    
+    @staticmethod
+    def _build_memorials_analytics(db: Session, memorials: List[Tuple[int, str, str]],
+                                   start_date: date = None, end_date: date = None,
+                                   include_daily: bool = True
+                                   ) -> List[Union[MemorialAnalytics, MemorialAnalyticsSummary]]:
+        """
+        Calcular analytics de varios memoriales en bloque
+        
+        Usa cuatro consultas (total filtrado, visitas diarias recientes,
+        sketches de visitantes únicos y reacciones por tipo) y arma cada
+        respuesta en memoria.
         
-        # Calcular días para el gráfico
-        if start_date and end_date:
-            days = (end_date - start_date).days + 1
-            days = min(days, 90)  # Máximo 90 días
+        Args:
+            db: Sesión de base de datos
+            memorials: Tuplas (id, nombre, slug)
+            start_date: Inicio del filtro (opcional)
+            end_date: Fin del filtro (opcional)
+            include_daily: Incluir la serie diaria (si no, solo totales)
+            
+        Returns:
+            Analytics en el mismo orden que memorials
+        """
+        memorial_ids = [memorial_id for memorial_id, _, _ in memorials]
+        now = datetime.utcnow()
+        today = now.date()
+        week_ago = (now - timedelta(days=7)).date()
+        month_ago = (now - timedelta(days=30)).date()
+        
+        # Rango del gráfico: el filtro indicado o los últimos 30 días
+        if start_date and end_date and include_daily:
+            chart_start, chart_end = start_date, end_date
         else:
-            days = 30
+            chart_start, chart_end = month_ago, None
         
-        daily_visits = VisitRepository.get_daily_stats(
-            db, memorial_id, days=days, start_date=start_date, end_date=end_date
+        totals = VisitRepository.get_totals_by_memorial(db, memorial_ids, start_date, end_date)
+        daily = VisitRepository.get_daily_counts_by_memorial(
+            db, memorial_ids, start_date=min(chart_start, month_ago)
         )
-        reactions_count = ReactionRepository.get_counts_by_memorial(
-            db, memorial_id, start_date=start_date, end_date=end_date
+        unique = VisitRepository.get_unique_visitors_by_memorial(
+            db, memorial_ids, start_date or month_ago, end_date
         )
+        reactions = ReactionRepository.get_counts_by_memorials(db, memorial_ids, start_date, end_date)
         
-        return MemorialAnalytics(
-            memorial_id=memorial_id,
-            memorial_name=memorial_name,
-            memorial_slug=memorial_slug,
-            stats=stats,
-            daily_visits=[DailyVisitStat(**d) for d in daily_visits],
-            reactions_count=reactions_count
-        )
+        results = []
+        for memorial_id, memorial_name, memorial_slug in memorials:
+            days = daily.get(memorial_id, [])
+            stats = VisitStats(
+                total_visits=totals.get(memorial_id, 0),
+                today_visits=sum(count for day, count, _ in days if day == today),
+                week_visits=sum(count for day, count, _ in days if day >= week_ago),
+                month_visits=sum(count for day, count, _ in days if day >= month_ago),
+                unique_visitors=unique.get(memorial_id, 0)
+            )
+            if not include_daily:
+                results.append(MemorialAnalyticsSummary(
+                    memorial_id=memorial_id,
+                    memorial_name=memorial_name,
+                    memorial_slug=memorial_slug,
+                    stats=stats,
+                    reactions_count=reactions[memorial_id]
+                ))
+                continue
+            daily_visits = [
+                DailyVisitStat(date=str(day), count=count, unique_visitors=unique_count)
+                for day, count, unique_count in days
+                if day >= chart_start and (chart_end is None or day <= chart_end)
+            ]
+            results.append(MemorialAnalytics(
+                memorial_id=memorial_id,
+                memorial_name=memorial_name,
+                memorial_slug=memorial_slug,
+                stats=stats,
+                daily_visits=daily_visits,
+                reactions_count=reactions[memorial_id]
+            ))
+        
+        return results
     
     @staticmethod
     def toggle_reaction(db: Session, memorial_id: int, reaction_type: str, 
                         visitor_id: str) -> dict:
-        """Toggle de reacción"""
-        return ReactionRepository.toggle_reaction(db, memorial_id, reaction_type, visitor_id)
+        """
+        Toggle de reacción
+        
+        Returns:
+            Acción, tipo, conteos del memorial (de la caché de contadores)
+            y reacciones actuales del visitante (de su máscara)
+        """
+        result = reaction_counter_cache.toggle(db, memorial_id, reaction_type, visitor_id)
+        delta = result.pop("delta")
+        if delta:
+            # Las páginas abiertas del memorial reciben el cambio sin consultar
+            LiveService.publish_reaction(memorial_id, result, delta)
+        return {**result, "counts": ReactionCount(**result["counts"])}
     
     @staticmethod
     def get_memorial_reactions(db: Session, memorial_id: int, 
                                 visitor_id: str = None) -> MemorialReactions:
-        """Obtener reacciones de un memorial"""
-        counts = ReactionRepository.get_counts_by_memorial(db, memorial_id)
+        """Obtener reacciones de un memorial (conteos y máscara del visitante desde la caché)"""
+        counts = reaction_counter_cache.get(db, memorial_id)
         user_reactions = []
         
         if visitor_id:
-            user_reactions = ReactionRepository.get_user_reactions(db, memorial_id, visitor_id)
+            user_reactions = reaction_counter_cache.get_user_reactions(db, memorial_id, visitor_id)
         
         return MemorialReactions(
             memorial_id=memorial_id,
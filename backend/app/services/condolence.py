@@ -1,12 +1,15 @@
 """
 Servicio de Condolencias - Libro de visitas digital
 """
-from typing import List, Tuple
+from datetime import datetime
+from typing import List, Optional, Tuple
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status
+from app.core.pagination import encode_cursor, decode_cursor
 from app.models import Condolence, Memorial
 from app.repositories import CondolenceRepository, MemorialRepository
 from app.schemas import CondolenceCreate, CondolenceUpdate, CondolenceListResponse, CondolencePublic
+from app.services.live import LiveService
 
 
 class CondolenceService:
@@ -46,20 +49,30 @@ class CondolenceService:
         slug: str, 
         approved_only: bool = True,
         limit: int = 50,
-        offset: int = 0
+        offset: int = 0,
+        cursor: Optional[str] = None
     ) -> CondolenceListResponse:
         """
         Obtener condolencias de un memorial
         
+        El listado público se pagina por keyset: sin offset (o con cursor)
+        devuelve next_cursor para pedir la página siguiente. El offset se
+        mantiene para clientes anteriores y para la vista de moderación.
+        Los totales salen de condolence_counters, no de un COUNT.
+        
         Args:
             db: Sesión de base de datos
             slug: Slug del memorial
             approved_only: Solo aprobadas (para visitantes)
             limit: Límite de resultados
             offset: Desplazamiento
+            cursor: Cursor devuelto por la página anterior (solo aprobadas)
             
         Returns:
             Lista de condolencias
+            
+        Raises:
+            HTTPException: 404 si el memorial no existe, 400 si el cursor no es válido
         """
         memorial = MemorialRepository.get_by_slug(db, slug)
         if not memorial:
@@ -68,6 +81,9 @@ class CondolenceService:
                 detail="Memorial no encontrado"
             )
         
+        if approved_only and (cursor or not offset):
+            return CondolenceService._get_approved_page(db, memorial.id, limit, cursor)
+        
         condolences, total = CondolenceRepository.get_by_memorial(
             db, memorial.id, approved_only, limit, offset
         )
@@ -82,6 +98,45 @@ class CondolenceService:
             pending_count=pending_count
         )
     
+    @staticmethod
+    def _get_approved_page(db: Session, memorial_id: int, limit: int,
+                           cursor: Optional[str]) -> CondolenceListResponse:
+        """Página pública por keyset con el cursor de la siguiente"""
+        after = None
+        if cursor:
+            try:
+                payload = decode_cursor(cursor)
+                after = (
+                    bool(payload["featured"]),
+                    datetime.fromisoformat(payload["created_at"]),
+                    int(payload["id"])
+                )
+            except (KeyError, TypeError, ValueError):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Cursor no válido"
+                )
+        
+        # Una fila extra indica si existe una página siguiente
+        condolences = CondolenceRepository.get_approved_page(db, memorial_id, limit + 1, after)
+        has_more = len(condolences) > limit
+        condolences = condolences[:limit]
+        
+        next_cursor = None
+        if has_more:
+            last = condolences[-1]
+            next_cursor = encode_cursor({
+                "featured": bool(last.is_featured),
+                "created_at": last.created_at.isoformat(),
+                "id": last.id,
+            })
+        
+        return CondolenceListResponse(
+            items=[CondolencePublic.model_validate(c) for c in condolences],
+            total=CondolenceRepository.get_total_by_memorial(db, memorial_id),
+            next_cursor=next_cursor
+        )
+    
     @staticmethod
     def moderate_condolence(
         db: Session, 
@@ -115,7 +170,12 @@ class CondolenceService:
                 detail="No tienes permiso para moderar esta condolencia"
             )
         
-        return CondolenceRepository.update(db, condolence_id, update_data)
+        was_approved = condolence.is_approved
+        updated = CondolenceRepository.update(db, condolence_id, update_data)
+        if updated.is_approved and not was_approved:
+            # Las páginas abiertas del memorial la muestran sin consultar
+            LiveService.publish_condolence(updated)
+        return updated
     
     @staticmethod
     def delete_condolence(db: Session, condolence_id: int, user_id: int) -> bool:
@@ -1,9 +1,20 @@
 """
 Servicio de Geolocalización - Resolución de IP a ubicación
 """
+import time
+import asyncio
+import weakref
+import threading
+import ipaddress
 import httpx
-from typing import Optional, Dict
+from typing import Any, Optional, Dict, Tuple
+from urllib.parse import urlparse
 from dataclasses import dataclass
+from app.config import settings
+from app.core.cache import LRUCache
+from app.core.background_loop import background_loop
+from app.core.circuit_breaker import CircuitBreaker
+from app.services.geo_local import local_geo_db
 
 
 @dataclass
@@ -18,19 +29,42 @@ class GeoLocation:
 
 
 class GeoService:
-    """Servicio de geolocalización usando APIs gratuitas"""
+    """Servicio de geolocalización (base local y APIs gratuitas de respaldo)"""
     
-    # APIs gratuitas de geolocalización (sin API key)
+    # Proveedor local: base de datos de rangos IP (GEO_LOCAL_DB)
+    LOCAL_PROVIDER = "local"
+    
+    # Proveedores en orden: primero la base local, luego APIs gratuitas (sin API key)
     PROVIDERS = [
+        LOCAL_PROVIDER,
         "https://ipapi.co/{ip}/json/",
         "http://ip-api.com/json/{ip}",
     ]
     
+    # Caché IP -> ubicación (solo resultados con país)
+    _cache = LRUCache(settings.GEO_CACHE_MAX_ENTRIES, ttl=settings.GEO_CACHE_TTL)
+    
+    # Consultas en curso por (event loop, IP) para no repetirlas en paralelo
+    _in_flight: Dict[Tuple[asyncio.AbstractEventLoop, str], asyncio.Future] = {}
+    
+    # Cliente HTTP con keep-alive por event loop (vive lo mismo que el loop)
+    _clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+        weakref.WeakKeyDictionary()
+    )
+    
+    # Circuit breaker y métricas por proveedor HTTP
+    _breakers: Dict[str, CircuitBreaker] = {}
+    _provider_stats: Dict[str, Dict[str, float]] = {}
+    _stats_lock = threading.Lock()
+    
     @staticmethod
     async def get_location(ip_address: str) -> GeoLocation:
         """
         Obtener ubicación geográfica de una IP
         
+        Usa la caché en memoria y comparte la consulta si ya hay otra
+        en curso para la misma IP.
+        
         Args:
             ip_address: Dirección IP a geolocalizar
             
@@ -41,13 +75,32 @@ class GeoService:
         if GeoService._is_local_ip(ip_address):
             return GeoLocation()
         
+        cached = GeoService._cache.get(ip_address)
+        if cached is not None:
+            return cached
+        
+        key = (asyncio.get_running_loop(), ip_address)
+        pending = GeoService._in_flight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        
+        future = asyncio.ensure_future(GeoService._resolve(ip_address))
+        GeoService._in_flight[key] = future
+        future.add_done_callback(lambda _: GeoService._in_flight.pop(key, None))
+        return await asyncio.shield(future)
+    
+    @staticmethod
+    async def _resolve(ip_address: str) -> GeoLocation:
+        """Consultar los proveedores y guardar en caché el resultado"""
         # Intentar con cada proveedor
         for provider_url in GeoService.PROVIDERS:
             try:
-                location = await GeoService._query_provider(
-                    provider_url.format(ip=ip_address)
-                )
+                if provider_url == GeoService.LOCAL_PROVIDER:
+                    location = GeoService._query_local(ip_address)
+                else:
+                    location = await GeoService._call_provider(provider_url, ip_address)
                 if location.country:
+                    GeoService._cache.set(ip_address, location)
                     return location
             except Exception as e:
                 print(f"Error con proveedor {provider_url}: {e}")
@@ -55,16 +108,140 @@ class GeoService:
         
         return GeoLocation()
     
+    @staticmethod
+    def _query_local(ip_address: str) -> GeoLocation:
+        """Consultar la base de datos local de rangos IP"""
+        fields = local_geo_db.lookup(ip_address)
+        if fields is None:
+            return GeoLocation()
+        return GeoLocation(
+            country=fields["country"],
+            country_code=fields["country_code"],
+            city=fields["city"],
+            region=fields["region"],
+            latitude=fields["latitude"],
+            longitude=fields["longitude"]
+        )
+    
+    @staticmethod
+    async def _call_provider(provider_url: str, ip_address: str) -> GeoLocation:
+        """
+        Consultar un proveedor HTTP a través de su circuit breaker
+        
+        Con el circuito abierto no se hace la petición y se devuelve una
+        ubicación vacía de inmediato. Un 429 abre el circuito durante el
+        Retry-After indicado por el proveedor.
+        """
+        breaker = GeoService._breaker(provider_url)
+        if not breaker.allow():
+            GeoService._record(provider_url, "short_circuited")
+            return GeoLocation()
+        
+        started = time.perf_counter()
+        try:
+            location = await GeoService._query_provider(provider_url.format(ip=ip_address))
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 429:
+                GeoService._record(provider_url, "rate_limited", started)
+                breaker.trip(GeoService._retry_after(e.response))
+            else:
+                GeoService._record(provider_url, "errors", started)
+                breaker.record_failure()
+            raise
+        except Exception:
+            GeoService._record(provider_url, "errors", started)
+            breaker.record_failure()
+            raise
+        
+        GeoService._record(provider_url, "succeeded", started)
+        breaker.record_success()
+        return location
+    
     @staticmethod
     async def _query_provider(url: str) -> GeoLocation:
         """Consultar un proveedor de geolocalización"""
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Normalizar respuesta según el proveedor
-            return GeoService._normalize_response(data, url)
+        response = await GeoService._get_client().get(url)
+        response.raise_for_status()
+        
+        # Normalizar respuesta según el proveedor
+        return GeoService._normalize_response(response.json(), url)
+    
+    @staticmethod
+    def _get_client() -> httpx.AsyncClient:
+        """Cliente compartido del loop actual (se crea en el primer uso)"""
+        loop = asyncio.get_running_loop()
+        client = GeoService._clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=settings.GEO_TIMEOUT,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+            )
+            GeoService._clients[loop] = client
+        return client
+    
+    @staticmethod
+    async def close() -> None:
+        """Cerrar el cliente del loop actual (al apagar la aplicación)"""
+        client = GeoService._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+    
+    @staticmethod
+    def _breaker(provider_url: str) -> CircuitBreaker:
+        with GeoService._stats_lock:
+            breaker = GeoService._breakers.get(provider_url)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    failure_threshold=settings.GEO_BREAKER_FAILURES,
+                    reset_timeout=settings.GEO_BREAKER_RESET
+                )
+                GeoService._breakers[provider_url] = breaker
+            return breaker
+    
+    @staticmethod
+    def _record(provider_url: str, outcome: str, started: Optional[float] = None) -> None:
+        """Acumular métricas de un proveedor"""
+        with GeoService._stats_lock:
+            stats = GeoService._provider_stats.setdefault(provider_url, {
+                "requests": 0,
+                "succeeded": 0,
+                "errors": 0,
+                "rate_limited": 0,
+                "short_circuited": 0,
+                "latency_ms_total": 0.0,
+            })
+            stats[outcome] += 1
+            if started is not None:
+                stats["requests"] += 1
+                stats["latency_ms_total"] += (time.perf_counter() - started) * 1000
+    
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> Optional[float]:
+        """Segundos indicados en Retry-After (None si no viene o no es numérico)"""
+        try:
+            return float(response.headers.get("retry-after", ""))
+        except ValueError:
+            return None
+    
+    @staticmethod
+    def stats() -> Dict[str, Any]:
+        """Métricas por proveedor: circuito, errores y latencia media"""
+        with GeoService._stats_lock:
+            snapshot = {url: dict(stats) for url, stats in GeoService._provider_stats.items()}
+            breakers = dict(GeoService._breakers)
+        
+        providers = {}
+        for provider_url, breaker in breakers.items():
+            stats = snapshot.get(provider_url, {})
+            requests = stats.get("requests", 0)
+            latency_total = stats.pop("latency_ms_total", 0.0)
+            providers[urlparse(provider_url).netloc] = {
+                **breaker.stats(),
+                **stats,
+                "avg_latency_ms": round(latency_total / requests, 2) if requests else None,
+            }
+        
+        return {"cache_entries": len(GeoService._cache), "providers": providers}
     
     @staticmethod
     def _normalize_response(data: Dict, url: str) -> GeoLocation:
@@ -96,50 +273,50 @@ class GeoService:
     
     @staticmethod
     def _is_local_ip(ip: str) -> bool:
-        """Verificar si es una IP local/privada"""
+        """Verificar si es una IP local/privada (o no es una IP válida)"""
         if not ip:
             return True
         
-        local_prefixes = [
-            "127.",
-            "10.",
-            "172.16.", "172.17.", "172.18.", "172.19.",
-            "172.20.", "172.21.", "172.22.", "172.23.",
-            "172.24.", "172.25.", "172.26.", "172.27.",
-            "172.28.", "172.29.", "172.30.", "172.31.",
-            "192.168.",
-            "::1",
-            "localhost"
-        ]
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            # "localhost", "testclient", etc. no se pueden geolocalizar
+            return True
         
-        return any(ip.startswith(prefix) for prefix in local_prefixes)
+        return not address.is_global
     
     @staticmethod
     def get_location_sync(ip_address: str) -> GeoLocation:
         """
         Versión síncrona de get_location (para uso en contextos no-async)
         
+        La caché y la base local se consultan en el propio hilo; solo las
+        IPs sin resolver pasan al loop de fondo compartido, que reutiliza
+        su cliente HTTP entre llamadas.
+        
         Args:
             ip_address: Dirección IP
             
         Returns:
             Datos de geolocalización
         """
-        import asyncio
+        if GeoService._is_local_ip(ip_address):
+            return GeoLocation()
+        
+        cached = GeoService._cache.get(ip_address)
+        if cached is not None:
+            return cached
+        
+        location = GeoService._query_local(ip_address)
+        if location.country:
+            GeoService._cache.set(ip_address, location)
+            return location
         
         try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # Si ya hay un loop corriendo, crear una tarea
-                import concurrent.futures
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(
-                        asyncio.run, 
-                        GeoService.get_location(ip_address)
-                    )
-                    return future.result(timeout=10)
-            else:
-                return loop.run_until_complete(GeoService.get_location(ip_address))
+            return background_loop.run(
+                GeoService.get_location(ip_address),
+                timeout=settings.GEO_TIMEOUT * len(GeoService.PROVIDERS)
+            )
         except Exception as e:
             print(f"Error en geolocalización sync: {e}")
             return GeoLocation()
@@ -0,0 +1,119 @@
+"""
+Enriquecimiento de visitas - Geolocalización en segundo plano
+La visita se inserta de inmediato y país/ciudad se completan después
+"""
+import asyncio
+from typing import Dict, List, Optional
+from app.config import settings
+from app.db.session import SessionLocal
+from app.repositories import VisitRepository
+from app.services.geo import GeoService
+
+
+class GeoEnrichmentWorker:
+    """
+    Cola acotada de visitas pendientes de geolocalizar
+    
+    Un pequeño grupo de tareas consume la cola en el event loop de la
+    aplicación. Si la cola está llena la visita se queda sin ubicación,
+    pero nunca se retrasa la respuesta al visitante.
+    """
+    
+    def __init__(self, workers: int = 2, max_queue: int = 1000, session_factory=SessionLocal):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.session_factory = session_factory
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stats = {
+            "enqueued": 0,
+            "dropped": 0,
+            "resolved": 0,
+            "unresolved": 0,
+            "failed": 0,
+        }
+    
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+    
+    def start(self) -> None:
+        """Arrancar las tareas consumidoras en el loop actual"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._consume()) for _ in range(self.workers)]
+    
+    async def stop(self) -> None:
+        """Detener las tareas (las visitas pendientes quedan sin ubicación)"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+    
+    def enqueue(self, visit_id: int, ip_address: Optional[str]) -> bool:
+        """
+        Programar la geolocalización de una visita sin esperar
+        
+        Args:
+            visit_id: ID de la visita registrada
+            ip_address: IP del visitante
+        
+        Returns:
+            True si la visita quedó en cola
+        """
+        if not self.running or GeoService._is_local_ip(ip_address):
+            return False
+        try:
+            self._queue.put_nowait((visit_id, ip_address))
+        except asyncio.QueueFull:
+            self._stats["dropped"] += 1
+            return False
+        self._stats["enqueued"] += 1
+        return True
+    
+    async def drain(self) -> None:
+        """Esperar a que se procesen todas las visitas en cola"""
+        if self._queue is not None:
+            await self._queue.join()
+    
+    async def _consume(self) -> None:
+        while True:
+            visit_id, ip_address = await self._queue.get()
+            try:
+                await self.enrich(visit_id, ip_address)
+            except Exception as e:
+                self._stats["failed"] += 1
+                print(f"Error al geolocalizar visita {visit_id}: {e}")
+            finally:
+                self._queue.task_done()
+    
+    async def enrich(self, visit_id: int, ip_address: str) -> bool:
+        """Resolver la ubicación de una visita y guardarla"""
+        location = await GeoService.get_location(ip_address)
+        if not location.country:
+            self._stats["unresolved"] += 1
+            return False
+        
+        db = self.session_factory()
+        try:
+            VisitRepository.update_location(db, visit_id, location.country, location.city)
+        finally:
+            db.close()
+        self._stats["resolved"] += 1
+        return True
+    
+    def stats(self) -> Dict[str, int]:
+        """Métricas de la cola de enriquecimiento"""
+        return {
+            "workers": self.workers if self.running else 0,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            **self._stats,
+        }
+
+
+geo_enrichment_worker = GeoEnrichmentWorker(
+    workers=settings.GEO_WORKERS,
+    max_queue=settings.GEO_QUEUE_SIZE
+)
@@ -0,0 +1,204 @@
+"""
+Geolocalización local - Base de datos de rangos IP en disco
+El archivo compilado se mapea en memoria (mmap) y se comparte entre workers
+
+Compilar un CSV de rangos:
+    python -m app.services.geo_local rangos.csv rangos.bin
+"""
+import os
+import csv
+import sys
+import mmap
+import struct
+import bisect
+import threading
+import ipaddress
+from typing import Dict, Iterator, List, Optional, Tuple
+from app.config import settings
+
+
+class _RecordStarts:
+    """Vista indexable de los inicios de rango para usar con bisect"""
+    
+    def __init__(self, db: "LocalGeoDatabase"):
+        self._db = db
+    
+    def __len__(self) -> int:
+        return self._db.count
+    
+    def __getitem__(self, index: int) -> bytes:
+        offset = self._db.HEADER.size + index * self._db.RECORD.size
+        return self._db._map[offset:offset + 16]
+
+
+class LocalGeoDatabase:
+    """
+    Rangos IP -> ubicación con búsqueda binaria O(log n)
+    
+    Formato binario (little endian salvo las IPs):
+        cabecera: magic (8 bytes), nº de rangos, offset de la tabla de textos
+        rangos:   inicio (16 bytes), fin (16 bytes), offset del texto
+        textos:   longitud (uint16) + campos UTF-8 separados por \\x1f
+    
+    Las IPs se guardan como 16 bytes big endian (IPv4 como ::ffff:a.b.c.d),
+    de modo que comparar bytes equivale a comparar direcciones.
+    """
+    
+    MAGIC = b"MQGEO\x00\x01\x00"
+    HEADER = struct.Struct("<8sII")
+    RECORD = struct.Struct("<16s16sI")
+    FIELDS = ("country_code", "country", "region", "city", "latitude", "longitude")
+    
+    def __init__(self, path: str = ""):
+        self.path = path
+        self.count = 0
+        self._map: Optional[mmap.mmap] = None
+        self._strings_offset = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _pack_ip(ip: str) -> bytes:
+        """Dirección IP como 16 bytes comparables"""
+        address = ipaddress.ip_address(ip)
+        if address.version == 4:
+            address = ipaddress.IPv6Address(f"::ffff:{address}")
+        return address.packed
+    
+    @staticmethod
+    def _read_ranges(csv_path: str) -> Iterator[Tuple[bytes, bytes, str]]:
+        """Leer rangos del CSV (columnas network o start_ip/end_ip)"""
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                if row.get("network"):
+                    network = ipaddress.ip_network(row["network"].strip(), strict=False)
+                    start, end = str(network[0]), str(network[-1])
+                else:
+                    start, end = row["start_ip"].strip(), row["end_ip"].strip()
+                text = "\x1f".join((row.get(field) or "").strip() for field in LocalGeoDatabase.FIELDS)
+                yield LocalGeoDatabase._pack_ip(start), LocalGeoDatabase._pack_ip(end), text
+    
+    @staticmethod
+    def compile_csv(csv_path: str, output_path: str) -> int:
+        """
+        Compilar un CSV de rangos al formato binario
+        
+        Args:
+            csv_path: CSV con columnas network (o start_ip, end_ip) y
+                country_code, country, region, city, latitude, longitude
+            output_path: Archivo binario de salida
+        
+        Returns:
+            Número de rangos escritos
+        """
+        ranges = sorted(LocalGeoDatabase._read_ranges(csv_path))
+        
+        # Los textos repetidos (misma ciudad) se guardan una sola vez
+        strings = bytearray()
+        string_offsets: Dict[str, int] = {}
+        records: List[bytes] = []
+        for start, end, text in ranges:
+            if text not in string_offsets:
+                encoded = text.encode("utf-8")
+                string_offsets[text] = len(strings)
+                strings += struct.pack("<H", len(encoded)) + encoded
+            records.append(LocalGeoDatabase.RECORD.pack(start, end, string_offsets[text]))
+        
+        strings_offset = LocalGeoDatabase.HEADER.size + len(records) * LocalGeoDatabase.RECORD.size
+        tmp_path = f"{output_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(LocalGeoDatabase.HEADER.pack(LocalGeoDatabase.MAGIC, len(records), strings_offset))
+            f.writelines(records)
+            f.write(strings)
+        os.replace(tmp_path, output_path)
+        return len(records)
+    
+    def _load(self) -> None:
+        """Abrir y mapear el archivo (compilando el CSV si hace falta)"""
+        path = self.path
+        if path.endswith(".csv"):
+            compiled = f"{path[:-4]}.bin"
+            if not os.path.exists(compiled) or os.path.getmtime(compiled) < os.path.getmtime(path):
+                self.compile_csv(path, compiled)
+            path = compiled
+        
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        magic, count, strings_offset = self.HEADER.unpack_from(data, 0)
+        if magic != self.MAGIC:
+            data.close()
+            raise ValueError(f"Formato de base de datos IP no reconocido: {path}")
+        
+        self._map = data
+        self.count = count
+        self._strings_offset = strings_offset
+    
+    def _ensure_loaded(self) -> bool:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    if self.path and os.path.exists(self.path):
+                        try:
+                            self._load()
+                        except (OSError, ValueError) as e:
+                            print(f"Error al cargar base de datos IP local: {e}")
+                    self._loaded = True
+        return self._map is not None
+    
+    def lookup(self, ip: str) -> Optional[Dict[str, object]]:
+        """
+        Buscar la ubicación de una IP
+        
+        Args:
+            ip: Dirección IPv4 o IPv6
+        
+        Returns:
+            Campos de ubicación o None si no hay rango que la contenga
+        """
+        if not self._ensure_loaded():
+            return None
+        try:
+            key = self._pack_ip(ip)
+        except ValueError:
+            return None
+        
+        index = bisect.bisect_right(_RecordStarts(self), key) - 1
+        if index < 0:
+            return None
+        
+        _, end, string_offset = self.RECORD.unpack_from(
+            self._map, self.HEADER.size + index * self.RECORD.size
+        )
+        if key > end:
+            return None
+        
+        position = self._strings_offset + string_offset
+        (length,) = struct.unpack_from("<H", self._map, position)
+        text = self._map[position + 2:position + 2 + length].decode("utf-8")
+        values = dict(zip(self.FIELDS, text.split("\x1f")))
+        
+        location: Dict[str, object] = {k: v or None for k, v in values.items()}
+        for field in ("latitude", "longitude"):
+            location[field] = float(values[field]) if values.get(field) else None
+        return location
+    
+    def close(self) -> None:
+        """Liberar el mapeo en memoria"""
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self.count = 0
+            self._loaded = False
+
+
+local_geo_db = LocalGeoDatabase(settings.GEO_LOCAL_DB)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Uso: python -m app.services.geo_local <rangos.csv> <salida.bin>")
+        sys.exit(1)
+    total = LocalGeoDatabase.compile_csv(sys.argv[1], sys.argv[2])
+    print(f"{total} rangos compilados en {sys.argv[2]}")
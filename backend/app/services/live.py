@@ -0,0 +1,134 @@
+"""
+Servicio de actualizaciones en vivo - Reacciones y condolencias por Server-Sent Events
+Cada escritura se publica una vez y se reparte a todas las páginas abiertas del memorial
+"""
+import time
+from typing import AsyncIterator, Dict
+from sqlalchemy.orm import Session
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from app.config import settings
+from app.core.pubsub import live_broker, sse_frame
+from app.models import Condolence
+from app.repositories import MemorialRepository
+from app.schemas import CondolencePublic
+from app.services.reaction_counters import reaction_counter_cache
+
+
+class LiveService:
+    """Publicación y suscripción a los eventos de un memorial"""
+    
+    # Milisegundos que espera el navegador antes de reconectar
+    RETRY_MS = 3000
+    
+    @staticmethod
+    def channel(memorial_id: int) -> str:
+        """Canal de un memorial (por ID: sobrevive a cambios de slug)"""
+        return f"memorial:{memorial_id}"
+    
+    @staticmethod
+    def publish_reaction(memorial_id: int, result: dict, delta: int) -> None:
+        """
+        Publicar el cambio de una reacción
+        
+        Args:
+            memorial_id: ID del memorial
+            result: Resultado del toggle (acción, tipo y conteos)
+            delta: +1 o -1 sobre el conteo del tipo
+        """
+        live_broker.publish(LiveService.channel(memorial_id), sse_frame("reaction", {
+            "reaction_type": result["reaction_type"],
+            "delta": delta,
+            "counts": dict(result["counts"]),
+        }))
+    
+    @staticmethod
+    def publish_condolence(condolence: Condolence) -> None:
+        """Publicar una condolencia recién aprobada"""
+        live_broker.publish(
+            LiveService.channel(condolence.memorial_id),
+            sse_frame("condolence", CondolencePublic.model_validate(condolence).model_dump(mode="json"))
+        )
+    
+    @staticmethod
+    def open_stream(db: Session, slug: str) -> StreamingResponse:
+        """
+        Abrir el flujo de eventos de un memorial
+        
+        El primer evento trae los conteos actuales de reacciones; después
+        llegan los cambios según se publican, con un comentario de latido
+        cada LIVE_HEARTBEAT segundos. La conexión se cierra a los
+        LIVE_STREAM_TTL segundos y el navegador reconecta solo.
+        
+        Args:
+            db: Sesión de base de datos (se cierra antes de empezar a emitir)
+            slug: Slug del memorial
+        
+        Returns:
+            Respuesta text/event-stream
+        
+        Raises:
+            HTTPException: 404 si el memorial no existe, 503 si se alcanzó
+                el límite de conexiones
+        """
+        memorial = MemorialRepository.get_by_slug(db, slug)
+        if not memorial:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Memorial no encontrado"
+            )
+        if live_broker.full:
+            live_broker.reject()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Demasiadas conexiones en vivo, intenta de nuevo",
+                headers={"Retry-After": "5"}
+            )
+        
+        snapshot = {"memorial_id": memorial.id, "counts": reaction_counter_cache.get(db, memorial.id)}
+        # La conexión no retiene la sesión mientras está abierta
+        db.close()
+        
+        return StreamingResponse(
+            LiveService.stream(LiveService.channel(memorial.id), snapshot),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    @staticmethod
+    async def stream(channel: str, snapshot: Dict,
+                     heartbeat: float = None, ttl: float = None) -> AsyncIterator[str]:
+        """
+        Emitir los eventos de un canal hasta cerrar la conexión
+        
+        La suscripción se abre al empezar a emitir (y se cancela al terminar)
+        para que una conexión cortada antes de la primera trama no deje una
+        cola huérfana. Los eventos de reacción llevan los conteos completos,
+        así que un cambio entre el estado inicial y la suscripción se corrige
+        con el siguiente evento.
+        
+        Args:
+            channel: Canal del memorial
+            snapshot: Estado inicial enviado como evento "snapshot"
+            heartbeat: Segundos entre latidos (por defecto LIVE_HEARTBEAT)
+            ttl: Segundos de vida de la conexión (por defecto LIVE_STREAM_TTL)
+        """
+        heartbeat = heartbeat or settings.LIVE_HEARTBEAT
+        ttl = settings.LIVE_STREAM_TTL if ttl is None else ttl
+        deadline = time.monotonic() + ttl
+        subscription = live_broker.subscribe(channel)
+        try:
+            yield f"retry: {LiveService.RETRY_MS}\n" + sse_frame("snapshot", snapshot)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                message = await subscription.get(min(heartbeat, remaining))
+                if subscription.closed:
+                    break
+                if message is not None:
+                    yield message
+                elif time.monotonic() < deadline:
+                    yield ": ping\n\n"
+        finally:
+            live_broker.unsubscribe(subscription)
@@ -4,20 +4,26 @@ Servicio de memoriales - Lógica de negocio
 import os
 import uuid
 import shutil
-from typing import List
-from fastapi import HTTPException, UploadFile, status
+from typing import List, Optional
+from fastapi import BackgroundTasks, HTTPException, UploadFile, status
 from sqlalchemy.orm import Session
 from app.models import Memorial, User
 from app.repositories import MemorialRepository
 from app.schemas import MemorialCreate, MemorialUpdate
 from app.config import settings
+from app.services.qr_artifacts import QRArtifactService
 
 
 class MemorialService:
     """Servicio de gestión de memoriales"""
     
     @staticmethod
-    def create_memorial(db: Session, memorial: MemorialCreate, user_id: int) -> Memorial:
+    def create_memorial(
+        db: Session,
+        memorial: MemorialCreate,
+        user_id: int,
+        background_tasks: Optional[BackgroundTasks] = None
+    ) -> Memorial:
         """
         Crear nuevo memorial
         
@@ -25,11 +31,14 @@ class MemorialService:
             db: Sesión de base de datos
             memorial: Datos del memorial
             user_id: ID del usuario propietario
+            background_tasks: Tareas en segundo plano para pre-generar los QR
             
         Returns:
             Memorial creado
         """
-        return MemorialRepository.create(db, memorial, user_id)
+        db_memorial = MemorialRepository.create(db, memorial, user_id)
+        MemorialService._schedule_qr_artifacts(background_tasks, db_memorial)
+        return db_memorial
     
     @staticmethod
     def get_user_memorials(db: Session, user_id: int) -> List[Memorial]:
@@ -73,7 +82,8 @@ class MemorialService:
         db: Session,
         memorial_id: int,
         file: UploadFile,
-        current_user: User
+        current_user: User,
+        background_tasks: Optional[BackgroundTasks] = None
     ) -> Memorial:
         """
         Subir foto a un memorial
@@ -83,6 +93,7 @@ class MemorialService:
             memorial_id: ID del memorial
             file: Archivo de imagen
             current_user: Usuario actual
+            background_tasks: Tareas en segundo plano para pre-generar los QR
             
         Returns:
             Memorial actualizado
@@ -118,7 +129,16 @@ class MemorialService:
             shutil.copyfileobj(file.file, buffer)
         
         # Actualizar BD
-        return MemorialRepository.update_image(db, memorial, unique_filename)
+        memorial = MemorialRepository.update_image(db, memorial, unique_filename)
+        MemorialService._schedule_qr_artifacts(background_tasks, memorial)
+        return memorial
+    
+    @staticmethod
+    def _schedule_qr_artifacts(background_tasks: Optional[BackgroundTasks], memorial: Memorial) -> None:
+        """Programar la pre-generación de los QR estándar tras responder"""
+        if background_tasks is None or not settings.QR_PREGENERATE:
+            return
+        background_tasks.add_task(QRArtifactService.pregenerate, memorial.slug, memorial.image_filename)
 
     @staticmethod
     def get_memorial_by_id(db: Session, memorial_id: int, current_user: User) -> Memorial:
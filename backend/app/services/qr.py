@@ -3,18 +3,58 @@ Servicio de generación de QR - Lógica de negocio
 Con soporte para QR personalizado con foto integrada
 """
 import os
+import base64
 import qrcode
 from io import BytesIO
-from PIL import Image
-from fastapi.responses import StreamingResponse
+from typing import List
+from PIL import Image, ImageChops, features
+from fastapi import HTTPException, status
+from fastapi.responses import Response
 from app.config import settings
+from app.core.qr_cache import QRRenderCache, CachedRender, qr_render_cache
+from app.core.executor import render_executor
+from app.services.qr_templates import QRTemplates
 
 
 class QRService:
     """Servicio de generación de códigos QR"""
     
+    # Versión del diseño del marco; cambiarla invalida los renders cacheados
+    FRAME_STYLE = "classic-v2"
+    SIMPLE_STYLE = "simple-v1"
+    
+    # Formatos de salida soportados
+    MEDIA_TYPES = {"png": "image/png", "webp": "image/webp", "svg": "image/svg+xml"}
+    RASTER_FORMATS = {"png": "PNG", "webp": "WEBP"}
+    
+    # Colores del diseño
+    QR_COLOR = "#1e293b"  # slate-800
+    ACCENT_COLOR = "#d97706"  # amber-600
+    
     @staticmethod
-    def generate_qr(slug: str, with_photo: bool = False, image_filename: str = None) -> StreamingResponse:
+    def supports(fmt: str) -> bool:
+        """Indicar si este servidor puede generar el formato (WebP depende de Pillow)"""
+        if fmt == "webp":
+            return features.check("webp")
+        return fmt in QRService.MEDIA_TYPES
+    
+    @staticmethod
+    def check_format(fmt: str) -> None:
+        """
+        Validar el formato pedido
+        
+        Raises:
+            HTTPException: 400 si el servidor no puede generarlo
+        """
+        if not QRService.supports(fmt):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Formato no disponible en este servidor: {fmt}"
+            )
+    
+    @staticmethod
+    async def generate_qr(slug: str, with_photo: bool = False, image_filename: str = None,
+                          if_none_match: str = None, fmt: str = "png") -> Response:
         """
         Generar código QR para un memorial
         
@@ -22,25 +62,72 @@ class QRService:
             slug: Slug del memorial
             with_photo: Si incluir la foto del fallecido en el centro del QR
             image_filename: Nombre del archivo de imagen para incrustar
-            
+            if_none_match: Valor del header If-None-Match de la petición
+            fmt: Formato de salida ("png", "webp" o "svg")
+        
         Returns:
-            Imagen QR como StreamingResponse
-        """
-        # Construir URL
-        target_url = f"{settings.FRONTEND_URL}/view/{slug}"
+            Imagen QR (o 304 si el cliente ya tiene la versión actual)
         
-        # Generar QR con alta corrección de errores para permitir logo
-        qr = qrcode.QRCode(
-            version=4,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,  # 30% corrección
-            box_size=10,
-            border=4,
+        Raises:
+            HTTPException: 400 si el formato no está disponible
+        """
+        QRService.check_format(fmt)
+        cached = await QRService.get_qr(
+            slug, with_photo=with_photo, image_filename=image_filename, fmt=fmt
         )
-        qr.add_data(target_url)
-        qr.make(fit=True)
+        return QRService._build_response(cached, QRService.MEDIA_TYPES[fmt], if_none_match)
+    
+    @staticmethod
+    async def get_qr(slug: str, with_photo: bool = False, image_filename: str = None,
+                     fmt: str = "png") -> CachedRender:
+        """
+        Obtener el QR decorado desde la caché o renderizarlo
+        
+        Args:
+            slug: Slug del memorial
+            with_photo: Si incluir la foto del fallecido en el centro del QR
+            image_filename: Nombre del archivo de imagen para incrustar
+            fmt: Formato de salida ("png", "webp" o "svg")
+        
+        Returns:
+            Render con su contenido y ETag
+        """
+        key = QRService.cache_key(slug, with_photo, image_filename, fmt)
+        
+        cached = qr_render_cache.get(slug, key, fmt)
+        if cached is None:
+            # El render es CPU intensivo: se ejecuta fuera del event loop
+            if fmt == "svg":
+                content = await render_executor.run(
+                    QRService.render_qr_svg, slug, with_photo=with_photo, image_filename=image_filename
+                )
+            else:
+                content = await render_executor.run(
+                    QRService.render_qr, slug, with_photo=with_photo,
+                    image_filename=image_filename, fmt=fmt
+                )
+            cached = qr_render_cache.set(slug, key, content, fmt)
+        return cached
+    
+    @staticmethod
+    def render_qr(slug: str, with_photo: bool = False, image_filename: str = None,
+                  fmt: str = "png") -> bytes:
+        """
+        Renderizar el QR decorado de un memorial
+        
+        Args:
+            slug: Slug del memorial
+            with_photo: Si incluir la foto del fallecido en el centro del QR
+            image_filename: Nombre del archivo de imagen para incrustar
+            fmt: Formato raster ("png" o "webp")
+        
+        Returns:
+            Bytes de la imagen
+        """
+        qr = QRService._make_qr(slug)
         
         # Crear imagen QR
-        qr_img = qr.make_image(fill_color="#1e293b", back_color="white").convert('RGBA')
+        qr_img = qr.make_image(fill_color=QRService.QR_COLOR, back_color="white").convert('RGBA')
         
         # Si se solicita con foto y existe la imagen
         if with_photo and image_filename:
@@ -50,11 +137,196 @@ class QRService:
         qr_img = QRService._add_decorative_frame(qr_img, slug)
         
         # Convertir a bytes
+        return QRService._encode_raster(qr_img, fmt)
+    
+    @staticmethod
+    def _encode_raster(img: Image.Image, fmt: str) -> bytes:
+        """Codificar una imagen en PNG o WebP sin pérdida"""
         img_byte_arr = BytesIO()
-        qr_img.save(img_byte_arr, format='PNG', quality=95)
-        img_byte_arr.seek(0)
+        if fmt == "webp":
+            img.save(img_byte_arr, format=QRService.RASTER_FORMATS[fmt], lossless=True)
+        else:
+            img.save(img_byte_arr, format=QRService.RASTER_FORMATS[fmt], quality=95)
+        return img_byte_arr.getvalue()
+    
+    @staticmethod
+    def render_qr_svg(slug: str, with_photo: bool = False, image_filename: str = None) -> bytes:
+        """
+        Renderizar el QR decorado de un memorial como SVG vectorial
+        
+        Mismo diseño que la versión PNG: los módulos, el marco y las esquinas
+        son primitivas vectoriales; la foto se incrusta ya reducida.
+        
+        Args:
+            slug: Slug del memorial
+            with_photo: Si incluir la foto del fallecido en el centro del QR
+            image_filename: Nombre del archivo de imagen para incrustar
+        
+        Returns:
+            Bytes del documento SVG
+        """
+        qr = QRService._make_qr(slug)
+        matrix = qr.get_matrix()
+        box_size = qr.box_size
+        qr_size = len(matrix) * box_size
+        
+        padding = 40
+        bottom_padding = 60
+        width = qr_size + padding * 2
+        height = qr_size + padding + bottom_padding
+        
+        parts = [
+            f'<rect width="{width}" height="{height}" fill="#ffffff"/>',
+            f'<path transform="translate({padding} {padding}) scale({box_size})" '
+            f'fill="{QRService.QR_COLOR}" d="{QRService._svg_modules_path(matrix)}"/>',
+        ]
+        
+        if with_photo and image_filename:
+            parts.append(QRService._svg_photo(
+                image_filename, int(qr_size * 0.25), padding + qr_size / 2, padding + qr_size / 2
+            ))
+        
+        # Líneas decorativas superior e inferior
+        accent = QRService.ACCENT_COLOR
+        parts.append(
+            f'<path stroke="{accent}" stroke-width="2" fill="none" '
+            f'd="M20 15H{width - 20}M20 {height - 45}H{width - 20}"/>'
+        )
         
-        return StreamingResponse(img_byte_arr, media_type="image/png")
+        # Esquinas decorativas
+        corner = 15
+        bottom = height - 50
+        parts.append(
+            f'<path stroke="{accent}" stroke-width="3" fill="none" d="'
+            f'M10 {10 + corner}V10H{10 + corner}'
+            f'M{width - 10} {10 + corner}V10H{width - 10 - corner}'
+            f'M10 {bottom - corner}V{bottom}H{10 + corner}'
+            f'M{width - 10} {bottom - corner}V{bottom}H{width - 10 - corner}"/>'
+        )
+        
+        # Texto "Memorial QR" en la parte inferior
+        parts.append(
+            f'<text x="{width / 2}" y="{height - 20}" text-anchor="middle" '
+            f'font-family="Arial, Helvetica, sans-serif" font-size="16" '
+            f'fill="{QRService.QR_COLOR}">✦ Memorial QR ✦</text>'
+        )
+        
+        return QRService._svg_document(width, height, parts)
+    
+    @staticmethod
+    def _make_qr(slug: str) -> qrcode.QRCode:
+        """QR con alta corrección de errores (permite incrustar la foto)"""
+        qr = qrcode.QRCode(
+            version=4,
+            error_correction=qrcode.constants.ERROR_CORRECT_H,  # 30% corrección
+            box_size=10,
+            border=4,
+        )
+        qr.add_data(QRService._target_url(slug))
+        qr.make(fit=True)
+        return qr
+    
+    @staticmethod
+    def _make_simple_qr(slug: str) -> qrcode.QRCode:
+        """QR compacto sin decoraciones"""
+        qr = qrcode.QRCode(
+            version=1,
+            error_correction=qrcode.constants.ERROR_CORRECT_M,
+            box_size=10,
+            border=4,
+        )
+        qr.add_data(QRService._target_url(slug))
+        qr.make(fit=True)
+        return qr
+    
+    @staticmethod
+    def _svg_modules_path(matrix: List[List[bool]]) -> str:
+        """
+        Datos de path con los módulos oscuros en unidades de módulo
+        
+        Los módulos contiguos de cada fila se agrupan en un solo rectángulo
+        para reducir el tamaño del documento.
+        """
+        commands = []
+        for y, row in enumerate(matrix):
+            x = 0
+            while x < len(row):
+                if not row[x]:
+                    x += 1
+                    continue
+                start = x
+                while x < len(row) and row[x]:
+                    x += 1
+                commands.append(f"M{start} {y}h{x - start}v1h-{x - start}z")
+        return "".join(commands)
+    
+    @staticmethod
+    def _svg_photo(image_filename: str, logo_size: int, cx: float, cy: float) -> str:
+        """Foto circular con borde, incrustada como JPEG reducido"""
+        image_path = os.path.join(settings.UPLOAD_DIR, image_filename)
+        if not os.path.exists(image_path):
+            return ""
+        
+        try:
+            photo = Image.open(image_path).convert('RGB')
+            # Doble resolución para que la impresión siga siendo nítida
+            photo = photo.resize((logo_size * 2, logo_size * 2), Image.Resampling.LANCZOS)
+            buffer = BytesIO()
+            photo.save(buffer, format='JPEG', quality=85, optimize=True)
+        except Exception as e:
+            print(f"Error al agregar foto al QR: {e}")
+            return ""
+        
+        encoded = base64.b64encode(buffer.getvalue()).decode("ascii")
+        radius = logo_size / 2
+        x = cx - radius
+        y = cy - radius
+        return (
+            f'<clipPath id="photo-clip"><circle cx="{cx}" cy="{cy}" r="{radius}"/></clipPath>'
+            f'<circle cx="{cx}" cy="{cy}" r="{radius + 4}" fill="{QRService.QR_COLOR}"/>'
+            f'<circle cx="{cx}" cy="{cy}" r="{radius + 1}" fill="#ffffff"/>'
+            f'<image x="{x}" y="{y}" width="{logo_size}" height="{logo_size}" '
+            f'clip-path="url(#photo-clip)" href="data:image/jpeg;base64,{encoded}"/>'
+        )
+    
+    @staticmethod
+    def _svg_document(width: int, height: int, parts: List[str]) -> bytes:
+        """Envolver los elementos en un documento SVG escalable"""
+        return (
+            f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" '
+            f'width="{width}" height="{height}" shape-rendering="crispEdges">'
+            + "".join(parts)
+            + "</svg>"
+        ).encode("utf-8")
+    
+    @staticmethod
+    def cache_key(slug: str, with_photo: bool = False, image_filename: str = None,
+                  fmt: str = "png", simple: bool = False) -> str:
+        """Clave de caché del render (decorado o simple)"""
+        if simple:
+            return QRRenderCache.make_key(
+                slug, False, None, QRService.SIMPLE_STYLE, QRService._target_url(slug), fmt
+            )
+        return QRRenderCache.make_key(
+            slug, with_photo, image_filename, QRService.FRAME_STYLE, QRService._target_url(slug), fmt
+        )
+    
+    @staticmethod
+    def _target_url(slug: str) -> str:
+        """URL pública a la que apunta el QR"""
+        return f"{settings.FRONTEND_URL}/view/{slug}"
+    
+    @staticmethod
+    def _build_response(cached: CachedRender, media_type: str, if_none_match: str = None) -> Response:
+        """Construir respuesta con ETag, devolviendo 304 si el cliente ya la tiene"""
+        headers = {"ETag": cached.etag, "Cache-Control": "private, no-cache"}
+        
+        if if_none_match:
+            candidates = [tag.strip() for tag in if_none_match.split(",")]
+            if cached.etag in candidates or "*" in candidates:
+                return Response(status_code=304, headers=headers)
+        
+        return Response(content=cached.content, media_type=media_type, headers=headers)
     
     @staticmethod
     def _add_photo_to_qr(qr_img: Image.Image, image_filename: str) -> Image.Image:
@@ -64,7 +336,7 @@ class QRService:
         Args:
             qr_img: Imagen QR base
             image_filename: Nombre del archivo de foto
-            
+        
         Returns:
             Imagen QR con foto incrustada
         """
@@ -85,38 +357,20 @@ class QRService:
             # Redimensionar foto
             photo = photo.resize((logo_size, logo_size), Image.Resampling.LANCZOS)
             
-            # Crear máscara circular
-            mask = Image.new('L', (logo_size, logo_size), 0)
-            from PIL import ImageDraw
-            draw = ImageDraw.Draw(mask)
-            draw.ellipse((0, 0, logo_size, logo_size), fill=255)
-            
-            # Crear imagen circular con borde
-            circular_photo = Image.new('RGBA', (logo_size + 8, logo_size + 8), (255, 255, 255, 255))
-            
-            # Agregar borde decorativo
-            border_draw = ImageDraw.Draw(circular_photo)
-            border_draw.ellipse((0, 0, logo_size + 7, logo_size + 7), fill=(30, 41, 59, 255))  # slate-800
-            border_draw.ellipse((3, 3, logo_size + 4, logo_size + 4), fill=(255, 255, 255, 255))
+            # Recortar en círculo respetando la transparencia original de la foto
+            mask = ImageChops.multiply(QRTemplates.photo_mask(logo_size), photo.getchannel('A'))
             
-            # Aplicar máscara circular a la foto
-            output = Image.new('RGBA', (logo_size, logo_size), (0, 0, 0, 0))
-            output.paste(photo, mask=mask)
+            # Pegar foto sobre el borde circular precalculado
+            circular_photo = QRTemplates.photo_border(logo_size).copy()
+            circular_photo.paste(photo, (4, 4), mask)
             
-            # Pegar foto en el centro del borde
-            circular_photo.paste(output, (4, 4), output)
-            
-            # Calcular posición central
+            # Pegar en el centro (el fondo del borde ya es blanco y opaco)
             pos_x = (qr_width - circular_photo.size[0]) // 2
             pos_y = (qr_height - circular_photo.size[1]) // 2
-            
-            # Crear fondo blanco detrás del logo para mejor contraste
-            white_bg = Image.new('RGBA', circular_photo.size, (255, 255, 255, 255))
-            qr_img.paste(white_bg, (pos_x, pos_y))
-            qr_img.paste(circular_photo, (pos_x, pos_y), circular_photo)
+            qr_img.paste(circular_photo, (pos_x, pos_y))
             
             return qr_img
-            
+        
         except Exception as e:
             print(f"Error al agregar foto al QR: {e}")
             return qr_img
@@ -129,99 +383,102 @@ class QRService:
         Args:
             qr_img: Imagen QR
             slug: Slug del memorial para mostrar
-            
+        
         Returns:
             Imagen QR con marco decorativo
         """
-        from PIL import ImageDraw, ImageFont
-        
         qr_width, qr_height = qr_img.size
         
-        # Crear canvas más grande para el marco
-        padding = 40
-        bottom_padding = 60
-        new_width = qr_width + (padding * 2)
-        new_height = qr_height + padding + bottom_padding
-        
-        # Crear nueva imagen con fondo
-        framed = Image.new('RGBA', (new_width, new_height), (255, 255, 255, 255))
-        
-        # Pegar QR
-        framed.paste(qr_img, (padding, padding), qr_img)
-        
-        draw = ImageDraw.Draw(framed)
+        # El marco se dibuja una vez por tamaño; aquí solo se pega el QR
+        framed = QRTemplates.frame(qr_width, qr_height, QRService.FRAME_STYLE).copy()
+        framed.paste(qr_img, (QRTemplates.PADDING, QRTemplates.PADDING))
         
-        # Línea decorativa superior
-        draw.line([(20, 15), (new_width - 20, 15)], fill=(217, 119, 6, 255), width=2)
-        
-        # Línea decorativa inferior
-        draw.line([(20, new_height - 45), (new_width - 20, new_height - 45)], 
-                  fill=(217, 119, 6, 255), width=2)
-        
-        # Texto "Memorial QR" en la parte inferior
-        try:
-            # Intentar usar fuente del sistema
-            font = ImageFont.truetype("arial.ttf", 16)
-            small_font = ImageFont.truetype("arial.ttf", 12)
-        except:
-            font = ImageFont.load_default()
-            small_font = font
-        
-        # Texto centrado
-        text = "✦ Memorial QR ✦"
-        text_bbox = draw.textbbox((0, 0), text, font=font)
-        text_width = text_bbox[2] - text_bbox[0]
-        text_x = (new_width - text_width) // 2
-        draw.text((text_x, new_height - 35), text, fill=(30, 41, 59, 255), font=font)
+        return framed
+    
+    @staticmethod
+    async def generate_qr_simple(slug: str, if_none_match: str = None, fmt: str = "png") -> Response:
+        """
+        Generar código QR simple sin decoraciones
         
-        # Esquinas decorativas
-        corner_size = 15
-        corner_color = (217, 119, 6, 255)  # amber-600
+        Args:
+            slug: Slug del memorial
+            if_none_match: Valor del header If-None-Match de la petición
+            fmt: Formato de salida ("png", "webp" o "svg")
         
-        # Esquina superior izquierda
-        draw.line([(10, 10), (10, 10 + corner_size)], fill=corner_color, width=3)
-        draw.line([(10, 10), (10 + corner_size, 10)], fill=corner_color, width=3)
+        Returns:
+            Imagen QR (o 304 si el cliente ya tiene la versión actual)
         
-        # Esquina superior derecha
-        draw.line([(new_width - 10, 10), (new_width - 10, 10 + corner_size)], fill=corner_color, width=3)
-        draw.line([(new_width - 10, 10), (new_width - 10 - corner_size, 10)], fill=corner_color, width=3)
+        Raises:
+            HTTPException: 400 si el formato no está disponible
+        """
+        QRService.check_format(fmt)
+        cached = await QRService.get_qr_simple(slug, fmt=fmt)
+        return QRService._build_response(cached, QRService.MEDIA_TYPES[fmt], if_none_match)
+    
+    @staticmethod
+    async def get_qr_simple(slug: str, fmt: str = "png") -> CachedRender:
+        """
+        Obtener el QR simple desde la caché o renderizarlo
         
-        # Esquina inferior izquierda
-        draw.line([(10, new_height - 50), (10, new_height - 50 - corner_size)], fill=corner_color, width=3)
-        draw.line([(10, new_height - 50), (10 + corner_size, new_height - 50)], fill=corner_color, width=3)
+        Args:
+            slug: Slug del memorial
+            fmt: Formato de salida ("png", "webp" o "svg")
         
-        # Esquina inferior derecha
-        draw.line([(new_width - 10, new_height - 50), (new_width - 10, new_height - 50 - corner_size)], fill=corner_color, width=3)
-        draw.line([(new_width - 10, new_height - 50), (new_width - 10 - corner_size, new_height - 50)], fill=corner_color, width=3)
+        Returns:
+            Render con su contenido y ETag
+        """
+        key = QRService.cache_key(slug, fmt=fmt, simple=True)
         
-        return framed
+        cached = qr_render_cache.get(slug, key, fmt)
+        if cached is None:
+            if fmt == "svg":
+                content = await render_executor.run(QRService.render_qr_simple_svg, slug)
+            else:
+                content = await render_executor.run(QRService.render_qr_simple, slug, fmt=fmt)
+            cached = qr_render_cache.set(slug, key, content, fmt)
+        return cached
     
     @staticmethod
-    def generate_qr_simple(slug: str) -> StreamingResponse:
+    def render_qr_simple(slug: str, fmt: str = "png") -> bytes:
         """
-        Generar código QR simple sin decoraciones
+        Renderizar código QR simple sin decoraciones
         
         Args:
             slug: Slug del memorial
-            
+            fmt: Formato raster ("png" o "webp")
+        
         Returns:
-            Imagen QR como StreamingResponse
+            Bytes de la imagen
         """
-        target_url = f"{settings.FRONTEND_URL}/view/{slug}"
-        
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_M,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(target_url)
-        qr.make(fit=True)
+        qr = QRService._make_simple_qr(slug)
         
         img = qr.make_image(fill_color="black", back_color="white")
         
         img_byte_arr = BytesIO()
-        img.save(img_byte_arr, format='PNG')
-        img_byte_arr.seek(0)
+        if fmt == "webp":
+            img.convert('L').save(img_byte_arr, format='WEBP', lossless=True)
+        else:
+            img.save(img_byte_arr, format='PNG')
+        return img_byte_arr.getvalue()
+    
+    @staticmethod
+    def render_qr_simple_svg(slug: str) -> bytes:
+        """
+        Renderizar código QR simple como SVG vectorial
+        
+        Args:
+            slug: Slug del memorial
+        
+        Returns:
+            Bytes del documento SVG
+        """
+        qr = QRService._make_simple_qr(slug)
+        matrix = qr.get_matrix()
+        size = len(matrix) * qr.box_size
         
-        return StreamingResponse(img_byte_arr, media_type="image/png")
+        parts = [
+            f'<rect width="{size}" height="{size}" fill="#ffffff"/>',
+            f'<path transform="scale({qr.box_size})" fill="#000000" '
+            f'd="{QRService._svg_modules_path(matrix)}"/>',
+        ]
+        return QRService._svg_document(size, size, parts)
@@ -0,0 +1,94 @@
+"""
+Servicio de artefactos QR - Pre-generación de las variantes estándar
+Los archivos quedan junto a las subidas y se sirven desde el montaje /static
+"""
+import os
+import tempfile
+from typing import List, Optional
+from app.config import settings
+from app.core.qr_cache import CachedRender, qr_render_cache
+from app.services.qr import QRService
+
+
+class QRArtifactService:
+    """Servicio de pre-generación de códigos QR"""
+    
+    # Variantes estándar: simple, con marco y con marco + foto
+    VARIANTS = ("simple", "framed", "framed-photo")
+    
+    @staticmethod
+    def formats() -> List[str]:
+        """Formatos configurados que este servidor puede generar"""
+        formats = []
+        for fmt in settings.QR_ARTIFACT_FORMATS.split(","):
+            fmt = fmt.strip().lower()
+            if not QRService.supports(fmt):
+                continue
+            formats.append(fmt)
+        return formats
+    
+    @staticmethod
+    async def pregenerate(slug: str, image_filename: Optional[str] = None) -> List[str]:
+        """
+        Renderizar y publicar todas las variantes de un memorial
+        
+        Pensado para ejecutarse en segundo plano tras crear el memorial
+        o cambiar su foto. Los errores se registran sin propagarse.
+        
+        Args:
+            slug: Slug del memorial
+            image_filename: Foto actual del memorial (si tiene)
+        
+        Returns:
+            Nombres de los artefactos publicados
+        """
+        published = []
+        for variant in QRArtifactService.VARIANTS:
+            if variant == "framed-photo" and not image_filename:
+                continue
+            for fmt in QRArtifactService.formats():
+                try:
+                    cached, key = await QRArtifactService._render(slug, variant, image_filename, fmt)
+                    if QRArtifactService._publish(slug, key, variant, fmt, cached):
+                        published.append(f"{variant}.{fmt}")
+                except Exception as e:
+                    print(f"Error al pre-generar QR {variant}.{fmt} de {slug}: {e}")
+        return published
+    
+    @staticmethod
+    async def _render(slug: str, variant: str, image_filename: Optional[str], fmt: str):
+        """Obtener el render de una variante (desde caché o renderizando)"""
+        if variant == "simple":
+            cached = await QRService.get_qr_simple(slug, fmt=fmt)
+            return cached, QRService.cache_key(slug, fmt=fmt, simple=True)
+        
+        with_photo = variant == "framed-photo"
+        filename = image_filename if with_photo else None
+        cached = await QRService.get_qr(slug, with_photo=with_photo, image_filename=filename, fmt=fmt)
+        return cached, QRService.cache_key(slug, with_photo, filename, fmt)
+    
+    @staticmethod
+    def _publish(slug: str, key: str, variant: str, fmt: str, cached: CachedRender) -> bool:
+        """
+        Exponer el render con un nombre estable ({variant}.{fmt})
+        
+        Se enlaza al archivo direccionado por contenido del nivel en disco
+        para no duplicar bytes; si no es posible, se escribe una copia.
+        """
+        slug_dir = qr_render_cache.slug_dir(slug)
+        source = qr_render_cache.path(slug, key, fmt)
+        if slug_dir is None or source is None:
+            return False
+        
+        os.makedirs(slug_dir, exist_ok=True)
+        target = os.path.join(slug_dir, f"{variant}.{fmt}")
+        fd, tmp_path = tempfile.mkstemp(dir=slug_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            os.remove(tmp_path)
+            os.link(source, tmp_path)
+        except OSError:
+            with open(tmp_path, "wb") as f:
+                f.write(cached.content)
+        os.replace(tmp_path, target)
+        return True
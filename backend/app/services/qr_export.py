@@ -0,0 +1,328 @@
+"""
+Servicio de exportación masiva de QR - ZIP de PNGs o PDF imprimible
+Los archivos se generan en streaming, sin mantener el archivo completo en memoria
+"""
+import math
+import zlib
+import asyncio
+import zipfile
+from io import BytesIO
+from datetime import datetime
+from typing import AsyncIterator, List, NamedTuple, Optional, Tuple
+from PIL import Image, ImageDraw, ImageFont
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from app.models import User
+from app.repositories import MemorialRepository
+from app.schemas import QRExportRequest
+from app.services.qr import QRService
+from app.core.executor import render_executor
+
+
+class ExportItem(NamedTuple):
+    """Datos mínimos de un memorial para exportar (independiente de la sesión)"""
+    slug: str
+    name: str
+    image_filename: Optional[str]
+
+
+class _ChunkWriter:
+    """Destino de escritura no posicionable que acumula bytes hasta vaciarse"""
+    
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self.offset = 0
+    
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+    
+    def flush(self) -> None:
+        pass
+    
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class _PDFStreamWriter:
+    """
+    Escritor PDF mínimo en streaming
+    
+    Cada página es una imagen RGB a página completa. Los objetos de
+    catálogo y árbol de páginas se escriben al final, cuando ya se
+    conocen todas las páginas, de modo que nada se retiene en memoria.
+    """
+    
+    CATALOG_ID = 1
+    PAGES_ID = 2
+    
+    def __init__(self, page_width: float, page_height: float):
+        self.page_width = page_width
+        self.page_height = page_height
+        self._out = _ChunkWriter()
+        self._offsets = {}
+        self._next_id = 3
+        self._page_ids: List[int] = []
+        self._out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    
+    def _write_object(self, obj_id: int, body: bytes, stream: bytes = None) -> None:
+        self._offsets[obj_id] = self._out.offset
+        self._out.write(f"{obj_id} 0 obj\n".encode())
+        self._out.write(body)
+        if stream is not None:
+            self._out.write(b"\nstream\n")
+            self._out.write(stream)
+            self._out.write(b"\nendstream")
+        self._out.write(b"\nendobj\n")
+    
+    def drain(self) -> bytes:
+        """Bytes escritos desde el último vaciado"""
+        return self._out.drain()
+    
+    def _allocate(self) -> int:
+        obj_id = self._next_id
+        self._next_id += 1
+        return obj_id
+    
+    def add_page(self, width: int, height: int, rgb_deflated: bytes) -> bytes:
+        """Agregar una página a partir de una imagen RGB comprimida con Flate"""
+        image_id, content_id, page_id = self._allocate(), self._allocate(), self._allocate()
+        
+        self._write_object(
+            image_id,
+            (f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+             f"/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode "
+             f"/Length {len(rgb_deflated)} >>").encode(),
+            rgb_deflated
+        )
+        
+        content = f"q {self.page_width} 0 0 {self.page_height} 0 0 cm /Im0 Do Q".encode()
+        self._write_object(content_id, f"<< /Length {len(content)} >>".encode(), content)
+        
+        self._write_object(
+            page_id,
+            (f"<< /Type /Page /Parent {self.PAGES_ID} 0 R "
+             f"/MediaBox [0 0 {self.page_width} {self.page_height}] "
+             f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> "
+             f"/Contents {content_id} 0 R >>").encode()
+        )
+        self._page_ids.append(page_id)
+        return self.drain()
+    
+    def close(self) -> bytes:
+        """Escribir árbol de páginas, catálogo y tabla xref"""
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._write_object(
+            self.PAGES_ID,
+            f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>".encode()
+        )
+        self._write_object(
+            self.CATALOG_ID,
+            f"<< /Type /Catalog /Pages {self.PAGES_ID} 0 R >>".encode()
+        )
+        
+        xref_offset = self._out.offset
+        size = self._next_id
+        self._out.write(f"xref\n0 {size}\n".encode())
+        self._out.write(b"0000000000 65535 f \n")
+        for obj_id in range(1, size):
+            self._out.write(f"{self._offsets[obj_id]:010d} 00000 n \n".encode())
+        self._out.write(
+            f"trailer\n<< /Size {size} /Root {self.CATALOG_ID} 0 R >>\n"
+            f"startxref\n{xref_offset}\n%%EOF\n".encode()
+        )
+        return self.drain()
+
+
+class QRExportService:
+    """Servicio de exportación masiva de códigos QR"""
+    
+    # Hoja A4 en puntos PDF y resolución de rasterizado
+    PAGE_WIDTH_PT = 595.28
+    PAGE_HEIGHT_PT = 841.89
+    PAGE_DPI = 150
+    PAGE_MARGIN_PX = 60
+    
+    @staticmethod
+    def resolve_items(db: Session, current_user: User, request: QRExportRequest) -> List[ExportItem]:
+        """
+        Obtener los memoriales a exportar verificando propiedad
+        
+        Args:
+            db: Sesión de base de datos
+            current_user: Usuario autenticado
+            request: Parámetros de exportación
+        
+        Returns:
+            Memoriales en el orden solicitado
+        
+        Raises:
+            HTTPException: Si algún slug no existe o no pertenece al usuario
+        """
+        memorials = MemorialRepository.get_by_user(db, current_user.id)
+        
+        if request.slugs:
+            by_slug = {m.slug: m for m in memorials}
+            missing = [slug for slug in request.slugs if slug not in by_slug]
+            if missing:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Memoriales no encontrados: {', '.join(missing)}"
+                )
+            memorials = [by_slug[slug] for slug in dict.fromkeys(request.slugs)]
+        
+        if not memorials:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No hay memoriales para exportar"
+            )
+        
+        return [ExportItem(m.slug, m.name, m.image_filename) for m in memorials]
+    
+    @staticmethod
+    def export(db: Session, current_user: User, request: QRExportRequest) -> StreamingResponse:
+        """
+        Exportar QR de varios memoriales como ZIP o PDF en streaming
+        
+        Args:
+            db: Sesión de base de datos
+            current_user: Usuario autenticado
+            request: Parámetros de exportación
+        
+        Returns:
+            Archivo en streaming
+        """
+        items = QRExportService.resolve_items(db, current_user, request)
+        stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+        
+        if request.format == "pdf":
+            body = QRExportService.stream_pdf(items, request.per_page, request.with_photo)
+            media_type = "application/pdf"
+            filename = f"memorial-qr-{stamp}.pdf"
+        else:
+            body = QRExportService.stream_zip(items, request.with_photo)
+            media_type = "application/zip"
+            filename = f"memorial-qr-{stamp}.zip"
+        
+        return StreamingResponse(
+            body,
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+    
+    @staticmethod
+    async def render_many(items: List[ExportItem], with_photo: bool) -> AsyncIterator[Tuple[ExportItem, bytes]]:
+        """
+        Renderizar QRs en paralelo conservando el orden
+        
+        Mantiene como máximo una ventana de renders en curso para que
+        el consumo de memoria no dependa del número de memoriales.
+        """
+        window = max(1, render_executor.max_workers)
+        pending: List[Tuple[ExportItem, asyncio.Task]] = []
+        queue = iter(items)
+        
+        def schedule() -> None:
+            item = next(queue, None)
+            if item is not None:
+                task = asyncio.ensure_future(
+                    QRService.get_qr(item.slug, with_photo=with_photo, image_filename=item.image_filename)
+                )
+                pending.append((item, task))
+        
+        for _ in range(window):
+            schedule()
+        
+        try:
+            while pending:
+                item, task = pending.pop(0)
+                cached = await task
+                schedule()
+                yield item, cached.content
+        finally:
+            for _, task in pending:
+                task.cancel()
+    
+    @staticmethod
+    async def stream_zip(items: List[ExportItem], with_photo: bool) -> AsyncIterator[bytes]:
+        """Generar un ZIP de PNGs en streaming"""
+        writer = _ChunkWriter()
+        # Los PNG ya están comprimidos: se almacenan sin recomprimir
+        archive = zipfile.ZipFile(writer, mode="w", compression=zipfile.ZIP_STORED)
+        date_time = datetime.utcnow().timetuple()[:6]
+        
+        async for item, content in QRExportService.render_many(items, with_photo):
+            info = zipfile.ZipInfo(f"qr-{item.slug}.png", date_time=date_time)
+            archive.writestr(info, content)
+            yield writer.drain()
+        
+        archive.close()
+        yield writer.drain()
+    
+    @staticmethod
+    async def stream_pdf(items: List[ExportItem], per_page: int, with_photo: bool) -> AsyncIterator[bytes]:
+        """Generar un PDF con varias hojas de QR en streaming"""
+        pdf = _PDFStreamWriter(QRExportService.PAGE_WIDTH_PT, QRExportService.PAGE_HEIGHT_PT)
+        yield pdf.drain()
+        
+        page: List[Tuple[str, bytes]] = []
+        async for item, content in QRExportService.render_many(items, with_photo):
+            page.append((item.name, content))
+            if len(page) == per_page:
+                yield pdf.add_page(*await render_executor.run(QRExportService.compose_page, page, per_page))
+                page = []
+        
+        if page:
+            yield pdf.add_page(*await render_executor.run(QRExportService.compose_page, page, per_page))
+        
+        yield pdf.close()
+    
+    @staticmethod
+    def compose_page(codes: List[Tuple[str, bytes]], per_page: int) -> Tuple[int, int, bytes]:
+        """
+        Componer una hoja con varios QR en cuadrícula
+        
+        Args:
+            codes: Pares (nombre del memorial, PNG del QR)
+            per_page: Códigos por hoja (define la cuadrícula)
+        
+        Returns:
+            Ancho, alto y píxeles RGB comprimidos con Flate
+        """
+        dpi = QRExportService.PAGE_DPI
+        width = round(QRExportService.PAGE_WIDTH_PT / 72 * dpi)
+        height = round(QRExportService.PAGE_HEIGHT_PT / 72 * dpi)
+        margin = QRExportService.PAGE_MARGIN_PX
+        
+        columns = math.ceil(math.sqrt(per_page))
+        rows = math.ceil(per_page / columns)
+        cell_w = (width - margin * 2) // columns
+        cell_h = (height - margin * 2) // rows
+        caption_h = 30
+        
+        sheet = Image.new("RGB", (width, height), (255, 255, 255))
+        draw = ImageDraw.Draw(sheet)
+        font = ImageFont.load_default()
+        
+        for index, (name, content) in enumerate(codes):
+            col, row = index % columns, index // columns
+            x0 = margin + col * cell_w
+            y0 = margin + row * cell_h
+            
+            code = Image.open(BytesIO(content)).convert("RGB")
+            size = min(cell_w - 20, cell_h - caption_h - 20)
+            scale = size / max(code.size)
+            code = code.resize(
+                (int(code.width * scale), int(code.height * scale)), Image.Resampling.LANCZOS
+            )
+            sheet.paste(code, (x0 + (cell_w - code.width) // 2, y0 + 10))
+            
+            text_bbox = draw.textbbox((0, 0), name, font=font)
+            text_x = x0 + (cell_w - (text_bbox[2] - text_bbox[0])) // 2
+            draw.text((text_x, y0 + 10 + code.height + 5), name, fill=(30, 41, 59), font=font)
+        
+        return width, height, zlib.compress(sheet.tobytes(), 6)
@@ -0,0 +1,100 @@
+"""
+Plantillas precalculadas para el render de QR
+Marco decorativo, fuentes y máscaras se construyen una vez por proceso y tamaño
+"""
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
+
+
+class QRTemplates:
+    """Recursos de render reutilizables (marco, fuentes y máscaras de foto)"""
+    
+    # Geometría del marco
+    PADDING = 40
+    BOTTOM_PADDING = 60
+    CORNER_SIZE = 15
+    
+    # Colores del diseño
+    TEXT_COLOR = (30, 41, 59, 255)  # slate-800
+    ACCENT_COLOR = (217, 119, 6, 255)  # amber-600
+    CAPTION = "✦ Memorial QR ✦"
+    
+    # Fuentes candidatas, en orden de preferencia
+    FONT_CANDIDATES = ("arial.ttf", "Arial.ttf", "DejaVuSans.ttf", "LiberationSans-Regular.ttf")
+    
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def font(size: int) -> ImageFont.ImageFont:
+        """Cargar la fuente del caption una sola vez por tamaño"""
+        for candidate in QRTemplates.FONT_CANDIDATES:
+            try:
+                return ImageFont.truetype(candidate, size)
+            except OSError:
+                continue
+        return ImageFont.load_default()
+    
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def frame(qr_width: int, qr_height: int, style: str) -> Image.Image:
+        """
+        Lienzo con el marco decorativo ya dibujado
+        
+        La imagen devuelta es compartida: copiarla antes de modificarla.
+        
+        Args:
+            qr_width: Ancho del QR en píxeles
+            qr_height: Alto del QR en píxeles
+            style: Versión del diseño del marco
+        
+        Returns:
+            Lienzo RGBA con líneas, esquinas y texto
+        """
+        padding = QRTemplates.PADDING
+        new_width = qr_width + (padding * 2)
+        new_height = qr_height + padding + QRTemplates.BOTTOM_PADDING
+        
+        framed = Image.new('RGBA', (new_width, new_height), (255, 255, 255, 255))
+        draw = ImageDraw.Draw(framed)
+        accent = QRTemplates.ACCENT_COLOR
+        
+        # Líneas decorativas superior e inferior
+        draw.line([(20, 15), (new_width - 20, 15)], fill=accent, width=2)
+        draw.line([(20, new_height - 45), (new_width - 20, new_height - 45)], fill=accent, width=2)
+        
+        # Texto centrado en la parte inferior
+        font = QRTemplates.font(16)
+        text_bbox = draw.textbbox((0, 0), QRTemplates.CAPTION, font=font)
+        text_x = (new_width - (text_bbox[2] - text_bbox[0])) // 2
+        draw.text((text_x, new_height - 35), QRTemplates.CAPTION, fill=QRTemplates.TEXT_COLOR, font=font)
+        
+        # Esquinas decorativas
+        corner = QRTemplates.CORNER_SIZE
+        bottom = new_height - 50
+        right = new_width - 10
+        for x, y, dx, dy in ((10, 10, 1, 1), (right, 10, -1, 1), (10, bottom, 1, -1), (right, bottom, -1, -1)):
+            draw.line([(x, y), (x, y + dy * corner)], fill=accent, width=3)
+            draw.line([(x, y), (x + dx * corner, y)], fill=accent, width=3)
+        
+        return framed
+    
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def photo_mask(logo_size: int) -> Image.Image:
+        """Máscara circular para recortar la foto"""
+        mask = Image.new('L', (logo_size, logo_size), 0)
+        ImageDraw.Draw(mask).ellipse((0, 0, logo_size, logo_size), fill=255)
+        return mask
+    
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def photo_border(logo_size: int) -> Image.Image:
+        """
+        Fondo con borde circular sobre el que se pega la foto
+        
+        La imagen devuelta es compartida: copiarla antes de modificarla.
+        """
+        border = Image.new('RGBA', (logo_size + 8, logo_size + 8), (255, 255, 255, 255))
+        draw = ImageDraw.Draw(border)
+        draw.ellipse((0, 0, logo_size + 7, logo_size + 7), fill=QRTemplates.TEXT_COLOR)
+        draw.ellipse((3, 3, logo_size + 4, logo_size + 4), fill=(255, 255, 255, 255))
+        return border
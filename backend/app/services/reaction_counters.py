@@ -0,0 +1,295 @@
+"""
+Caché de contadores de reacciones - Lecturas en memoria y escrituras agrupadas
+"""
+import asyncio
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Set, Tuple
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.core.cache import LRUCache
+from app.db.session import SessionLocal
+from app.repositories import ReactionRepository
+
+
+class ReactionCounterCache:
+    """
+    Conteos de reacciones por memorial servidos desde memoria
+    
+    Cada toggle escribe la reacción en la base de datos al momento, pero
+    el delta del contador queda pendiente y se escribe agrupado cada
+    flush_interval_ms: cien toques sobre el mismo memorial en ese intervalo
+    son una sola actualización de reaction_counters. Las lecturas salen de
+    la caché (con los deltas pendientes ya aplicados) y caducan a los ttl
+    segundos para ver los toques registrados por otros workers.
+    
+    Cada reconcile_interval segundos se recalculan los conteos desde la
+    tabla de reacciones y se corrigen los contadores que difieran. Se omiten
+    los memoriales con toggles en curso o deltas pendientes en este proceso
+    y, por los demás workers, los que tienen un toggle confirmado en los
+    últimos quiet_period segundos (visitor_reactions.updated_at): su delta
+    puede seguir pendiente en otro proceso. Se corrigen en otra pasada.
+    
+    También guarda las máscaras recientes de (memorial, visitante): la
+    página de un visitante que acaba de reaccionar o recarga no consulta
+    visitor_reactions hasta que caduca la entrada (mask_ttl).
+    """
+    
+    def __init__(self, flush_interval_ms: int = 1000, reconcile_interval: float = 600,
+                 ttl: float = 5, max_memorials: int = 10000, mask_ttl: float = 60,
+                 max_masks: int = 50000, quiet_period: float = None,
+                 session_factory=SessionLocal):
+        self.flush_interval = flush_interval_ms / 1000
+        self.reconcile_interval = reconcile_interval
+        # Margen de varios vaciados para que otro worker escriba sus deltas
+        self.quiet_period = max(30.0, 10 * self.flush_interval) if quiet_period is None else quiet_period
+        self.session_factory = session_factory
+        self._counts = LRUCache(max_entries=max_memorials, ttl=ttl or None)
+        self._masks = LRUCache(max_entries=max_masks, ttl=mask_ttl or None)
+        self._pending: Dict[Tuple[int, str], int] = {}
+        self._in_flight: Counter = Counter()
+        # Memoriales con deltas fuera de _pending pero aún sin confirmar en la base de datos
+        self._flushing: Counter = Counter()
+        self._versions: Counter = Counter()
+        self._lock = threading.Lock()
+        self._tasks = []
+        self._stats = {
+            "hits": 0,
+            "loads": 0,
+            "mask_hits": 0,
+            "mask_loads": 0,
+            "flushes": 0,
+            "deltas_written": 0,
+            "failed": 0,
+            "reconciles": 0,
+            "corrected": 0,
+        }
+    
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+    
+    def start(self) -> None:
+        """Arrancar las tareas de escritura y reconciliación en el loop actual"""
+        if self.running:
+            return
+        self._tasks = [asyncio.create_task(self._run_flush())]
+        if self.reconcile_interval > 0:
+            self._tasks.append(asyncio.create_task(self._run_reconcile()))
+    
+    async def stop(self) -> None:
+        """Detener las tareas y escribir los deltas pendientes"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.flush()
+    
+    async def _run_flush(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.shield(self.flush())
+    
+    async def _run_reconcile(self) -> None:
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await asyncio.to_thread(self.reconcile)
+            except Exception as e:
+                self._stats["failed"] += 1
+                print(f"Error al reconciliar contadores de reacciones: {e}")
+    
+    def get(self, db: Session, memorial_id: int) -> Dict[str, int]:
+        """Conteos por tipo de un memorial (desde memoria si están cargados)"""
+        cached = self._counts.get(memorial_id)
+        if cached is not None:
+            self._stats["hits"] += 1
+            with self._lock:
+                return dict(cached)
+        
+        self._stats["loads"] += 1
+        counts = ReactionRepository.get_counter_counts(db, [memorial_id])[memorial_id]
+        with self._lock:
+            for reaction_type in counts:
+                counts[reaction_type] = max(0, counts[reaction_type] + self._pending.get((memorial_id, reaction_type), 0))
+            self._counts.set(memorial_id, counts)
+            return dict(counts)
+    
+    def get_user_reactions(self, db: Session, memorial_id: int, visitor_id: str) -> List[str]:
+        """Tipos de reacción activos de un visitante (desde memoria si la máscara está cargada)"""
+        key = (memorial_id, ReactionRepository.visitor_key(visitor_id))
+        mask = self._masks.get(key)
+        if mask is None:
+            self._stats["mask_loads"] += 1
+            mask = ReactionRepository.get_visitor_mask(db, memorial_id, visitor_id)
+            self._masks.set(key, mask)
+        else:
+            self._stats["mask_hits"] += 1
+        return ReactionRepository.mask_types(mask)
+    
+    def toggle(self, db: Session, memorial_id: int, reaction_type: str, visitor_id: str) -> dict:
+        """
+        Toggle de reacción con el contador diferido
+        
+        Si las tareas no están activas (fuera del ciclo de vida de la
+        aplicación) el contador se actualiza en la misma transacción.
+        
+        Returns:
+            Acción realizada, tipo, delta aplicado al contador (0 si otra
+            petición ya la había registrado), conteos actualizados del
+            memorial y reacciones activas del visitante
+        """
+        if not self.running:
+            result = ReactionRepository.toggle_reaction(db, memorial_id, reaction_type, visitor_id)
+            self._counts.pop(memorial_id)
+            return {"action": result["action"], "reaction_type": reaction_type,
+                    "delta": result["delta"], "counts": result["counts"],
+                    "user_reactions": self._remember_mask(memorial_id, visitor_id, result["mask"])}
+        
+        with self._lock:
+            self._in_flight[memorial_id] += 1
+            self._versions[memorial_id] += 1
+        delta = 0
+        try:
+            result = ReactionRepository.toggle_reaction(
+                db, memorial_id, reaction_type, visitor_id, update_counter=False
+            )
+            delta = result["delta"]
+        finally:
+            with self._lock:
+                self._in_flight[memorial_id] -= 1
+                if not self._in_flight[memorial_id]:
+                    del self._in_flight[memorial_id]
+                if delta:
+                    key = (memorial_id, reaction_type)
+                    self._pending[key] = self._pending.get(key, 0) + delta
+                    cached = self._counts.get(memorial_id)
+                    if cached is not None:
+                        cached[reaction_type] = max(0, cached[reaction_type] + delta)
+        
+        return {"action": result["action"], "reaction_type": reaction_type,
+                "delta": delta, "counts": self.get(db, memorial_id),
+                "user_reactions": self._remember_mask(memorial_id, visitor_id, result["mask"])}
+    
+    def _remember_mask(self, memorial_id: int, visitor_id: str, mask: int) -> List[str]:
+        self._masks.set((memorial_id, ReactionRepository.visitor_key(visitor_id)), mask)
+        return ReactionRepository.mask_types(mask)
+    
+    async def flush(self) -> int:
+        """
+        Escribir los deltas pendientes en reaction_counters
+        
+        Returns:
+            Número de contadores actualizados
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            pending = {key: delta for key, delta in pending.items() if delta}
+            flushing = Counter(memorial_id for memorial_id, _ in pending)
+            self._flushing.update(flushing)
+        if not pending:
+            return 0
+        
+        try:
+            await asyncio.to_thread(self._write, pending)
+        except Exception as e:
+            # Se devuelven a la cola para el siguiente intento
+            with self._lock:
+                for key, delta in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + delta
+            self._stats["failed"] += 1
+            print(f"Error al escribir contadores de reacciones: {e}")
+            return 0
+        finally:
+            with self._lock:
+                for memorial_id, count in flushing.items():
+                    self._flushing[memorial_id] -= count
+                    if not self._flushing[memorial_id]:
+                        del self._flushing[memorial_id]
+        
+        self._stats["flushes"] += 1
+        self._stats["deltas_written"] += len(pending)
+        return len(pending)
+    
+    def _write(self, deltas: Dict[Tuple[int, str], int]) -> None:
+        db = self.session_factory()
+        try:
+            ReactionRepository.apply_counter_deltas(db, deltas)
+            db.commit()
+        finally:
+            db.close()
+    
+    def reconcile(self) -> int:
+        """
+        Corregir contadores que no coincidan con la tabla de reacciones
+        
+        Returns:
+            Número de memoriales corregidos
+        """
+        with self._lock:
+            versions = dict(self._versions)
+            busy: Set[int] = self._busy()
+        
+        db = self.session_factory()
+        try:
+            exact = ReactionRepository.get_exact_counts(db)
+            # Después de contar: un toggle ya incluido en exact tiene su marca visible
+            busy |= ReactionRepository.get_recently_toggled(
+                db, datetime.utcnow() - timedelta(seconds=self.quiet_period)
+            )
+            with self._lock:
+                # Memoriales con toggles desde que se tomó la foto: su conteo puede ir por delante
+                busy |= {m for m, version in self._versions.items() if versions.get(m) != version}
+                busy |= self._busy()
+            exact = {m: counts for m, counts in exact.items() if m not in busy}
+            
+            stored = ReactionRepository.get_counter_counts(db, list(exact))
+            drifted = {m: counts for m, counts in exact.items() if stored[m] != counts}
+            ReactionRepository.set_counters(db, drifted)
+        finally:
+            db.close()
+        
+        for memorial_id in drifted:
+            self._counts.pop(memorial_id)
+        with self._lock:
+            # Los contadores de versión solo sirven entre dos pasadas
+            for memorial_id, version in versions.items():
+                if self._versions.get(memorial_id) == version:
+                    del self._versions[memorial_id]
+        
+        self._stats["reconciles"] += 1
+        self._stats["corrected"] += len(drifted)
+        if drifted:
+            print(f"Contadores de reacciones corregidos en {len(drifted)} memoriales")
+        return len(drifted)
+    
+    def _busy(self) -> Set[int]:
+        """Memoriales con toggles o deltas sin confirmar (llamar con _lock tomado)"""
+        return (set(self._in_flight) | set(self._flushing)
+                | {memorial_id for memorial_id, _ in self._pending})
+    
+    def clear(self) -> None:
+        """Descartar conteos y máscaras en memoria y deltas pendientes"""
+        self._counts.clear()
+        self._masks.clear()
+        with self._lock:
+            self._pending.clear()
+            self._versions.clear()
+    
+    def stats(self) -> Dict[str, int]:
+        """Métricas de la caché de contadores"""
+        with self._lock:
+            pending = len(self._pending)
+        return {"cached_memorials": len(self._counts), "cached_masks": len(self._masks),
+                "pending": pending, **self._stats}
+
+
+reaction_counter_cache = ReactionCounterCache(
+    flush_interval_ms=settings.REACTION_FLUSH_INTERVAL_MS,
+    reconcile_interval=settings.REACTION_RECONCILE_INTERVAL,
+    ttl=settings.REACTION_CACHE_TTL,
+    max_memorials=settings.REACTION_CACHE_MAX_MEMORIALS,
+    mask_ttl=settings.REACTION_MASK_CACHE_TTL,
+    max_masks=settings.REACTION_MASK_CACHE_SIZE
+)
@@ -0,0 +1,229 @@
+"""
+Contadores de visitas por día en memoria (hoy / 7 días / 30 días)
+Anillo de contadores diarios por memorial, cargado desde los agregados y
+actualizado al registrar visitas
+"""
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.core.cache import LRUCache
+from app.repositories import VisitRepository
+
+
+# Días que cubre el anillo: hoy y los 30 anteriores (igual que get_month_count)
+WINDOW_DAYS = 31
+
+
+class _DayRing:
+    """Contadores de los últimos WINDOW_DAYS días; cada hueco recuerda su día"""
+    
+    __slots__ = ("counts", "days")
+    
+    def __init__(self):
+        self.counts = [0] * WINDOW_DAYS
+        self.days = [0] * WINDOW_DAYS
+    
+    def add(self, day: date, amount: int) -> None:
+        ordinal = day.toordinal()
+        slot = ordinal % WINDOW_DAYS
+        if self.days[slot] < ordinal:
+            # El hueco guardaba un día que ya salió de la ventana
+            self.days[slot] = ordinal
+            self.counts[slot] = 0
+        if self.days[slot] == ordinal:
+            self.counts[slot] += amount
+    
+    def get(self, day: date) -> int:
+        ordinal = day.toordinal()
+        slot = ordinal % WINDOW_DAYS
+        return self.counts[slot] if self.days[slot] == ordinal else 0
+
+
+class MemoryCounterBackend:
+    """
+    Contadores en el proceso
+    
+    Guarda un anillo por memorial en una LRU acotada; las entradas caducan
+    a los ttl segundos y se vuelven a cargar desde la base de datos.
+    """
+    
+    def __init__(self, ttl: float = 300, max_memorials: int = 10000):
+        self._rings = LRUCache(max_entries=max_memorials, ttl=ttl or None)
+        self._lock = threading.Lock()
+    
+    def load(self, memorial_id: int, counts: Dict[date, int]) -> None:
+        ring = _DayRing()
+        for day, count in counts.items():
+            ring.add(day, count)
+        self._rings.set(memorial_id, ring)
+    
+    def incr(self, memorial_id: int, day: date, amount: int = 1) -> None:
+        ring = self._rings.get(memorial_id)
+        if ring is not None:
+            with self._lock:
+                ring.add(day, amount)
+    
+    def read(self, memorial_id: int, days: List[date]) -> Optional[List[int]]:
+        ring = self._rings.get(memorial_id)
+        if ring is None:
+            return None
+        with self._lock:
+            return [ring.get(day) for day in days]
+    
+    def invalidate(self, memorial_id: int) -> None:
+        self._rings.pop(memorial_id)
+
+
+class RedisCounterBackend:
+    """
+    Contadores compartidos entre workers en Redis (requiere el paquete redis)
+    
+    Un hash por memorial con un campo por día y una clave de control con
+    expiración ttl: mientras existe, los incrementos se aplican; al caducar
+    el siguiente lector vuelve a cargar el hash desde la base de datos.
+    """
+    
+    # Incrementar solo si el memorial está cargado (atómico en Redis)
+    _INCR_IF_LOADED = """
+    if redis.call('exists', KEYS[2]) == 1 then
+        return redis.call('hincrby', KEYS[1], ARGV[1], ARGV[2])
+    end
+    return nil
+    """
+    
+    def __init__(self, url: str, ttl: float = 300, prefix: str = "visit_counters"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("VISIT_COUNTERS_URL requiere el paquete 'redis' (pip install redis)")
+        self._client = redis.Redis.from_url(url)
+        self._incr = self._client.register_script(self._INCR_IF_LOADED)
+        self.ttl = max(1, int(ttl))
+        self.prefix = prefix
+    
+    def _keys(self, memorial_id: int) -> Tuple[str, str]:
+        base = f"{self.prefix}:{memorial_id}"
+        return base, f"{base}:loaded"
+    
+    def load(self, memorial_id: int, counts: Dict[date, int]) -> None:
+        counts_key, loaded_key = self._keys(memorial_id)
+        pipe = self._client.pipeline()
+        pipe.delete(counts_key)
+        if counts:
+            pipe.hset(counts_key, mapping={day.isoformat(): count for day, count in counts.items()})
+        pipe.expire(counts_key, self.ttl + 86400 * WINDOW_DAYS)
+        pipe.set(loaded_key, 1, ex=self.ttl)
+        pipe.execute()
+    
+    def incr(self, memorial_id: int, day: date, amount: int = 1) -> None:
+        self._incr(keys=list(self._keys(memorial_id)), args=[day.isoformat(), amount])
+    
+    def read(self, memorial_id: int, days: List[date]) -> Optional[List[int]]:
+        counts_key, loaded_key = self._keys(memorial_id)
+        pipe = self._client.pipeline()
+        pipe.exists(loaded_key)
+        pipe.hmget(counts_key, [day.isoformat() for day in days])
+        loaded, values = pipe.execute()
+        if not loaded:
+            return None
+        return [int(value or 0) for value in values]
+    
+    def invalidate(self, memorial_id: int) -> None:
+        self._client.delete(*self._keys(memorial_id))
+
+
+def create_counter_backend(url: str = "", ttl: float = 300, max_memorials: int = 10000):
+    """
+    Crear el backend de contadores según la configuración
+    
+    Args:
+        url: Vacío para contadores en el proceso, redis://... para compartirlos
+        ttl: Segundos hasta reconciliar un memorial con la base de datos
+        max_memorials: Memoriales en memoria (solo backend en proceso)
+    """
+    if not url:
+        return MemoryCounterBackend(ttl=ttl, max_memorials=max_memorials)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCounterBackend(url, ttl=ttl)
+    raise ValueError(f"Backend de contadores no soportado: {url}")
+
+
+class VisitCounters:
+    """
+    Visitas de hoy, últimos 7 y últimos 30 días sin consultar la base de datos
+    
+    La primera lectura de un memorial carga sus agregados diarios; después
+    las visitas nuevas se suman al anillo al insertarse. Al caducar la
+    entrada (ttl) se recarga desde la base de datos, lo que corrige
+    cualquier desajuste (p. ej. visitas insertadas mientras se cargaba).
+    """
+    
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryCounterBackend()
+        self._stats = {"hits": 0, "loads": 0, "errors": 0}
+    
+    def record(self, visits: Iterable[Tuple[int, datetime]]) -> None:
+        """
+        Sumar visitas ya insertadas
+        
+        Args:
+            visits: Pares (memorial_id, visited_at)
+        """
+        counts = Counter((memorial_id, visited_at.date()) for memorial_id, visited_at in visits)
+        try:
+            for (memorial_id, day), amount in counts.items():
+                self.backend.incr(memorial_id, day, amount)
+        except Exception as e:
+            # Un fallo del backend no debe impedir registrar visitas
+            self._stats["errors"] += 1
+            print(f"Error al actualizar contadores de visitas: {e}")
+    
+    def get(self, db: Session, memorial_id: int) -> Tuple[int, int, int]:
+        """
+        Obtener visitas de hoy, última semana y último mes
+        
+        Returns:
+            (hoy, semana, mes) con la misma definición que VisitRepository
+        """
+        today = datetime.utcnow().date()
+        days = [today - timedelta(days=offset) for offset in range(WINDOW_DAYS)]
+        
+        values = None
+        try:
+            values = self.backend.read(memorial_id, days)
+        except Exception as e:
+            self._stats["errors"] += 1
+            print(f"Error al leer contadores de visitas: {e}")
+        
+        if values is None:
+            self._stats["loads"] += 1
+            daily = VisitRepository.get_daily_counts_by_memorial(db, [memorial_id], start_date=days[-1])
+            counts = {day: count for day, count, _ in daily.get(memorial_id, [])}
+            try:
+                self.backend.load(memorial_id, counts)
+            except Exception as e:
+                self._stats["errors"] += 1
+                print(f"Error al cargar contadores de visitas: {e}")
+            values = [counts.get(day, 0) for day in days]
+        else:
+            self._stats["hits"] += 1
+        
+        return values[0], sum(values[:8]), sum(values)
+    
+    def invalidate(self, memorial_id: int) -> None:
+        """Forzar la recarga de un memorial en la próxima lectura"""
+        self.backend.invalidate(memorial_id)
+    
+    def stats(self) -> Dict[str, int]:
+        """Métricas de los contadores"""
+        return dict(self._stats)
+
+
+visit_counters = VisitCounters(create_counter_backend(
+    settings.VISIT_COUNTERS_URL,
+    ttl=settings.VISIT_COUNTERS_TTL,
+    max_memorials=settings.VISIT_COUNTERS_MAX_MEMORIALS
+))
@@ -0,0 +1,155 @@
+"""
+Servicio de exportación de visitas - CSV o NDJSON en streaming
+Las visitas se leen con un cursor del servidor y se escriben por bloques
+"""
+import io
+import csv
+import json
+from datetime import date, datetime
+from typing import Iterator, List, Optional, Sequence, Tuple
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from app.models import User
+from app.repositories import MemorialRepository, VisitRepository
+
+
+class VisitExportService:
+    """Servicio de exportación de visitas en crudo"""
+    
+    COLUMNS = ("id", "memorial_id", "visited_at", "country", "city", "referrer", "user_agent", "ip_address")
+    FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+    ROWS_PER_CHUNK = 500
+    # Caracteres con los que una celda se interpreta como fórmula en hojas de cálculo
+    FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+    
+    @staticmethod
+    def parse_columns(columns: Optional[str]) -> List[str]:
+        """
+        Validar la lista de columnas separadas por comas
+        
+        Raises:
+            HTTPException: 400 si alguna columna no existe
+        """
+        if not columns:
+            return list(VisitExportService.COLUMNS)
+        
+        selected = [c.strip() for c in columns.split(",") if c.strip()]
+        unknown = [c for c in selected if c not in VisitExportService.COLUMNS]
+        if unknown or not selected:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Columnas no válidas: {', '.join(unknown)}. "
+                       f"Disponibles: {', '.join(VisitExportService.COLUMNS)}"
+            )
+        return selected
+    
+    @staticmethod
+    def resolve_memorials(db: Session, current_user: User, slug: Optional[str] = None) -> Tuple[List[int], str]:
+        """
+        Obtener los memoriales a exportar (uno o toda la cuenta)
+        
+        Returns:
+            IDs de memoriales y prefijo del nombre de archivo
+        
+        Raises:
+            HTTPException: 404 si el memorial no existe o no es del usuario
+        """
+        if slug is None:
+            memorials = MemorialRepository.get_by_user(db, current_user.id)
+            return [m.id for m in memorials], "visitas"
+        
+        memorial = MemorialRepository.get_by_slug(db, slug)
+        if not memorial or memorial.owner_id != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Memorial no encontrado"
+            )
+        return [memorial.id], f"visitas-{memorial.slug}"
+    
+    @staticmethod
+    def export(db: Session, current_user: User, slug: Optional[str] = None, fmt: str = "csv",
+               columns: Optional[str] = None, start_date: date = None,
+               end_date: date = None) -> StreamingResponse:
+        """
+        Exportar las visitas de un memorial o de toda la cuenta en streaming
+        
+        Args:
+            db: Sesión de base de datos
+            current_user: Usuario autenticado
+            slug: Memorial a exportar (None = todos los del usuario)
+            fmt: "csv" o "ndjson"
+            columns: Columnas separadas por comas (por defecto todas)
+            start_date: Inicio del filtro (opcional)
+            end_date: Fin del filtro (opcional)
+        
+        Returns:
+            Archivo en streaming
+        """
+        selected = VisitExportService.parse_columns(columns)
+        memorial_ids, prefix = VisitExportService.resolve_memorials(db, current_user, slug)
+        rows = VisitRepository.iter_rows(db, memorial_ids, selected, start_date, end_date)
+        
+        if fmt == "ndjson":
+            body = VisitExportService.stream_ndjson(selected, rows)
+        else:
+            body = VisitExportService.stream_csv(selected, rows)
+        
+        stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+        return StreamingResponse(
+            body,
+            media_type=VisitExportService.FORMATS[fmt],
+            headers={"Content-Disposition": f'attachment; filename="{prefix}-{stamp}.{fmt}"'}
+        )
+    
+    @staticmethod
+    def _json_value(value):
+        """Serializar fechas en ISO 8601"""
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        return str(value)
+    
+    @staticmethod
+    def _csv_value(value):
+        """
+        Serializar una celda CSV neutralizando fórmulas
+        
+        user_agent y referrer los envía el visitante: un valor que empiece
+        por =, +, - o @ lo ejecutaría la hoja de cálculo como fórmula, así
+        que se antepone un apóstrofo.
+        """
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if isinstance(value, str) and value.startswith(VisitExportService.FORMULA_PREFIXES):
+            return "'" + value
+        return value
+    
+    @staticmethod
+    def stream_csv(columns: Sequence[str], rows: Iterator[Tuple]) -> Iterator[str]:
+        """Generar CSV por bloques de filas, empezando por la cabecera"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        
+        for index, row in enumerate(rows, start=1):
+            writer.writerow(VisitExportService._csv_value(value) for value in row)
+            if index % VisitExportService.ROWS_PER_CHUNK == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        
+        yield buffer.getvalue()
+    
+    @staticmethod
+    def stream_ndjson(columns: Sequence[str], rows: Iterator[Tuple]) -> Iterator[str]:
+        """Generar un objeto JSON por línea, agrupando líneas por bloque"""
+        lines = []
+        for row in rows:
+            lines.append(json.dumps(dict(zip(columns, row)), default=VisitExportService._json_value,
+                                    ensure_ascii=False))
+            if len(lines) == VisitExportService.ROWS_PER_CHUNK:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        
+        if lines:
+            yield "\n".join(lines) + "\n"
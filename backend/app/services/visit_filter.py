@@ -0,0 +1,105 @@
+"""
+Filtro de visitas - Descarta bots y escaneos repetidos antes de registrarlos
+"""
+import re
+import threading
+from typing import Dict, Optional
+from app.config import settings
+from app.core.cache import LRUCache
+
+
+class VisitFilter:
+    """
+    Etapa de filtrado previa a la ingesta de visitas
+    
+    Descarta peticiones de crawlers de vista previa de enlaces (WhatsApp,
+    Facebook, Telegram...), buscadores, monitores de disponibilidad y
+    clientes HTTP de línea de comandos, además de visitas repetidas del
+    mismo visitante (memorial, IP, user agent) dentro de dedup_window
+    segundos, p. ej. refrescos de página.
+    """
+    
+    BOT = "bot"
+    DUPLICATE = "duplicate"
+    
+    # Una sola expresión compilada: se evalúa una vez por visita.
+    # Solo formas propias de crawlers ("...bot/2.1", "...bot;", "+http://...")
+    # y nombres concretos: palabras sueltas como "bot", "pinterest" o
+    # "monitor" aparecen en móviles reales (CUBOT, navegador de Pinterest).
+    BOT_USER_AGENTS = re.compile(
+        r"bot/|bot;|\+https?://|crawl|spider|slurp|facebookexternalhit|facebookcatalog|whatsapp/|"
+        r"telegrambot|twitterbot|slackbot|discordbot|linkedinbot|pinterestbot|skypeuripreview|"
+        r"vkshare|embedly|quora link|outbrain|bingpreview|headlesschrome|phantomjs|lighthouse|"
+        r"uptimerobot|pingdom|statuscake|site24x7|betteruptime|better uptime|uptime-kuma|"
+        r"newrelicpinger|datadog|freshping|hetrixtools|nodeping|zabbix|check_http/|kube-probe/|"
+        r"googlehc/|elb-healthchecker|healthcheck|curl/|wget/|python-requests|python-httpx|aiohttp|"
+        r"go-http-client|okhttp|java/|libwww|httpclient|node-fetch|axios/",
+        re.IGNORECASE
+    )
+    
+    def __init__(self, filter_bots: bool = True, dedup_window: float = 300,
+                 max_entries: int = 100000):
+        self.filter_bots = filter_bots
+        self.dedup_window = dedup_window
+        self._seen = LRUCache(max_entries=max_entries if dedup_window > 0 else 0,
+                              ttl=dedup_window or None)
+        self._lock = threading.Lock()
+        self._stats = {"accepted": 0, "bots": 0, "duplicates": 0}
+    
+    def is_bot(self, user_agent: Optional[str]) -> bool:
+        """Indicar si el user agent corresponde a un bot (sin user agent cuenta como bot)"""
+        if not user_agent:
+            return True
+        return self.BOT_USER_AGENTS.search(user_agent) is not None
+    
+    def check(self, memorial_id: int, ip_address: Optional[str],
+              user_agent: Optional[str]) -> Optional[str]:
+        """
+        Clasificar una visita antes de registrarla
+        
+        Args:
+            memorial_id: ID del memorial visitado
+            ip_address: IP del cliente
+            user_agent: User agent del cliente
+        
+        Returns:
+            None si la visita se debe registrar, o el motivo del descarte
+            (VisitFilter.BOT o VisitFilter.DUPLICATE)
+        """
+        if self.filter_bots and self.is_bot(user_agent):
+            reason = self.BOT
+        else:
+            key = (memorial_id, ip_address, user_agent)
+            with self._lock:
+                # Comprobar y marcar de forma atómica entre peticiones concurrentes
+                duplicate = key in self._seen
+                if not duplicate:
+                    self._seen.set(key, True)
+            reason = self.DUPLICATE if duplicate else None
+        
+        with self._lock:
+            if reason == self.BOT:
+                self._stats["bots"] += 1
+            elif reason == self.DUPLICATE:
+                self._stats["duplicates"] += 1
+            else:
+                self._stats["accepted"] += 1
+        return reason
+    
+    def clear(self) -> None:
+        """Vaciar la caché de visitas recientes y las métricas"""
+        self._seen.clear()
+        with self._lock:
+            self._stats = dict.fromkeys(self._stats, 0)
+    
+    def stats(self) -> Dict[str, int]:
+        """Métricas de visitas aceptadas y descartadas"""
+        with self._lock:
+            return {"tracked_visitors": len(self._seen), **self._stats}
+
+
+visit_filter = VisitFilter(
+    filter_bots=settings.VISIT_FILTER_BOTS,
+    dedup_window=settings.VISIT_DEDUP_WINDOW,
+    max_entries=settings.VISIT_DEDUP_MAX_ENTRIES
+)
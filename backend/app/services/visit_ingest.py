@@ -0,0 +1,233 @@
+"""
+Ingesta de visitas - Buffer en memoria con inserción por lotes
+Las visitas se aceptan sin esperar a la base de datos y se escriben en bloque
+"""
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy.exc import IntegrityError
+from app.config import settings
+from app.db.session import SessionLocal
+from app.repositories import VisitRepository
+from app.services.geo_enrichment import geo_enrichment_worker
+from app.services.visit_counters import visit_counters
+
+
+class VisitIngestBuffer:
+    """
+    Cola acotada de visitas pendientes de insertar
+    
+    Se vacía con un INSERT multi-fila cada max_batch visitas o cada
+    flush_interval_ms, lo que ocurra primero. Al apagar la aplicación se
+    escriben las visitas pendientes. La fecha de la visita se toma al
+    aceptarla, no al insertarla.
+    
+    Si la base de datos falla, el lote vuelve al principio de la cola (hasta
+    max_retries intentos por visita y sin pasar de max_pending) y el
+    siguiente vaciado espera un tiempo creciente. Si el lote choca con una
+    restricción (p. ej. un memorial borrado mientras sus visitas esperaban)
+    se inserta fila a fila y solo se descartan las filas inválidas.
+    """
+    
+    def __init__(self, max_batch: int = 200, flush_interval_ms: int = 250,
+                 max_pending: int = 10000, max_retries: int = 5,
+                 session_factory=SessionLocal):
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending = max(self.max_batch, max_pending)
+        self.max_retries = max_retries
+        self.session_factory = session_factory
+        self._pending: Deque[Dict] = deque()
+        # Vaciados fallidos consecutivos (determina la espera antes de reintentar)
+        self._failures = 0
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "accepted": 0,
+            "rejected": 0,
+            "inserted": 0,
+            "retried": 0,
+            "discarded": 0,
+            "failed": 0,
+            "batches": 0,
+        }
+    
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+    
+    def start(self) -> None:
+        """Arrancar la tarea de vaciado en el loop actual"""
+        if self.running:
+            return
+        # Primitivas nuevas: cada arranque puede ocurrir en un loop distinto
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """
+        Detener la tarea y escribir las visitas pendientes
+        
+        Con la base de datos caída se reintenta con espera hasta agotar los
+        intentos de cada visita, así que el apagado siempre termina.
+        """
+        if not self.running:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        while self._pending:
+            await self.flush()
+            if self._failures:
+                await asyncio.sleep(self._backoff())
+    
+    def submit(self, memorial_id: int, ip_address: str = None,
+               user_agent: str = None, referrer: str = None) -> None:
+        """
+        Aceptar una visita sin esperar a la base de datos
+        
+        Raises:
+            HTTPException: 503 si el buffer está lleno
+        """
+        if len(self._pending) >= self.max_pending:
+            self._stats["rejected"] += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Demasiadas visitas pendientes, intenta de nuevo",
+                headers={"Retry-After": "1"}
+            )
+        
+        self._pending.append({
+            "memorial_id": memorial_id,
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+            "referrer": referrer,
+            "visited_at": datetime.utcnow(),
+        })
+        self._stats["accepted"] += 1
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+    
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._pending:
+                # Un lote en curso termina aunque se cancele la tarea al apagar
+                await asyncio.shield(self.flush())
+                if self._failures:
+                    # Base de datos con problemas: esperar en lugar de reintentar en bucle
+                    await asyncio.sleep(self._backoff())
+                    break
+                if len(self._pending) < self.max_batch:
+                    break
+    
+    def _backoff(self) -> float:
+        """Segundos de espera tras vaciados fallidos consecutivos (exponencial, máx. 30)"""
+        return min(30.0, self.flush_interval * 4 * 2 ** max(0, self._failures - 1))
+    
+    async def flush(self) -> int:
+        """
+        Insertar un lote de visitas pendientes
+        
+        Returns:
+            Número de visitas insertadas
+        """
+        async with self._flush_lock:
+            batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+            if not batch:
+                return 0
+            try:
+                inserted, retry = await asyncio.to_thread(self._insert, batch)
+            except Exception as e:
+                print(f"Error al insertar lote de {len(batch)} visitas: {e}")
+                inserted, retry = [], batch
+            if retry:
+                self._requeue(retry)
+            self._failures = self._failures + 1 if retry else 0
+        
+        self._stats["inserted"] += len(inserted)
+        if inserted:
+            self._stats["batches"] += 1
+        for visit_id, row in inserted:
+            if row["ip_address"]:
+                geo_enrichment_worker.enqueue(visit_id, row["ip_address"])
+        return len(inserted)
+    
+    def _requeue(self, rows: List[Dict]) -> None:
+        """Devolver visitas no escritas al principio de la cola, en su orden"""
+        keep = []
+        for row in rows:
+            row["retries"] = row.get("retries", 0) + 1
+            if row["retries"] <= self.max_retries:
+                keep.append(row)
+        room = max(0, self.max_pending - len(self._pending))
+        dropped = len(rows) - len(keep[:room])
+        self._pending.extendleft(reversed(keep[:room]))
+        self._stats["retried"] += len(keep[:room])
+        if dropped:
+            self._stats["failed"] += dropped
+            print(f"{dropped} visitas descartadas tras agotar los reintentos")
+    
+    @staticmethod
+    def _columns(row: Dict) -> Dict:
+        return {key: value for key, value in row.items() if key != "retries"}
+    
+    def _insert(self, batch: List[Dict]) -> Tuple[List[Tuple[int, Dict]], List[Dict]]:
+        """
+        Insertar un lote (en el hilo de trabajo)
+        
+        Returns:
+            Visitas insertadas como (id, fila) y visitas a reintentar
+        """
+        db = self.session_factory()
+        try:
+            try:
+                ids = VisitRepository.bulk_create(db, [self._columns(row) for row in batch])
+                inserted, retry = list(zip(ids, batch)), []
+            except IntegrityError:
+                db.rollback()
+                inserted, retry = self._insert_each(db, batch)
+        finally:
+            db.close()
+        if inserted:
+            visit_counters.record((row["memorial_id"], row["visited_at"]) for _, row in inserted)
+        return inserted, retry
+    
+    def _insert_each(self, db, batch: List[Dict]) -> Tuple[List[Tuple[int, Dict]], List[Dict]]:
+        """Insertar fila a fila descartando solo las que violan una restricción"""
+        inserted = []
+        for index, row in enumerate(batch):
+            try:
+                ids = VisitRepository.bulk_create(db, [self._columns(row)])
+            except IntegrityError as e:
+                db.rollback()
+                self._stats["discarded"] += 1
+                print(f"Visita descartada (memorial {row['memorial_id']}): {e.orig}")
+                continue
+            except Exception as e:
+                # Fallo de la base de datos: el resto del lote se reintenta
+                db.rollback()
+                print(f"Error al insertar visitas de una en una: {e}")
+                return inserted, batch[index:]
+            inserted.append((ids[0], row))
+        return inserted, []
+    
+    def stats(self) -> Dict[str, int]:
+        """Métricas del buffer de ingesta"""
+        return {"pending": len(self._pending), **self._stats}
+
+
+visit_ingest_buffer = VisitIngestBuffer(
+    max_batch=settings.VISIT_BATCH_SIZE,
+    flush_interval_ms=settings.VISIT_FLUSH_INTERVAL_MS,
+    max_pending=settings.VISIT_BUFFER_MAX,
+    max_retries=settings.VISIT_FLUSH_RETRIES
+)
@@ -0,0 +1,83 @@
+"""
+Compactador de agregados diarios de visitas
+Recalcula periódicamente los días recientes (conteo exacto y sketches de visitantes)
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from app.config import settings
+from app.db.session import SessionLocal
+from app.repositories import VisitRepository
+
+
+class VisitRollupCompactor:
+    """
+    Tarea periódica que mantiene visit_daily_rollups
+    
+    Conteos y sketches de visitantes únicos se actualizan de forma
+    incremental al insertar visitas; el compactador los reconstruye para
+    los últimos días y corrige posibles desajustes. El historial previo lo
+    rellena una migración al arrancar; si aun así la tabla está vacía,
+    la pasada reconstruye todo el historial como reparación.
+    """
+    
+    def __init__(self, interval: float = 300, recent_days: int = 2, session_factory=SessionLocal):
+        self.interval = interval
+        self.recent_days = max(1, recent_days)
+        self.session_factory = session_factory
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"runs": 0, "rollups_written": 0, "failed": 0}
+    
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+    
+    def start(self) -> None:
+        """Arrancar la tarea periódica en el loop actual"""
+        if not self.running and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Detener la tarea periódica"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+    
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.compact)
+            except Exception as e:
+                self._stats["failed"] += 1
+                print(f"Error al compactar agregados de visitas: {e}")
+            await asyncio.sleep(self.interval)
+    
+    def compact(self) -> int:
+        """
+        Recalcular los días recientes (o todo, si aún no hay agregados)
+        
+        Returns:
+            Número de agregados escritos
+        """
+        db = self.session_factory()
+        try:
+            since = None
+            if VisitRepository.has_rollups(db):
+                since = (datetime.utcnow() - timedelta(days=self.recent_days - 1)).date()
+            written = VisitRepository.compact_rollups(db, since=since)
+        finally:
+            db.close()
+        self._stats["runs"] += 1
+        self._stats["rollups_written"] += written
+        return written
+    
+    def stats(self) -> Dict[str, int]:
+        """Métricas del compactador"""
+        return dict(self._stats)
+
+
+visit_rollup_compactor = VisitRollupCompactor(
+    interval=settings.ROLLUP_COMPACT_INTERVAL,
+    recent_days=settings.ROLLUP_COMPACT_DAYS
+)
@@ -0,0 +1,60 @@
+"""
+Microbenchmark - Costo por llamada de GeoService.get_location_sync
+
+Compara el puente anterior (hilo + asyncio.run por llamada) con el loop
+de fondo persistente. El proveedor HTTP se simula para medir solo el
+costo del puente síncrono.
+
+Uso (desde backend/):
+    python -m benchmarks.geo_sync [iteraciones]
+"""
+import sys
+import time
+import asyncio
+import concurrent.futures
+from app.services.geo import GeoService, GeoLocation
+from app.core.background_loop import background_loop
+
+
+async def _fake_provider(url: str) -> GeoLocation:
+    return GeoLocation(country="Chile", city="Santiago")
+
+
+def legacy_get_location_sync(ip_address: str) -> GeoLocation:
+    """Puente anterior: un hilo y un event loop nuevos por llamada"""
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        future = executor.submit(asyncio.run, GeoService.get_location(ip_address))
+        return future.result(timeout=10)
+
+
+def _measure(label: str, fn, iterations: int) -> float:
+    started = time.perf_counter()
+    for i in range(iterations):
+        GeoService._cache.clear()
+        fn(f"8.8.{i // 250 % 250}.{i % 250}")
+    per_call = (time.perf_counter() - started) / iterations * 1e6
+    print(f"{label:<32} {per_call:>10.1f} µs/llamada")
+    return per_call
+
+
+def main(iterations: int = 500) -> None:
+    GeoService._query_provider = staticmethod(_fake_provider)
+    GeoService.PROVIDERS = ["https://geo.example/{ip}"]
+    
+    print(f"{iterations} llamadas sin caché (proveedor simulado)")
+    legacy = _measure("hilo + asyncio.run por llamada", legacy_get_location_sync, iterations)
+    current = _measure("loop de fondo persistente", GeoService.get_location_sync, iterations)
+    print(f"{'mejora':<32} {legacy / current:>10.1f}x")
+    
+    GeoService.get_location_sync("8.8.8.8")
+    started = time.perf_counter()
+    for _ in range(iterations):
+        GeoService.get_location_sync("8.8.8.8")
+    cached = (time.perf_counter() - started) / iterations * 1e6
+    print(f"{'acierto de caché (sin loop)':<32} {cached:>10.1f} µs/llamada")
+    
+    background_loop.stop()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
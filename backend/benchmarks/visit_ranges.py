@@ -0,0 +1,151 @@
+"""
+Benchmark - Filtros por rango de fechas sobre visits y reactions
+
+Siembra visitas y reacciones sintéticas y compara plan de consulta y
+latencia de:
+    antes:   función sobre la columna (date(visited_at) >= ... AND <= ...) e
+             índices de una sola columna
+    después: rango semiabierto sobre la columna e índices compuestos
+             creados por app.db.migrations
+
+Uso (desde backend/):
+    python -m benchmarks.visit_ranges [--rows 1000000] [--url sqlite:///bench.db]
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta, date
+from statistics import median
+from sqlalchemy import create_engine, func, select, text, insert
+from app.db import Base
+from app.db.filters import date_range
+from app.db.migrations import run_migrations
+from app.models import User, Memorial, Visit, Reaction
+from app.repositories.reaction import ReactionRepository
+
+
+MEMORIALS = 50
+DAYS = 365
+REACTION_TYPES = ("candle", "flower", "heart", "pray", "dove")
+COMPOSITE_INDEXES = ("ix_visits_memorial_visited_at", "ix_reactions_memorial_created_type")
+
+
+def seed(engine, rows: int) -> None:
+    """Sembrar visitas repartidas en un año entre varios memoriales"""
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    with engine.begin() as connection:
+        connection.execute(insert(User), [{"email": "bench@example.com", "hashed_password": "-"}])
+        connection.execute(insert(Memorial), [
+            {"name": f"Memorial {i}", "slug": f"memorial-{i}", "owner_id": 1} for i in range(MEMORIALS)
+        ])
+        chunk = 50000
+        for offset in range(0, rows, chunk):
+            connection.execute(insert(Visit), [
+                {
+                    "memorial_id": rng.randint(1, MEMORIALS),
+                    "ip_address": f"10.0.{rng.randint(0, 255)}.{rng.randint(0, 255)}",
+                    "visited_at": now - timedelta(seconds=rng.randint(0, DAYS * 86400)),
+                }
+                for _ in range(min(chunk, rows - offset))
+            ])
+        connection.execute(insert(Reaction), [
+            {
+                "memorial_id": rng.randint(1, MEMORIALS),
+                "reaction_type": rng.choice(REACTION_TYPES),
+                "visitor_key": ReactionRepository.visitor_key(f"visitor-{i}"),
+                "created_at": now - timedelta(seconds=rng.randint(0, DAYS * 86400)),
+            }
+            for i in range(rows // 10)
+        ])
+
+
+def queries(start: date, end: date, sargable: bool):
+    """Consultas representativas del dashboard para un memorial"""
+    if sargable:
+        visit_filter = date_range(Visit.visited_at, start, end)
+        reaction_filter = date_range(Reaction.created_at, start, end)
+    else:
+        visit_filter = [func.date(Visit.visited_at) >= start, func.date(Visit.visited_at) <= end]
+        reaction_filter = [func.date(Reaction.created_at) >= start, func.date(Reaction.created_at) <= end]
+    
+    return {
+        "visitas en rango": select(func.count(Visit.id)).where(Visit.memorial_id == 7, *visit_filter),
+        "reacciones por tipo": select(Reaction.reaction_type, func.count(Reaction.id)).where(
+            Reaction.memorial_id == 7, *reaction_filter
+        ).group_by(Reaction.reaction_type),
+    }
+
+
+def explain(connection, statement) -> str:
+    compiled = statement.compile(connection, compile_kwargs={"literal_binds": True})
+    if connection.dialect.name == "postgresql":
+        rows = connection.execute(text(f"EXPLAIN ANALYZE {compiled}")).fetchall()
+        return "\n".join(f"    {r[0]}" for r in rows)
+    rows = connection.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).fetchall()
+    return "\n".join(f"    {r[-1]}" for r in rows)
+
+
+def measure(engine, label: str, sargable: bool, repeat: int = 7) -> None:
+    end = datetime.utcnow().date()
+    start = end - timedelta(days=30)
+    print(f"\n== {label} ==")
+    with engine.connect() as connection:
+        for name, statement in queries(start, end, sargable).items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                connection.execute(statement).fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+            print(f"{name}: mediana {median(timings):.2f} ms")
+            print(explain(connection, statement))
+
+
+def drop_composite_indexes(engine) -> None:
+    """Partir del esquema anterior (solo índices de una columna)"""
+    with engine.begin() as connection:
+        for index in COMPOSITE_INDEXES:
+            connection.execute(text(f"DROP INDEX IF EXISTS {index}"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="visitas a sembrar")
+    parser.add_argument("--url", default=None, help="URL de base de datos (por defecto SQLite temporal)")
+    args = parser.parse_args()
+    
+    path = None
+    url = args.url
+    if url is None:
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        url = f"sqlite:///{path}"
+    
+    engine = create_engine(url)
+    try:
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+        drop_composite_indexes(engine)
+        
+        started = time.perf_counter()
+        seed(engine, args.rows)
+        print(f"{args.rows} visitas sembradas en {time.perf_counter() - started:.1f} s")
+        with engine.begin() as connection:
+            connection.execute(text("ANALYZE"))
+        
+        measure(engine, "antes: función sobre la columna, índices simples", sargable=False)
+        
+        run_migrations(engine)
+        with engine.begin() as connection:
+            connection.execute(text("ANALYZE"))
+        measure(engine, "después: rango semiabierto, índices compuestos", sargable=True)
+    finally:
+        engine.dispose()
+        if path:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,9 +10,16 @@ from sqlalchemy.pool import StaticPool
 
 from app.main import app
 from app.db import Base, get_db
+from app.db.migrations import run_migrations
 from app.models import User, Memorial, Condolence, Visit, TimelineEvent
 from app.core.security import get_password_hash
 from app.services import AuthService
+from app.services.geo_enrichment import geo_enrichment_worker
+from app.services.visit_ingest import visit_ingest_buffer
+from app.services.visit_rollup import visit_rollup_compactor
+from app.services.visit_counters import visit_counters, MemoryCounterBackend
+from app.services.visit_filter import visit_filter
+from app.services.reaction_counters import reaction_counter_cache
 
 
 # Base de datos en memoria para tests
@@ -32,6 +39,11 @@ def db() -> Generator[Session, None, None]:
     Crear base de datos limpia para cada test
     """
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    # Los IDs se repiten entre tests: contadores vacíos para cada base de datos
+    visit_counters.backend = MemoryCounterBackend()
+    visit_filter.clear()
+    reaction_counter_cache.clear()
     session = TestingSessionLocal()
     try:
         yield session
@@ -52,6 +64,12 @@ def client(db: Session) -> Generator[TestClient, None, None]:
             pass
     
     app.dependency_overrides[get_db] = override_get_db
+    # Los workers en segundo plano usan la misma base de datos de test
+    geo_enrichment_worker.session_factory = TestingSessionLocal
+    visit_ingest_buffer.session_factory = TestingSessionLocal
+    reaction_counter_cache.session_factory = TestingSessionLocal
+    # Sin compactación periódica: los tests la invocan explícitamente
+    visit_rollup_compactor.interval = 0
     with TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
@@ -1,11 +1,17 @@
 """
 Tests para endpoints de la API
 """
+import io
+import json
+import zipfile
 import pytest
+from PIL import features
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 
-from app.models import User, Memorial
+from app.config import settings
+from app.models import User, Memorial, Visit, Condolence, CondolenceCounter
+from app.repositories import VisitRepository
 
 
 class TestAuthEndpoints:
@@ -189,6 +195,70 @@ class TestMemorialEndpoints:
         
         assert response.status_code == 200
         assert "eliminado" in response.json()["message"]
+    
+    @pytest.mark.integration
+    def test_get_qr_code_etag(self, client: TestClient, auth_headers: dict, test_memorial: Memorial):
+        """Test el QR se sirve con ETag y responde 304 si no cambió"""
+        response = client.get(f"/api/v1/memorials/{test_memorial.slug}/qr", headers=auth_headers)
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/png"
+        
+        cached = client.get(
+            f"/api/v1/memorials/{test_memorial.slug}/qr",
+            headers={**auth_headers, "If-None-Match": response.headers["etag"]}
+        )
+        
+        assert cached.status_code == 304
+    
+    @pytest.mark.integration
+    def test_get_qr_webp_unsupported(self, client: TestClient, auth_headers: dict,
+                                     test_memorial: Memorial, monkeypatch):
+        """Test pedir WebP cuando Pillow no lo soporta devuelve 400"""
+        monkeypatch.setattr(features, "check", lambda name: False)
+        
+        for path in ("qr", "qr-simple"):
+            response = client.get(
+                f"/api/v1/memorials/{test_memorial.slug}/{path}?format=webp",
+                headers=auth_headers
+            )
+            assert response.status_code == 400
+    
+    @pytest.mark.integration
+    def test_export_qr_zip(self, client: TestClient, auth_headers: dict, multiple_memorials: list):
+        """Test exportar todos los QR del usuario como ZIP"""
+        response = client.post("/api/v1/memorials/qr/export", json={}, headers=auth_headers)
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/zip"
+        
+        archive = zipfile.ZipFile(io.BytesIO(response.content))
+        assert sorted(archive.namelist()) == sorted(f"qr-{m.slug}.png" for m in multiple_memorials)
+    
+    @pytest.mark.integration
+    def test_export_qr_pdf(self, client: TestClient, auth_headers: dict, multiple_memorials: list):
+        """Test exportar QR seleccionados como PDF con varios códigos por hoja"""
+        response = client.post(
+            "/api/v1/memorials/qr/export",
+            json={"slugs": [m.slug for m in multiple_memorials], "format": "pdf", "per_page": 2},
+            headers=auth_headers
+        )
+        
+        assert response.status_code == 200
+        assert response.content.startswith(b"%PDF-")
+        assert response.content.rstrip().endswith(b"%%EOF")
+        assert b"/Count 2" in response.content
+    
+    @pytest.mark.integration
+    def test_export_qr_foreign_slug(self, client: TestClient, auth_headers: dict):
+        """Test no se pueden exportar memoriales de otro usuario"""
+        response = client.post(
+            "/api/v1/memorials/qr/export",
+            json={"slugs": ["memorial-ajeno"]},
+            headers=auth_headers
+        )
+        
+        assert response.status_code == 404
 
 
 class TestAnalyticsEndpoints:
@@ -199,10 +269,25 @@ class TestAnalyticsEndpoints:
         """Test registrar visita"""
         response = client.post(f"/api/v1/analytics/visit/{test_memorial.slug}")
         
-        assert response.status_code == 200
+        assert response.status_code == 202
         data = response.json()
         assert "message" in data or "memorial_id" in data
     
+    @pytest.mark.integration
+    def test_register_visit_filters_bots_and_repeats(self, client: TestClient, test_memorial: Memorial):
+        """Test los crawlers y los refrescos del mismo visitante no se cuentan"""
+        url = f"/api/v1/analytics/visit/{test_memorial.slug}"
+        browser = {"User-Agent": "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X)"}
+        
+        first = client.post(url, headers=browser)
+        repeat = client.post(url, headers=browser)
+        preview = client.post(url, headers={"User-Agent": "WhatsApp/2.23.20.0 A"})
+        
+        assert [r.status_code for r in (first, repeat, preview)] == [202, 202, 202]
+        assert [r.json()["counted"] for r in (first, repeat, preview)] == [True, False, False]
+        stats = client.get("/health").json()["visit_filter"]
+        assert (stats["accepted"], stats["duplicates"], stats["bots"]) == (1, 1, 1)
+    
     @pytest.mark.integration
     def test_register_visit_not_found(self, client: TestClient):
         """Test registrar visita en memorial inexistente"""
@@ -269,6 +354,163 @@ class TestAnalyticsEndpoints:
         assert response.status_code == 200
         data = response.json()
         assert "total_memorials" in data
+    
+    @pytest.mark.integration
+    def test_dashboard_page_with_daily_series(self, client: TestClient, auth_headers: dict, multiple_memorials: list):
+        """Test dashboard paginado con serie diaria y orden por actividad"""
+        response = client.get(
+            "/api/v1/analytics/dashboard/memorials?sort=activity&fields=daily&limit=2",
+            headers=auth_headers
+        )
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["items"]) == 2
+        assert "daily_visits" in data["items"][0]
+        assert data["next_cursor"]
+        
+        response = client.get(
+            f"/api/v1/analytics/dashboard/memorials?sort=activity&limit=2&cursor={data['next_cursor']}",
+            headers=auth_headers
+        )
+        
+        assert response.status_code == 200
+        assert len(response.json()["items"]) == 1
+        assert response.json()["next_cursor"] is None
+    
+    @pytest.mark.integration
+    def test_export_visits_csv(self, client: TestClient, auth_headers: dict, test_memorial: Memorial, test_visit):
+        """Test exportar visitas de un memorial en CSV con columnas elegidas"""
+        response = client.get(
+            f"/api/v1/analytics/export/{test_memorial.slug}?columns=id,country",
+            headers=auth_headers
+        )
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        lines = response.text.strip().splitlines()
+        assert lines[0] == "id,country"
+        assert lines[1] == f"{test_visit.id},{test_visit.country or ''}"
+    
+    @pytest.mark.integration
+    def test_export_visits_csv_escapes_formulas(self, client: TestClient, auth_headers: dict,
+                                                db: Session, test_memorial: Memorial):
+        """Test las celdas que empiezan como fórmula se exportan neutralizadas en CSV y tal cual en NDJSON"""
+        db.add(Visit(memorial_id=test_memorial.id, user_agent="=HYPERLINK(\"http://x\")", referrer="@SUM(1)"))
+        db.commit()
+        
+        response = client.get(
+            f"/api/v1/analytics/export/{test_memorial.slug}?columns=user_agent,referrer",
+            headers=auth_headers
+        )
+        
+        assert response.status_code == 200
+        assert response.text.splitlines()[1] == '"\'=HYPERLINK(""http://x"")",\'@SUM(1)'
+        
+        response = client.get(
+            f"/api/v1/analytics/export/{test_memorial.slug}?format=ndjson&columns=referrer",
+            headers=auth_headers
+        )
+        assert json.loads(response.text) == {"referrer": "@SUM(1)"}
+    
+    @pytest.mark.integration
+    def test_export_visits_ndjson(self, client: TestClient, auth_headers: dict, test_memorial: Memorial, test_visit):
+        """Test exportar visitas de la cuenta en NDJSON"""
+        response = client.get("/api/v1/analytics/export?format=ndjson", headers=auth_headers)
+        
+        assert response.status_code == 200
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert len(rows) == 1
+        assert rows[0]["memorial_id"] == test_memorial.id
+        assert "visited_at" in rows[0]
+    
+    @pytest.mark.integration
+    def test_export_visits_invalid_column(self, client: TestClient, auth_headers: dict, test_memorial: Memorial):
+        """Test exportar con una columna inexistente"""
+        response = client.get(
+            f"/api/v1/analytics/export/{test_memorial.slug}?columns=password",
+            headers=auth_headers
+        )
+        
+        assert response.status_code == 400
+    
+    
+    @pytest.mark.integration
+    def test_account_locations(self, client: TestClient, auth_headers: dict, db: Session, test_memorial: Memorial):
+        """Test top de países y ciudades de la cuenta"""
+        db.add(Visit(memorial_id=test_memorial.id))
+        db.commit()
+        visit_id = db.query(Visit.id).scalar()
+        VisitRepository.update_location(db, visit_id, "Chile", "Valparaíso")
+        
+        response = client.get("/api/v1/analytics/locations?period=week", headers=auth_headers)
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["countries"] == [{"country": "Chile", "count": 1}]
+        assert data["locations"] == [{"country": "Chile", "city": "Valparaíso", "count": 1}]
+
+
+class TestCondolenceEndpoints:
+    """Tests para el listado público de condolencias"""
+    
+    @pytest.mark.integration
+    def test_public_listing_pages_by_cursor(self, client: TestClient, db: Session, test_memorial: Memorial):
+        """Test recorrer el libro por cursor: destacadas primero, sin repetir ni saltar"""
+        for i in range(5):
+            db.add(Condolence(
+                memorial_id=test_memorial.id, author_name=f"Autor {i}", message="Mensaje de prueba",
+                is_approved=True, is_featured=(i == 1)
+            ))
+        db.add(Condolence(memorial_id=test_memorial.id, author_name="Pendiente", message="Mensaje de prueba"))
+        db.add(CondolenceCounter(memorial_id=test_memorial.id, approved=5, pending=1))
+        db.commit()
+        
+        names, cursor = [], None
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            data = client.get(f"/api/v1/condolences/{test_memorial.slug}", params=params).json()
+            assert data["total"] == 5
+            names += [item["author_name"] for item in data["items"]]
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+        
+        assert names == ["Autor 1", "Autor 4", "Autor 3", "Autor 2", "Autor 0"]
+    
+    @pytest.mark.integration
+    def test_public_listing_invalid_cursor(self, client: TestClient, test_memorial: Memorial):
+        """Test un cursor mal formado se rechaza"""
+        response = client.get(f"/api/v1/condolences/{test_memorial.slug}?cursor=no-es-un-cursor")
+        
+        assert response.status_code == 400
+
+
+class TestLiveEndpoints:
+    """Tests para los eventos en vivo"""
+    
+    @pytest.mark.integration
+    def test_live_stream_starts_with_snapshot(self, client: TestClient, test_memorial: Memorial, monkeypatch):
+        """Test el flujo SSE abre con los conteos actuales"""
+        monkeypatch.setattr(settings, "LIVE_STREAM_TTL", 0)
+        client.post(
+            f"/api/v1/analytics/reactions/{test_memorial.slug}",
+            json={"reaction_type": "candle", "visitor_id": "visitor-1"}
+        )
+        
+        response = client.get(f"/api/v1/live/{test_memorial.slug}")
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert "event: snapshot" in response.text
+        assert '"candle":1' in response.text
+    
+    @pytest.mark.integration
+    def test_live_stream_not_found(self, client: TestClient):
+        """Test el flujo SSE de un memorial inexistente"""
+        response = client.get("/api/v1/live/no-existe")
+        
+        assert response.status_code == 404
 
 
 class TestHealthEndpoints:
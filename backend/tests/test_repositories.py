@@ -1,12 +1,20 @@
 """
 Tests para repositorios
 """
+import uuid
 import pytest
+from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 
-from app.repositories import UserRepository, MemorialRepository, CondolenceRepository, VisitRepository
-from app.schemas import UserCreate, MemorialCreate, CondolenceCreate
-from app.models import User, Memorial
+from sqlalchemy import event, inspect, text
+from app.db.migrations import run_migrations
+from app.repositories import (
+    UserRepository, MemorialRepository, CondolenceRepository, VisitRepository, ReactionRepository
+)
+from app.schemas import UserCreate, MemorialCreate, CondolenceCreate, CondolenceUpdate
+from app.models import (
+    User, Memorial, Visit, VisitDailyRollup, VisitLocationRollup, Reaction, CondolenceCounter
+)
 
 
 class TestUserRepository:
@@ -224,6 +232,29 @@ class TestCondolenceRepository:
         
         assert total >= 5
         assert len(condolences) == 2
+    
+    @pytest.mark.unit
+    def test_counters_follow_moderation(self, db: Session, test_memorial: Memorial):
+        """Test los contadores siguen altas, aprobaciones y borrados sin COUNT"""
+        ids = [
+            CondolenceRepository.create(
+                db, test_memorial.id, CondolenceCreate(author_name=f"Autor {i}", message="Mensaje de prueba")
+            ).id
+            for i in range(3)
+        ]
+        CondolenceRepository.update(db, ids[0], CondolenceUpdate(is_approved=True))
+        CondolenceRepository.update(db, ids[0], CondolenceUpdate(is_approved=True, is_featured=True))
+        CondolenceRepository.update(db, ids[1], CondolenceUpdate(is_approved=True))
+        CondolenceRepository.update(db, ids[1], CondolenceUpdate(is_approved=False))
+        CondolenceRepository.delete(db, ids[2])
+        
+        assert CondolenceRepository.get_counts(db, test_memorial.id) == (1, 1)
+        assert CondolenceRepository.get_by_id(db, ids[0]).is_featured is True
+        
+        db.query(CondolenceCounter).delete()
+        db.commit()
+        run_migrations(db.get_bind())
+        assert CondolenceRepository.get_counts(db, test_memorial.id) == (1, 1)
 
 
 class TestVisitRepository:
@@ -261,3 +292,274 @@ class TestVisitRepository:
         count = VisitRepository.get_today_count(db, test_memorial.id)
         
         assert count >= 2
+    
+    @pytest.mark.unit
+    def test_bulk_create_updates_rollups(self, db: Session, test_memorial: Memorial):
+        """Test la inserción por lotes suma las visitas al agregado diario"""
+        yesterday = datetime.utcnow() - timedelta(days=1)
+        ids = VisitRepository.bulk_create(db, [
+            {"memorial_id": test_memorial.id, "visited_at": yesterday},
+            {"memorial_id": test_memorial.id, "visited_at": yesterday},
+            {"memorial_id": test_memorial.id},
+        ])
+        
+        assert len(ids) == 3
+        assert VisitRepository.get_today_count(db, test_memorial.id) == 1
+        assert VisitRepository.get_week_count(db, test_memorial.id) == 3
+        daily = VisitRepository.get_daily_stats(db, test_memorial.id, days=7)
+        assert [d["count"] for d in daily] == [2, 1]
+    
+    @pytest.mark.unit
+    def test_compact_rollups_backfills_and_counts_unique(self, db: Session, test_memorial: Memorial):
+        """Test la compactación reconstruye agregados desde las visitas"""
+        for ip in ("1.1.1.1", "1.1.1.1", "2.2.2.2"):
+            db.add(Visit(memorial_id=test_memorial.id, ip_address=ip, visited_at=datetime.utcnow()))
+        db.commit()
+        assert VisitRepository.get_total_count(db, test_memorial.id) == 0
+        
+        assert VisitRepository.compact_rollups(db) == 1
+        
+        rollup = db.query(VisitDailyRollup).filter_by(memorial_id=test_memorial.id).one()
+        assert rollup.count == 3
+        assert rollup.unique_visitors == 2
+        assert VisitRepository.get_total_count(db, test_memorial.id) == 3
+    
+    @pytest.mark.unit
+    def test_compaction_keeps_rollups_created_during_the_pass(self, db: Session, test_memorial: Memorial):
+        """Test un agregado que crea una ingesta durante la compactación no se sobrescribe"""
+        now = datetime.utcnow()
+        db.add(Visit(memorial_id=test_memorial.id, visited_at=now))
+        db.commit()
+        
+        def concurrent_ingest(conn, cursor, statement, parameters, context, executemany):
+            # La ingesta confirma su agregado después del bloqueo de la ventana
+            if "count(visits.id)" in statement and not inserted:
+                inserted.append(True)
+                cursor.execute(
+                    "INSERT INTO visit_daily_rollups (memorial_id, day, count, unique_visitors) VALUES (?, ?, 2, 0)",
+                    (test_memorial.id, now.date().isoformat())
+                )
+        
+        inserted = []
+        event.listen(db.get_bind(), "before_cursor_execute", concurrent_ingest)
+        try:
+            VisitRepository.compact_rollups(db, since=now.date())
+        finally:
+            event.remove(db.get_bind(), "before_cursor_execute", concurrent_ingest)
+        
+        assert inserted
+        assert db.query(VisitDailyRollup).filter_by(memorial_id=test_memorial.id).one().count == 2
+    
+    @pytest.mark.unit
+    def test_rollups_backfilled_from_existing_visits(self, db: Session, test_memorial: Memorial):
+        """Test la migración rellena los agregados diarios de visitas previas"""
+        for ip in ("1.1.1.1", "1.1.1.1", "2.2.2.2"):
+            db.add(Visit(memorial_id=test_memorial.id, ip_address=ip, visited_at=datetime.utcnow()))
+        db.commit()
+        
+        run_migrations(db.get_bind())
+        run_migrations(db.get_bind())
+        
+        rollup = db.query(VisitDailyRollup).filter_by(memorial_id=test_memorial.id).one()
+        assert (rollup.count, rollup.unique_visitors) == (3, 2)
+        assert VisitRepository.get_total_count(db, test_memorial.id) == 3
+    
+    @pytest.mark.unit
+    def test_locations_backfilled_from_existing_visits(self, db: Session, test_memorial: Memorial):
+        """Test la migración rellena el agregado de ubicaciones aunque ya haya agregados diarios"""
+        now = datetime.utcnow()
+        db.add(VisitDailyRollup(memorial_id=test_memorial.id, day=now.date(), count=3))
+        for country, city in (("ES", "Madrid"), ("ES", "Madrid"), ("ES", None)):
+            db.add(Visit(memorial_id=test_memorial.id, country=country, city=city, visited_at=now))
+        db.commit()
+        
+        run_migrations(db.get_bind())
+        run_migrations(db.get_bind())
+        
+        rows = db.query(VisitLocationRollup).order_by(VisitLocationRollup.city).all()
+        assert [(r.city, r.count) for r in rows] == [("", 1), ("Madrid", 2)]
+    
+    @pytest.mark.unit
+    def test_unique_visitors_merge_across_days(self, db: Session, test_memorial: Memorial):
+        """Test los sketches diarios se actualizan al insertar y se unen por rango"""
+        yesterday = datetime.utcnow() - timedelta(days=1)
+        VisitRepository.bulk_create(db, [
+            {"memorial_id": test_memorial.id, "ip_address": "1.1.1.1", "user_agent": "A", "visited_at": yesterday},
+            {"memorial_id": test_memorial.id, "ip_address": "2.2.2.2", "user_agent": "A", "visited_at": yesterday},
+        ])
+        for ip in ("1.1.1.1", "1.1.1.1", "3.3.3.3"):
+            VisitRepository.create(db, test_memorial.id, ip_address=ip, user_agent="A")
+        
+        daily = VisitRepository.get_daily_stats(db, test_memorial.id, days=7)
+        
+        assert [(d["count"], d["unique_visitors"]) for d in daily] == [(2, 2), (3, 2)]
+        assert VisitRepository.get_unique_count(db, test_memorial.id) == 3
+        assert VisitRepository.get_unique_count(
+            db, test_memorial.id, start_date=datetime.utcnow().date()
+        ) == 2
+    
+    @pytest.mark.unit
+    def test_location_rollups_follow_enrichment(self, db: Session, test_memorial: Memorial):
+        """Test el agregado de ubicaciones se actualiza al geolocalizar y se filtra por fecha"""
+        last_week = datetime.utcnow() - timedelta(days=7)
+        ids = VisitRepository.bulk_create(db, [
+            {"memorial_id": test_memorial.id, "visited_at": last_week},
+            {"memorial_id": test_memorial.id},
+            {"memorial_id": test_memorial.id},
+        ])
+        VisitRepository.update_location(db, ids[0], "Chile", "Santiago")
+        VisitRepository.update_location(db, ids[1], "Chile", "Santiago")
+        VisitRepository.update_location(db, ids[2], "Perú", None)
+        
+        # Una visita ya geolocalizada no se cuenta dos veces
+        assert VisitRepository.update_location(db, ids[0], "Chile", "Santiago") is False
+        assert VisitRepository.get_location_stats(db, test_memorial.id) == [
+            {"country": "Chile", "city": "Santiago", "count": 2},
+            {"country": "Perú", "city": None, "count": 1},
+        ]
+        assert VisitRepository.get_country_stats(
+            db, [test_memorial.id], start_date=datetime.utcnow().date()
+        ) == [{"country": "Chile", "count": 1}, {"country": "Perú", "count": 1}]
+        
+        # La compactación reconstruye el mismo resultado desde las visitas
+        VisitRepository.compact_rollups(db)
+        assert VisitRepository.get_city_stats(db, [test_memorial.id])[0]["count"] == 2
+    
+    @pytest.mark.unit
+    def test_recent_compaction_only_rebuilds_recent_locations(self, db: Session, test_memorial: Memorial):
+        """Test la compactación reciente no recorre el histórico aunque no haya ubicaciones"""
+        old = datetime.utcnow() - timedelta(days=10)
+        db.add(Visit(memorial_id=test_memorial.id, country="Chile", visited_at=old))
+        db.add(Visit(memorial_id=test_memorial.id, country="Perú", visited_at=datetime.utcnow()))
+        db.commit()
+        
+        VisitRepository.compact_rollups(db, since=datetime.utcnow().date())
+        
+        assert [r.country for r in db.query(VisitLocationRollup)] == ["Perú"]
+
+
+class TestReactionRepository:
+    """Tests para ReactionRepository"""
+    
+    @pytest.mark.unit
+    def test_counts_use_half_open_day_range(self, db: Session, test_memorial: Memorial):
+        """Test el filtro por días incluye el último día completo y nada más"""
+        day = datetime(2024, 5, 10)
+        for visitor, created_at in (
+            ("a", day),
+            ("b", day + timedelta(hours=23, minutes=59)),
+            ("c", day + timedelta(days=1)),
+            ("d", day - timedelta(seconds=1)),
+        ):
+            db.add(Reaction(memorial_id=test_memorial.id, reaction_type="candle",
+                            visitor_key=ReactionRepository.visitor_key(visitor), created_at=created_at))
+        db.commit()
+        
+        counts = ReactionRepository.get_counts_by_memorial(
+            db, test_memorial.id, start_date=day.date(), end_date=day.date()
+        )
+        
+        assert counts["candle"] == 2
+    
+    @pytest.mark.unit
+    def test_toggle_keeps_counters_in_sync(self, db: Session, test_memorial: Memorial):
+        """Test el toggle actualiza la tabla de contadores en la misma transacción"""
+        ReactionRepository.create(db, test_memorial.id, "candle", "visitor-a")
+        
+        removed = ReactionRepository.toggle_reaction(db, test_memorial.id, "candle", "visitor-a")
+        added = ReactionRepository.toggle_reaction(db, test_memorial.id, "candle", "visitor-a")
+        other = ReactionRepository.toggle_reaction(db, test_memorial.id, "candle", "visitor-b")
+        
+        assert (removed["action"], removed["counts"]["candle"]) == ("removed", 0)
+        assert (added["action"], added["counts"]["candle"]) == ("added", 1)
+        assert other["counts"]["candle"] == 2
+        assert ReactionRepository.delete(db, test_memorial.id, "candle", "visitor-b") is True
+        assert ReactionRepository.delete(db, test_memorial.id, "candle", "visitor-b") is False
+        assert ReactionRepository.get_counts_by_memorial(db, test_memorial.id)["candle"] == 1
+        assert db.query(Reaction).count() == 1
+    
+    @pytest.mark.unit
+    def test_counters_backfilled_from_existing_reactions(self, db: Session, test_memorial: Memorial):
+        """Test la migración rellena los contadores de reacciones previas"""
+        for visitor in ("a", "b"):
+            db.add(Reaction(memorial_id=test_memorial.id, reaction_type="dove",
+                            visitor_key=ReactionRepository.visitor_key(visitor)))
+        db.commit()
+        
+        run_migrations(db.get_bind())
+        run_migrations(db.get_bind())
+        
+        assert ReactionRepository.get_counter_counts(db, [test_memorial.id])[test_memorial.id]["dove"] == 2
+    
+    @pytest.mark.unit
+    def test_visitor_mask_follows_reactions(self, db: Session, test_memorial: Memorial):
+        """Test la máscara del visitante refleja sus reacciones activas"""
+        visitor = "3f2b8c1e-9d4a-4e6b-8f0c-2a1d5e7b9c3f"
+        ReactionRepository.toggle_reaction(db, test_memorial.id, "dove", visitor)
+        ReactionRepository.create(db, test_memorial.id, "candle", visitor)
+        removed = ReactionRepository.toggle_reaction(db, test_memorial.id, "dove", visitor)
+        
+        assert removed["mask"] == ReactionRepository.REACTION_BITS["candle"]
+        assert ReactionRepository.get_user_reactions(db, test_memorial.id, visitor) == ["candle"]
+        assert ReactionRepository.get_user_reactions(db, test_memorial.id, "otro") == []
+        assert ReactionRepository.visitor_key(visitor) == uuid.UUID(visitor).bytes
+        assert len(ReactionRepository.visitor_key("no-es-uuid")) == 16
+    
+    @pytest.mark.unit
+    def test_visitor_masks_backfilled_from_existing_reactions(self, db: Session, test_memorial: Memorial):
+        """Test la migración rellena las máscaras de reacciones previas"""
+        for reaction_type in ("heart", "pray"):
+            db.add(Reaction(memorial_id=test_memorial.id, reaction_type=reaction_type,
+                            visitor_key=ReactionRepository.visitor_key("visitor-a")))
+        db.commit()
+        
+        run_migrations(db.get_bind())
+        
+        assert ReactionRepository.get_user_reactions(db, test_memorial.id, "visitor-a") == ["heart", "pray"]
+    
+    @pytest.mark.unit
+    def test_legacy_visitor_ids_migrate_to_binary_keys(self, db: Session, test_memorial: Memorial):
+        """Test la migración pasa visitor_id a visitor_key y estrecha la restricción única"""
+        visitor = "3f2b8c1e-9d4a-4e6b-8f0c-2a1d5e7b9c3f"
+        db.close()
+        with db.get_bind().begin() as connection:
+            connection.execute(text("DROP TABLE reactions"))
+            connection.execute(text(
+                "CREATE TABLE reactions (id INTEGER PRIMARY KEY, memorial_id INTEGER, "
+                "reaction_type VARCHAR, visitor_id VARCHAR, created_at DATETIME, "
+                "CONSTRAINT unique_reaction_per_visitor UNIQUE (memorial_id, reaction_type, visitor_id))"
+            ))
+            connection.execute(text("CREATE INDEX ix_reactions_memorial_id ON reactions (memorial_id)"))
+            connection.execute(text(
+                "INSERT INTO reactions (memorial_id, reaction_type, visitor_id) VALUES "
+                "(:m, 'candle', :lower), (:m, 'candle', :upper), (:m, 'dove', 'visitor-b')"
+            ), {"m": test_memorial.id, "lower": visitor, "upper": visitor.upper()})
+        
+        run_migrations(db.get_bind())
+        run_migrations(db.get_bind())
+        
+        inspector = inspect(db.get_bind())
+        assert "visitor_id" not in {c["name"] for c in inspector.get_columns("reactions")}
+        assert [c["column_names"] for c in inspector.get_unique_constraints("reactions")] == [
+            ["memorial_id", "reaction_type", "visitor_key"]
+        ]
+        assert "ix_reactions_memorial_created_type" in {i["name"] for i in inspector.get_indexes("reactions")}
+        assert db.query(Reaction).count() == 2
+        assert ReactionRepository.toggle_reaction(db, test_memorial.id, "candle", visitor)["action"] == "removed"
+        assert ReactionRepository.toggle_reaction(db, test_memorial.id, "dove", "visitor-b")["action"] == "removed"
+    
+    @pytest.mark.unit
+    def test_composite_indexes_are_created(self, db: Session):
+        """Test las migraciones crean los índices compuestos"""
+        inspector = inspect(db.get_bind())
+        
+        visit_indexes = {i["name"]: i["column_names"] for i in inspector.get_indexes("visits")}
+        reaction_indexes = {i["name"]: i["column_names"] for i in inspector.get_indexes("reactions")}
+        
+        assert visit_indexes["ix_visits_memorial_visited_at"] == ["memorial_id", "visited_at"]
+        assert reaction_indexes["ix_reactions_memorial_created_type"] == [
+            "memorial_id", "created_at", "reaction_type"
+        ]
+        assert "ix_reactions_visitor_id" not in reaction_indexes
+        condolence_indexes = {i["name"]: i["column_names"] for i in inspector.get_indexes("condolences")}
+        assert condolence_indexes["ix_condolences_approved_keyset"][0] == "memorial_id"
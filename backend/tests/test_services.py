@@ -3,14 +3,38 @@ Tests para servicios
 """
 import pytest
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+import time
+import asyncio
+import httpx
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, sessionmaker
 
 from app.services import AuthService, MemorialService
 from app.services.condolence import CondolenceService
 from app.services.timeline import TimelineService
 from app.services.analytics import AnalyticsService
-from app.schemas import MemorialCreate, MemorialUpdate, CondolenceCreate, TimelineEventCreate
-from app.models import User, Memorial
+from app.services.geo import GeoService, GeoLocation
+from app.services.geo_enrichment import GeoEnrichmentWorker
+from app.services.geo_local import LocalGeoDatabase
+from app.services.visit_ingest import VisitIngestBuffer
+from app.services.visit_counters import VisitCounters, MemoryCounterBackend
+from app.services.visit_filter import VisitFilter
+from app.services.reaction_counters import ReactionCounterCache
+from app.services.live import LiveService
+from app.services.qr import QRService
+from app.services.qr_templates import QRTemplates
+from app.services.qr_artifacts import QRArtifactService
+from app.core.qr_cache import QRRenderCache, qr_render_cache
+from app.core.executor import RenderExecutor
+from app.core.circuit_breaker import CircuitBreaker
+from app.core.background_loop import background_loop
+from app.core.hll import HyperLogLog
+from app.core.pubsub import PubSubBroker, live_broker
+from app.repositories import MemorialRepository, VisitRepository, ReactionRepository
+from app.schemas import MemorialCreate, MemorialUpdate, CondolenceCreate, CondolenceUpdate, TimelineEventCreate
+from app.models import User, Memorial, Visit, VisitorReaction
 
 
 class TestAuthService:
@@ -302,3 +326,709 @@ class TestAnalyticsService:
         
         assert analytics.total_memorials >= 1
         assert analytics.total_visits >= 3
+    
+    @pytest.mark.unit
+    def test_dashboard_query_count_is_constant(self, db: Session, test_user: User, multiple_memorials: list):
+        """Test el dashboard no hace consultas por cada memorial"""
+        for memorial in multiple_memorials:
+            AnalyticsService.register_visit(db, memorial.id)
+        AnalyticsService.toggle_reaction(db, multiple_memorials[0].id, "candle", "visitor-1")
+        user_id = test_user.id
+        
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.get_bind(), "before_cursor_execute", listener)
+        try:
+            analytics = AnalyticsService.get_dashboard_analytics(db, user_id)
+        finally:
+            event.remove(db.get_bind(), "before_cursor_execute", listener)
+        
+        assert len(statements) <= 5
+        assert analytics.total_visits == 3
+        assert analytics.total_reactions == 1
+        by_id = {a.memorial_id: a for a in analytics.memorials_analytics}
+        assert by_id[multiple_memorials[0].id].reactions_count["candle"] == 1
+        assert all(a.stats.today_visits == 1 and len(a.daily_visits) == 1 for a in by_id.values())
+    
+    @pytest.mark.unit
+    def test_dashboard_page_walks_all_memorials(self, db: Session, test_user: User, multiple_memorials: list):
+        """Test la paginación por cursor recorre todos los memoriales en orden"""
+        for visits, memorial in zip((2, 5, 2), multiple_memorials):
+            for _ in range(visits):
+                AnalyticsService.register_visit(db, memorial.id)
+        
+        seen, cursor = [], None
+        while True:
+            page = AnalyticsService.get_dashboard_page(db, test_user.id, limit=2, cursor=cursor)
+            seen.extend((a.stats.total_visits, a.memorial_id) for a in page.items)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        
+        assert len(seen) == 3
+        assert seen == sorted(seen, reverse=True)
+        assert seen[0] == (5, multiple_memorials[1].id)
+        assert not hasattr(page.items[0], "daily_visits")
+    
+    @pytest.mark.unit
+    def test_dashboard_page_rejects_foreign_cursor(self, db: Session, test_user: User, multiple_memorials: list):
+        """Test un cursor de otro orden o mal formado devuelve 400"""
+        page = AnalyticsService.get_dashboard_page(db, test_user.id, sort="activity", limit=1)
+        
+        for cursor in (page.next_cursor, "no-es-un-cursor"):
+            with pytest.raises(HTTPException) as exc_info:
+                AnalyticsService.get_dashboard_page(db, test_user.id, sort="visits", cursor=cursor)
+            assert exc_info.value.status_code == 400
+
+
+class TestHyperLogLog:
+    """Tests para el sketch HyperLogLog"""
+    
+    @pytest.mark.unit
+    def test_estimate_and_union(self):
+        """Test estimación dentro del error esperado y unión de sketches"""
+        first, second = HyperLogLog(), HyperLogLog()
+        first.update(f"visitor-{i}" for i in range(20000))
+        second.update(f"visitor-{i}" for i in range(10000, 30000))
+        second.update(f"visitor-{i}" for i in range(10000, 30000))
+        
+        union = HyperLogLog.union([first.to_bytes(), second.to_bytes()])
+        
+        assert abs(first.count() - 20000) / 20000 < 0.05
+        assert abs(union.count() - 30000) / 30000 < 0.05
+        assert HyperLogLog.from_bytes(first.to_bytes()).count() == first.count()
+        assert HyperLogLog.union([]) is None
+
+
+class TestVisitFilter:
+    """Tests para el filtro de visitas"""
+    
+    @pytest.mark.unit
+    @pytest.mark.parametrize("user_agent,is_bot", [
+        ("facebookexternalhit/1.1 (+http://www.facebook.com/externalhit_uatext.php)", True),
+        ("TelegramBot (like TwitterBot)", True),
+        ("Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)", True),
+        ("Mozilla/5.0+(compatible; UptimeRobot/2.0; http://www.uptimerobot.com/)", True),
+        ("Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)", True),
+        ("Pinterest/0.2 (+http://www.pinterest.com/bot.html)", True),
+        ("Mozilla/5.0 (compatible; Pinterestbot/1.0; +http://www.pinterest.com/bot.html)", True),
+        ("WhatsApp/2.23.20.0 A", True),
+        ("curl/8.4.0", True),
+        ("", True),
+        ("Mozilla/5.0 (Linux; Android 10; CUBOT X30) AppleWebKit/537.36 Chrome/90.0 Mobile Safari/537.36", False),
+        ("Mozilla/5.0 (Linux; Android 13; Pixel 7) AppleWebKit/537.36 Chrome/120.0 Mobile Safari/537.36 "
+         "Pinterest/Android", False),
+        ("Mozilla/5.0 (Linux; Android 12; MonitorPad M10) AppleWebKit/537.36 Chrome/118.0 Safari/537.36", False),
+        ("Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 Chrome/120.0 Mobile Safari/537.36", False),
+        ("Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0", False),
+    ])
+    def test_user_agent_classifier(self, user_agent: str, is_bot: bool):
+        """Test clasificación de user agents"""
+        assert VisitFilter().is_bot(user_agent) is is_bot
+    
+    @pytest.mark.unit
+    def test_dedup_window_expires(self):
+        """Test una visita repetida cuenta de nuevo al pasar la ventana"""
+        visit_filter = VisitFilter(dedup_window=0.05)
+        ua = "Mozilla/5.0 (X11; Linux x86_64)"
+        
+        assert visit_filter.check(1, "1.1.1.1", ua) is None
+        assert visit_filter.check(1, "1.1.1.1", ua) == VisitFilter.DUPLICATE
+        assert visit_filter.check(2, "1.1.1.1", ua) is None
+        time.sleep(0.06)
+        assert visit_filter.check(1, "1.1.1.1", ua) is None
+
+
+class TestVisitCounters:
+    """Tests para los contadores de visitas en memoria"""
+    
+    @pytest.mark.unit
+    def test_counters_load_once_then_track_new_visits(self, db: Session, test_memorial: Memorial):
+        """Test la primera lectura carga de la BD y las siguientes no consultan"""
+        counters = VisitCounters(MemoryCounterBackend())
+        VisitRepository.bulk_create(db, [
+            {"memorial_id": test_memorial.id, "visited_at": datetime.utcnow() - timedelta(days=3)},
+            {"memorial_id": test_memorial.id, "visited_at": datetime.utcnow() - timedelta(days=20)},
+        ])
+        
+        assert counters.get(db, test_memorial.id) == (0, 1, 2)
+        
+        counters.record([(test_memorial.id, datetime.utcnow())] * 2)
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.get_bind(), "before_cursor_execute", listener)
+        try:
+            assert counters.get(db, test_memorial.id) == (2, 3, 4)
+        finally:
+            event.remove(db.get_bind(), "before_cursor_execute", listener)
+        
+        assert statements == []
+        assert counters.stats() == {"hits": 1, "loads": 1, "errors": 0}
+    
+    @pytest.mark.unit
+    def test_counters_reload_after_ttl(self, db: Session, test_memorial: Memorial):
+        """Test al caducar se reconcilian con la base de datos"""
+        counters = VisitCounters(MemoryCounterBackend(ttl=0.01))
+        counters.get(db, test_memorial.id)
+        VisitRepository.create(db, test_memorial.id)
+        
+        time.sleep(0.02)
+        
+        assert counters.get(db, test_memorial.id) == (1, 1, 1)
+        assert counters.stats()["loads"] == 2
+
+
+class TestVisitIngestBuffer:
+    """Tests para la ingesta de visitas por lotes"""
+    
+    @pytest.fixture
+    def buffer(self, db: Session):
+        return VisitIngestBuffer(
+            max_batch=10, flush_interval_ms=10, max_pending=20,
+            session_factory=sessionmaker(bind=db.get_bind())
+        )
+    
+    @pytest.mark.unit
+    async def test_flush_inserts_batch(self, db: Session, test_memorial: Memorial, buffer):
+        """Test las visitas se insertan en un solo lote con sus IDs"""
+        for i in range(5):
+            buffer.submit(test_memorial.id, user_agent=f"agent-{i}")
+        
+        assert await buffer.flush() == 5
+        
+        visits = db.query(Visit).order_by(Visit.id).all()
+        assert [v.user_agent for v in visits] == [f"agent-{i}" for i in range(5)]
+        assert all(v.visited_at is not None for v in visits)
+        assert buffer.stats()["batches"] == 1
+    
+    @pytest.mark.unit
+    async def test_full_buffer_rejects(self, test_memorial: Memorial, buffer):
+        """Test el buffer acotado rechaza visitas cuando está lleno"""
+        for _ in range(20):
+            buffer.submit(test_memorial.id)
+        
+        with pytest.raises(HTTPException) as exc_info:
+            buffer.submit(test_memorial.id)
+        
+        assert exc_info.value.status_code == 503
+        assert buffer.stats()["rejected"] == 1
+    
+    @pytest.mark.unit
+    async def test_stop_flushes_pending(self, db: Session, test_memorial: Memorial, buffer):
+        """Test al detenerse se escriben todas las visitas pendientes"""
+        buffer.flush_interval = 60
+        buffer.start()
+        for _ in range(15):
+            buffer.submit(test_memorial.id)
+        
+        await buffer.stop()
+        
+        assert db.query(Visit).count() == 15
+        assert buffer.stats()["pending"] == 0
+    
+    @pytest.mark.unit
+    async def test_failed_flush_requeues_batch(self, db: Session, test_memorial: Memorial, buffer, monkeypatch):
+        """Test un lote fallido vuelve al principio de la cola y se reintenta"""
+        for i in range(3):
+            buffer.submit(test_memorial.id, user_agent=f"agent-{i}")
+        
+        def failing(db, rows):
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+        
+        with monkeypatch.context() as patch:
+            patch.setattr(VisitRepository, "bulk_create", staticmethod(failing))
+            assert await buffer.flush() == 0
+        
+        assert buffer.stats()["pending"] == 3
+        assert buffer.stats()["retried"] == 3
+        assert buffer._backoff() > 0
+        
+        assert await buffer.flush() == 3
+        visits = db.query(Visit).order_by(Visit.id).all()
+        assert [v.user_agent for v in visits] == [f"agent-{i}" for i in range(3)]
+        assert buffer._failures == 0
+    
+    @pytest.mark.unit
+    async def test_retries_are_bounded(self, test_memorial: Memorial, buffer, monkeypatch):
+        """Test una visita se descarta tras agotar sus reintentos"""
+        buffer.max_retries = 2
+        buffer.submit(test_memorial.id)
+        
+        def failing(db, rows):
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+        
+        monkeypatch.setattr(VisitRepository, "bulk_create", staticmethod(failing))
+        for _ in range(3):
+            await buffer.flush()
+        
+        assert buffer.stats()["pending"] == 0
+        assert buffer.stats()["failed"] == 1
+    
+    @pytest.mark.unit
+    async def test_integrity_error_inserts_rows_one_by_one(self, db: Session, test_memorial: Memorial, buffer):
+        """Test una fila inválida no descarta el resto del lote"""
+        buffer.submit(test_memorial.id, user_agent="before")
+        buffer.submit(None, user_agent="invalid")
+        buffer.submit(test_memorial.id, user_agent="after")
+        
+        assert await buffer.flush() == 2
+        
+        assert [v.user_agent for v in db.query(Visit).order_by(Visit.id)] == ["before", "after"]
+        assert buffer.stats()["discarded"] == 1
+        assert buffer.stats()["pending"] == 0
+
+
+class TestReactionCounterCache:
+    """Tests para la caché de contadores de reacciones"""
+    
+    @pytest.fixture
+    def cache(self, db: Session):
+        return ReactionCounterCache(
+            flush_interval_ms=60000, reconcile_interval=0,
+            session_factory=sessionmaker(bind=db.get_bind())
+        )
+    
+    @pytest.mark.unit
+    async def test_toggles_coalesce_into_one_write(self, db: Session, test_memorial: Memorial, cache):
+        """Test varios toques se leen de memoria y se escriben en un solo delta"""
+        cache.start()
+        try:
+            for visitor in ("a", "b", "c"):
+                result = cache.toggle(db, test_memorial.id, "candle", visitor)
+            
+            assert result["counts"]["candle"] == 3
+            assert ReactionRepository.get_counter_counts(db, [test_memorial.id])[test_memorial.id]["candle"] == 0
+            assert await cache.flush() == 1
+        finally:
+            await cache.stop()
+        
+        db.expire_all()
+        assert ReactionRepository.get_counter_counts(db, [test_memorial.id])[test_memorial.id]["candle"] == 3
+        assert cache.get(db, test_memorial.id)["candle"] == 3
+        assert cache.stats()["deltas_written"] == 1
+    
+    @pytest.mark.unit
+    def test_visitor_reactions_served_from_mask_cache(self, db: Session, test_memorial: Memorial, cache):
+        """Test las reacciones del visitante salen de la máscara en memoria tras el toggle"""
+        memorial_id = test_memorial.id
+        result = cache.toggle(db, memorial_id, "heart", "visitor-a")
+        
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.get_bind(), "before_cursor_execute", listener)
+        try:
+            assert cache.get_user_reactions(db, memorial_id, "visitor-a") == ["heart"]
+        finally:
+            event.remove(db.get_bind(), "before_cursor_execute", listener)
+        
+        assert result["user_reactions"] == ["heart"]
+        assert statements == []
+        assert cache.get_user_reactions(db, memorial_id, "visitor-b") == []
+        assert cache.stats()["mask_hits"] == 1
+    
+    @pytest.mark.unit
+    def test_reconcile_corrects_drift(self, db: Session, test_memorial: Memorial, cache):
+        """Test la reconciliación corrige contadores que no cuadran con las reacciones"""
+        cache.quiet_period = 0
+        cache.toggle(db, test_memorial.id, "flower", "a")
+        ReactionRepository.set_counters(db, {test_memorial.id: {"flower": 7, "dove": 2}})
+        assert cache.get(db, test_memorial.id)["flower"] == 7
+        
+        assert cache.reconcile() == 1
+        assert cache.reconcile() == 0
+        
+        counts = cache.get(db, test_memorial.id)
+        assert (counts["flower"], counts["dove"]) == (1, 0)
+    
+    @pytest.mark.unit
+    async def test_reconcile_skips_memorials_being_flushed(self, db: Session, test_memorial: Memorial, cache):
+        """Test la reconciliación no toca contadores con un vaciado sin confirmar"""
+        write = cache._write
+        reconciled = []
+        
+        def write_after_reconcile(deltas):
+            # El toggle ya salió de _pending pero el delta aún no está confirmado
+            reconciled.append(cache.reconcile())
+            write(deltas)
+        
+        cache.quiet_period = 0
+        cache.start()
+        try:
+            cache.toggle(db, test_memorial.id, "candle", "a")
+            cache._write = write_after_reconcile
+            assert await cache.flush() == 1
+        finally:
+            await cache.stop()
+        
+        assert reconciled == [0]
+        db.expire_all()
+        assert ReactionRepository.get_counter_counts(db, [test_memorial.id])[test_memorial.id]["candle"] == 1
+        assert cache.reconcile() == 0
+    
+    @pytest.mark.unit
+    def test_reconcile_skips_recent_toggles_from_other_workers(self, db: Session, test_memorial: Memorial, cache):
+        """Test la reconciliación espera a que otro worker escriba su delta pendiente"""
+        # Otro worker: la reacción ya está confirmada, el delta del contador aún no
+        result = ReactionRepository.toggle_reaction(db, test_memorial.id, "dove", "a", update_counter=False)
+        
+        assert cache.reconcile() == 0
+        
+        ReactionRepository.apply_counter_deltas(db, {(test_memorial.id, "dove"): result["delta"]})
+        db.commit()
+        assert ReactionRepository.get_counter_counts(db, [test_memorial.id])[test_memorial.id]["dove"] == 1
+        
+        # Pasado el margen sin toggles, la deriva sí se corrige
+        ReactionRepository.set_counters(db, {test_memorial.id: {"dove": 5}})
+        db.query(VisitorReaction).update({"updated_at": datetime.utcnow() - timedelta(hours=1)})
+        db.commit()
+        assert cache.reconcile() == 1
+        assert ReactionRepository.get_counter_counts(db, [test_memorial.id])[test_memorial.id]["dove"] == 1
+
+
+class TestLiveService:
+    """Tests para el broker pub/sub y los eventos en vivo"""
+    
+    @pytest.mark.unit
+    async def test_broker_fans_out_and_drops_oldest(self):
+        """Test un mensaje llega a todos los suscriptores y la cola lenta descarta lo antiguo"""
+        broker = PubSubBroker(max_queue=2)
+        first, second = broker.subscribe("memorial:1"), broker.subscribe("memorial:1")
+        for message in ("a", "b", "c"):
+            broker.publish("memorial:1", message)
+        broker.publish("memorial:2", "otro")
+        
+        assert [await first.get(0.1), await first.get(0.1)] == ["b", "c"]
+        assert await second.get(0.1) == "b"
+        assert broker.stats()["dropped"] == 2
+        
+        broker.unsubscribe(first)
+        broker.unsubscribe(second)
+        assert broker.stats()["channels"] == 0
+    
+    @pytest.mark.unit
+    async def test_publish_from_thread(self):
+        """Test publicar desde un hilo entrega en el loop de la aplicación"""
+        broker = PubSubBroker()
+        subscription = broker.subscribe("memorial:1")
+        
+        await asyncio.to_thread(broker.publish, "memorial:1", "desde hilo")
+        
+        assert await subscription.get(1) == "desde hilo"
+    
+    @pytest.mark.unit
+    async def test_stream_emits_snapshot_events_and_heartbeat(self):
+        """Test el flujo emite el estado inicial, los eventos y latidos hasta su ttl"""
+        stream = LiveService.stream("memorial:99", {"counts": {"candle": 1}}, heartbeat=0.05, ttl=0.3)
+        
+        first = await stream.__anext__()
+        assert "event: snapshot" in first and '"candle":1' in first
+        live_broker.publish("memorial:99", "event: reaction\ndata: {}\n\n")
+        assert await stream.__anext__() == "event: reaction\ndata: {}\n\n"
+        assert await stream.__anext__() == ": ping\n\n"
+        
+        remaining = [frame async for frame in stream]
+        assert all(frame == ": ping\n\n" for frame in remaining)
+        assert "memorial:99" not in live_broker._channels
+    
+    @pytest.mark.unit
+    async def test_reaction_and_approval_are_published(self, db: Session, test_memorial: Memorial):
+        """Test un toggle y una condolencia recién aprobada se publican en el canal del memorial"""
+        subscription = live_broker.subscribe(LiveService.channel(test_memorial.id))
+        try:
+            AnalyticsService.toggle_reaction(db, test_memorial.id, "dove", "visitor-1")
+            condolence = CondolenceService.create_condolence(
+                db, test_memorial.slug, CondolenceCreate(author_name="Ana", message="Descansa en paz")
+            )
+            CondolenceService.moderate_condolence(
+                db, condolence.id, test_memorial.owner_id, CondolenceUpdate(is_approved=True)
+            )
+            CondolenceService.moderate_condolence(
+                db, condolence.id, test_memorial.owner_id, CondolenceUpdate(is_featured=True)
+            )
+            
+            reaction = await subscription.get(0.1)
+            assert reaction.startswith("event: reaction\n")
+            assert '"delta":1' in reaction and '"dove":1' in reaction
+            approved = await subscription.get(0.1)
+            assert approved.startswith("event: condolence\n") and "Descansa en paz" in approved
+            assert await subscription.get(0.05) is None
+        finally:
+            live_broker.unsubscribe(subscription)
+
+
+class TestGeoService:
+    """Tests para GeoService y el enriquecimiento de visitas"""
+    
+    @pytest.fixture(autouse=True)
+    def fake_provider(self, monkeypatch):
+        """Proveedor simulado que cuenta las consultas"""
+        calls = []
+        
+        async def query(url):
+            calls.append(url)
+            await asyncio.sleep(0.01)
+            return GeoLocation(country="Chile", city="Santiago")
+        
+        monkeypatch.setattr(GeoService, "_query_provider", staticmethod(query))
+        GeoService._cache.clear()
+        GeoService._breakers.clear()
+        yield calls
+        GeoService._cache.clear()
+        GeoService._breakers.clear()
+    
+    @pytest.mark.unit
+    async def test_concurrent_lookups_are_deduplicated(self, fake_provider):
+        """Test consultas simultáneas de la misma IP usan una sola petición"""
+        results = await asyncio.gather(*[GeoService.get_location("8.8.8.8") for _ in range(5)])
+        
+        assert all(r.country == "Chile" for r in results)
+        assert len(fake_provider) == 1
+    
+    @pytest.mark.unit
+    async def test_location_is_cached(self, fake_provider):
+        """Test una IP ya resuelta no vuelve a consultar proveedores"""
+        await GeoService.get_location("8.8.8.8")
+        await GeoService.get_location("8.8.8.8")
+        
+        assert len(fake_provider) == 1
+    
+    @pytest.mark.unit
+    async def test_invalid_ip_is_not_queried(self, fake_provider):
+        """Test IPs privadas o inválidas no se geolocalizan"""
+        for ip in ("192.168.1.10", "testclient", "::1"):
+            assert (await GeoService.get_location(ip)).country is None
+        
+        assert fake_provider == []
+    
+    @pytest.mark.unit
+    async def test_failing_provider_opens_circuit(self, monkeypatch):
+        """Test tras fallos consecutivos el proveedor deja de consultarse"""
+        calls = []
+        
+        async def failing(url):
+            calls.append(url)
+            raise httpx.ConnectTimeout("timeout")
+        
+        monkeypatch.setattr(GeoService, "_query_provider", staticmethod(failing))
+        monkeypatch.setattr(GeoService, "PROVIDERS", ["https://geo.example/{ip}"])
+        
+        for i in range(5):
+            await GeoService.get_location(f"8.8.8.{i}")
+        
+        assert len(calls) == 3
+        stats = GeoService.stats()["providers"]["geo.example"]
+        assert stats["state"] == CircuitBreaker.OPEN
+        assert stats["errors"] == 3
+        assert stats["short_circuited"] == 2
+    
+    @pytest.mark.unit
+    async def test_rate_limited_provider_trips_immediately(self, monkeypatch):
+        """Test un 429 abre el circuito durante el Retry-After"""
+        async def rate_limited(url):
+            request = httpx.Request("GET", url)
+            response = httpx.Response(429, headers={"Retry-After": "120"}, request=request)
+            raise httpx.HTTPStatusError("429", request=request, response=response)
+        
+        monkeypatch.setattr(GeoService, "_query_provider", staticmethod(rate_limited))
+        monkeypatch.setattr(GeoService, "PROVIDERS", ["https://geo.example/{ip}"])
+        
+        await GeoService.get_location("8.8.8.8")
+        
+        breaker = GeoService._breakers["https://geo.example/{ip}"]
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+    
+    @pytest.mark.unit
+    def test_circuit_half_open_probe(self, monkeypatch):
+        """Test pasado el tiempo de espera se permite una sola prueba"""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+    
+    @pytest.mark.unit
+    def test_get_location_sync_reuses_background_loop(self, fake_provider):
+        """Test la versión síncrona reutiliza el mismo loop entre llamadas"""
+        first = GeoService.get_location_sync("8.8.8.8")
+        loop = background_loop._loop
+        second = GeoService.get_location_sync("8.8.4.4")
+        
+        assert first.country == second.country == "Chile"
+        assert background_loop._loop is loop
+        assert len(fake_provider) == 2
+    
+    @pytest.mark.unit
+    async def test_get_location_sync_inside_running_loop(self, fake_provider):
+        """Test la versión síncrona funciona aunque haya un loop corriendo"""
+        assert GeoService.get_location_sync("8.8.8.8").city == "Santiago"
+    
+    @pytest.fixture
+    def local_db(self, tmp_path):
+        """Base de datos local de rangos IP de prueba"""
+        csv_path = tmp_path / "ranges.csv"
+        csv_path.write_text(
+            "network,country_code,country,region,city,latitude,longitude\n"
+            "190.160.0.0/12,CL,Chile,Santiago Metropolitan,Santiago,-33.45,-70.66\n"
+            "2800:150::/32,AR,Argentina,Buenos Aires,Buenos Aires,,\n"
+            "8.8.8.0/24,US,United States,California,Mountain View,,\n",
+            encoding="utf-8"
+        )
+        db = LocalGeoDatabase(str(csv_path))
+        yield db
+        db.close()
+    
+    @pytest.mark.unit
+    def test_local_database_lookup(self, local_db):
+        """Test búsqueda por rangos IPv4 e IPv6 en la base local"""
+        chile = local_db.lookup("190.170.1.2")
+        assert chile["country"] == "Chile"
+        assert chile["latitude"] == -33.45
+        assert local_db.lookup("2800:150::1")["city"] == "Buenos Aires"
+        assert local_db.lookup("8.8.9.1") is None
+        assert local_db.lookup("1.1.1.1") is None
+        assert local_db.count == 3
+    
+    @pytest.mark.unit
+    async def test_local_provider_is_queried_first(self, local_db, fake_provider, monkeypatch):
+        """Test la base local responde sin consultar las APIs externas"""
+        monkeypatch.setattr("app.services.geo.local_geo_db", local_db)
+        
+        location = await GeoService.get_location("190.170.1.2")
+        
+        assert location.city == "Santiago"
+        assert fake_provider == []
+    
+    @pytest.mark.unit
+    async def test_worker_enriches_visit(self, db: Session, test_memorial: Memorial):
+        """Test el worker completa país y ciudad tras registrar la visita"""
+        worker = GeoEnrichmentWorker(workers=1, session_factory=sessionmaker(bind=db.get_bind()))
+        worker.start()
+        try:
+            visit = AnalyticsService.register_visit(db, test_memorial.id, "8.8.8.8")
+            assert worker.enqueue(visit.id, "8.8.8.8")
+            await worker.drain()
+        finally:
+            await worker.stop()
+        
+        db.refresh(visit)
+        assert visit.country == "Chile"
+        assert visit.city == "Santiago"
+        assert worker.stats()["resolved"] == 1
+
+
+class TestQRService:
+    """Tests para QRService y su caché de renders"""
+    
+    @pytest.fixture(autouse=True)
+    def isolated_cache(self, tmp_path, monkeypatch):
+        """Usar un directorio temporal para el nivel en disco"""
+        monkeypatch.setattr(qr_render_cache, "directory", str(tmp_path))
+        qr_render_cache.clear()
+        yield
+        qr_render_cache.clear()
+    
+    @pytest.mark.unit
+    async def test_generate_qr_sets_strong_etag(self):
+        """Test el render incluye un ETag fuerte y estable"""
+        first = await QRService.generate_qr("juan-perez-abc123")
+        second = await QRService.generate_qr("juan-perez-abc123")
+        
+        assert first.status_code == 200
+        assert first.headers["etag"].startswith('"')
+        assert first.headers["etag"] == second.headers["etag"]
+        assert first.body == second.body
+    
+    @pytest.mark.unit
+    async def test_generate_qr_not_modified(self):
+        """Test devuelve 304 si el ETag coincide"""
+        etag = (await QRService.generate_qr("juan-perez-abc123")).headers["etag"]
+        
+        response = await QRService.generate_qr("juan-perez-abc123", if_none_match=etag)
+        
+        assert response.status_code == 304
+        assert response.body == b""
+    
+    @pytest.mark.unit
+    async def test_disk_tier_survives_memory_eviction(self, tmp_path):
+        """Test el nivel en disco sirve renders expulsados de memoria"""
+        await QRService.generate_qr("juan-perez-abc123")
+        qr_render_cache.clear()
+        
+        key = QRRenderCache.make_key(
+            "juan-perez-abc123", False, None, QRService.FRAME_STYLE,
+            QRService._target_url("juan-perez-abc123")
+        )
+        
+        assert (tmp_path / "juan-perez-abc123" / f"{key}.png").exists()
+        assert qr_render_cache.get("juan-perez-abc123", key) is not None
+    
+    @pytest.mark.unit
+    async def test_update_image_invalidates_cache(self, db: Session, test_memorial: Memorial, tmp_path):
+        """Test cambiar la foto invalida los renders del memorial"""
+        await QRService.generate_qr(test_memorial.slug)
+        assert (tmp_path / test_memorial.slug).exists()
+        
+        MemorialRepository.update_image(db, test_memorial, "nueva_foto.jpg")
+        
+        assert not (tmp_path / test_memorial.slug).exists()
+    
+    
+    @pytest.mark.unit
+    async def test_generate_qr_svg(self):
+        """Test el modo SVG emite un documento vectorial con marco"""
+        response = await QRService.generate_qr("juan-perez-abc123", fmt="svg")
+        
+        assert response.status_code == 200
+        assert response.media_type == "image/svg+xml"
+        assert response.body.startswith(b"<svg")
+        assert b"Memorial QR" in response.body
+        assert b"<image" not in response.body
+    
+    @pytest.mark.unit
+    def test_svg_modules_path_merges_runs(self):
+        """Test los módulos contiguos se agrupan en un rectángulo"""
+        path = QRService._svg_modules_path([[True, True, False, True]])
+        
+        assert path == "M0 0h2v1h-2zM3 0h1v1h-1z"
+    
+    @pytest.mark.unit
+    def test_frame_template_is_reused(self):
+        """Test el marco se construye una vez y los renders no lo modifican"""
+        QRService.render_qr("juan-perez-abc123")
+        template = QRTemplates.frame(450, 450, QRService.FRAME_STYLE)
+        QRService.render_qr("juan-perez-abc123")
+        
+        assert QRTemplates.frame(450, 450, QRService.FRAME_STYLE) is template
+        assert template.getpixel((QRTemplates.PADDING, QRTemplates.PADDING)) == (255, 255, 255, 255)
+    
+    @pytest.mark.unit
+    async def test_render_executor_rejects_when_full(self):
+        """Test el ejecutor aplica backpressure cuando la cola está llena"""
+        executor = RenderExecutor(max_workers=1, max_pending=1)
+        executor._in_flight = 1
+        
+        with pytest.raises(HTTPException) as exc_info:
+            await executor.run(QRService.render_qr_simple, "juan-perez-abc123")
+        
+        assert exc_info.value.status_code == 503
+        assert executor.stats()["rejected"] == 1
+    
+    @pytest.mark.unit
+    async def test_pregenerate_publishes_stable_names(self, tmp_path, monkeypatch):
+        """Test la pre-generación publica las variantes con nombre estable"""
+        monkeypatch.setattr(QRArtifactService, "formats", staticmethod(lambda: ["png", "svg"]))
+        
+        published = await QRArtifactService.pregenerate("juan-perez-abc123")
+        
+        assert sorted(published) == ["framed.png", "framed.svg", "simple.png", "simple.svg"]
+        framed = tmp_path / "juan-perez-abc123" / "framed.png"
+        cached = await QRService.get_qr("juan-perez-abc123")
+        assert framed.read_bytes() == cached.content
+    
+    @pytest.mark.unit
+    async def test_pregenerate_ignores_unsafe_slug(self):
+        """Test la pre-generación no escribe fuera del directorio de caché"""
+        assert await QRArtifactService.pregenerate("../etc") == []